@@ -16,7 +16,14 @@ limitations under the License.
 """
 
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 
+from . import roster
 from .models import Guardian
 from .models import Student
 from .models import Faculty
@@ -25,12 +32,85 @@ from .models import Section
 from .models import FieldTrip
 from .models import PermissionSlip
 from .models import PermissionSlipLink
+from .models import OutboundMessage
+from .models import Profile
 
-admin.site.register(Guardian)
-admin.site.register(Student)
-admin.site.register(Faculty)
+
+class PersonAdmin(admin.ModelAdmin):
+    """Searches people through the roster search index instead of running
+    `icontains` over every name column."""
+    list_display = ('__str__', 'first_name', 'last_name', 'person_id', 'hidden')
+    # Shows the search box. The search itself is done by get_search_results.
+    search_fields = ('last_name',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Every match is listed. The change list is ordered before it is
+        # searched, so matches come best first unless a column was sorted.
+        results = roster.filter_queryset(queryset, search_term, limit=None)
+        if ORDER_VAR in request.GET:
+            results = results.order_by(*queryset.query.order_by)
+        return results, False
+
+
+class ProfileAdmin(admin.ModelAdmin):
+    """Lists the saved profiles, read only, with a link to download each."""
+    list_display = ('name', 'kind', 'created', 'duration_ms', 'sql_count',
+                    'download_link')
+    list_filter = ('kind',)
+    search_fields = ('name', 'description')
+    fields = ('kind', 'name', 'description', 'created', 'duration_ms',
+              'sql_count', 'sql_ms', 'download_link', 'report')
+    readonly_fields = fields
+
+    def duration_ms(self, profile):
+        return round(profile.duration * 1000)
+    duration_ms.short_description = 'Duration (ms)'
+
+    def sql_ms(self, profile):
+        return round(profile.sql_time * 1000)
+    sql_ms.short_description = 'SQL time (ms)'
+
+    def download_link(self, profile):
+        return format_html('<a href="{0}">Download .prof</a>', reverse(
+            'admin:paperlesspermission_profile_download', args=[profile.id]))
+    download_link.short_description = 'Download'
+
+    def get_queryset(self, request):
+        # The stats can be megabytes and are only read by downloads.
+        return super(ProfileAdmin, self).get_queryset(request).defer('stats')
+
+    def get_urls(self):
+        return [
+            path('<int:profile_id>/download/',
+                 self.admin_site.admin_view(self.download),
+                 name='paperlesspermission_profile_download'),
+        ] + super(ProfileAdmin, self).get_urls()
+
+    def download(self, request, profile_id):
+        """Sends the cProfile stats of a profile, for pstats or snakeviz."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        profile = get_object_or_404(Profile, id=profile_id)
+        response = HttpResponse(bytes(profile.stats),
+                                content_type='application/octet-stream')
+        response['Content-Disposition'] = (
+            'attachment; filename="profile-{0}.prof"'.format(profile.id))
+        return response
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(Guardian, PersonAdmin)
+admin.site.register(Student, PersonAdmin)
+admin.site.register(Faculty, PersonAdmin)
 admin.site.register(Course)
 admin.site.register(Section)
 admin.site.register(FieldTrip)
 admin.site.register(PermissionSlip)
 admin.site.register(PermissionSlipLink)
+admin.site.register(OutboundMessage)
+admin.site.register(Profile, ProfileAdmin)
@@ -0,0 +1,28 @@
+"""Django application configuration of Paperless Permission.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from django.apps import AppConfig
+
+
+class PaperlessPermissionConfig(AppConfig):
+    """Connects the signal receivers of the app in every process, web and
+    Celery worker alike."""
+    name = 'paperlesspermission'
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel,unused-import
+        from . import metrics, profiling
@@ -0,0 +1,166 @@
+"""Decides which field trips the logged in user may moderate.
+
+Admin staff may moderate every trip. Any other user may moderate the trips
+that list a `Faculty` member with the user's email address as a coordinator.
+
+`for_request` returns one `TripAuthorization` per request, so the trip views
+look the moderated trip ids up at most once per request instead of joining
+the faculty table on every check. The ids are also kept in the session and
+reused by later requests until they are invalidated.
+
+Cached ids are invalidated with a generation token in the default cache,
+like the slip page cache (see `slipcache`). The token is replaced by
+`invalidate` whenever the faculty of any trip change, and at the end of every
+`DJOImport.import_all` run, since the import can change faculty email
+addresses. A session entry is only used while its token matches.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from paperlesspermission.models import Faculty, FieldTrip
+
+GENERATION_KEY = 'trip-authz:generation'
+SESSION_KEY = 'trip_authorization'
+
+# Attribute of the request the authorization is memoized on.
+REQUEST_ATTRIBUTE = '_trip_authorization'
+
+
+def _generation():
+    # add() keeps a token another process has set in the meantime.
+    cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+    return cache.get(GENERATION_KEY)
+
+
+def invalidate():
+    """Invalidates the moderated trip ids cached in every session."""
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+    # A request running before this transaction commits could cache the old
+    # ids with the new token, so replace it again afterwards.
+    transaction.on_commit(
+        lambda: cache.set(GENERATION_KEY, uuid.uuid4().hex, None))
+
+
+@receiver(m2m_changed, sender=FieldTrip.faculty.through)
+def _trip_faculty_changed(sender, action, **kwargs):
+    # pylint: disable=unused-argument
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate()
+
+
+class TripAuthorization:
+    """The trips a user may moderate.
+
+    Parameters:
+        user (User): The logged in user
+        session (SessionBase): Session the moderated trip ids are cached in,
+            or None to not cache them
+    """
+    def __init__(self, user, session=None):
+        self.user = user
+        self.session = session
+        self._faculty = None
+        self._faculty_loaded = False
+        self._trip_ids = None
+
+    @property
+    def is_staff(self):
+        """Whether the user may moderate every trip."""
+        return self.user.is_staff
+
+    @property
+    def faculty(self):
+        """The `Faculty` member with the user's email address, or None."""
+        if not self._faculty_loaded:
+            email = self.user.email
+            self._faculty = (Faculty.objects.filter(email=email).first()
+                             if email else None)
+            self._faculty_loaded = True
+        return self._faculty
+
+    @property
+    def trip_ids(self):
+        """frozenset of the ids of the trips the user is a coordinator for.
+
+        Staff are not listed as coordinators, so this does not include every
+        trip for them. Use `can_moderate` to check access.
+        """
+        if self._trip_ids is None:
+            self._trip_ids = self._cached_trip_ids()
+        if self._trip_ids is None:
+            self._trip_ids = self._load_trip_ids()
+        return self._trip_ids
+
+    def _cached_trip_ids(self):
+        if self.session is None:
+            return None
+        entry = self.session.get(SESSION_KEY)
+        if (entry is None
+                or entry['email'] != self.user.email
+                or entry['generation'] != _generation()):
+            return None
+        return frozenset(entry['trip_ids'])
+
+    def _load_trip_ids(self):
+        # Read the token before the ids, so that ids changed in between are
+        # stored with a token that is already out of date.
+        generation = _generation()
+        email = self.user.email
+        trip_ids = frozenset()
+        if email:
+            trip_ids = frozenset(FieldTrip.faculty.through.objects.filter(
+                faculty__email=email,
+            ).values_list('fieldtrip_id', flat=True))
+        if self.session is not None:
+            self.session[SESSION_KEY] = {
+                'email': email,
+                'generation': generation,
+                'trip_ids': sorted(trip_ids),
+            }
+        return trip_ids
+
+    def can_moderate(self, trip_id):
+        """Returns whether the user may view and moderate a trip."""
+        return self.is_staff or trip_id in self.trip_ids
+
+    def moderated_trips(self, queryset=None):
+        """Narrows a queryset of trips down to those the user may moderate.
+
+        Parameters:
+            queryset (QuerySet): Trips to narrow down. Defaults to all trips.
+        """
+        if queryset is None:
+            queryset = FieldTrip.objects.all()
+        if self.is_staff:
+            return queryset
+        return queryset.filter(id__in=self.trip_ids)
+
+
+def for_request(request):
+    """Returns the `TripAuthorization` of the request's user, made once per
+    request."""
+    authorization = getattr(request, REQUEST_ATTRIBUTE, None)
+    if authorization is None or authorization.user != request.user:
+        authorization = TripAuthorization(request.user,
+                                          getattr(request, 'session', None))
+        setattr(request, REQUEST_ATTRIBUTE, authorization)
+    return authorization
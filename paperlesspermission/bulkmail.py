@@ -0,0 +1,174 @@
+"""Sends large batches of email over several concurrent SMTP sessions.
+
+Releasing a large trip produces thousands of messages. Sending them one after
+another over a single session leaves the worker waiting on the relay for
+every round trip. `send_concurrently` spreads a batch over several sessions
+with asyncio, while holding the total send rate under a configurable cap so
+the relay does not start refusing mail.
+
+smtplib is blocking, so each session is driven from its own thread. asyncio
+coordinates the sessions, hands out work and enforces the rate limit.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class NotSent(Exception):
+    """The backend returned without error but did not send the message, for
+    instance because it fails silently or every recipient was refused."""
+
+
+class RateLimiter():
+    """Spaces out callers so no more than `rate` pass per second.
+
+    A rate of None or 0 disables the limit.
+    """
+    def __init__(self, rate):
+        self.interval = (1.0 / rate) if rate else 0.0
+        self._next = 0.0
+        self._lock = None
+
+    async def acquire(self):
+        """Waits until the caller is allowed to proceed."""
+        if not self.interval:
+            return
+        if self._lock is None:
+            # Created lazily so it belongs to the running event loop.
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class SendReport():
+    """Outcome of a bulk send.
+
+    Attributes:
+        results (list): One entry per message, in order. True if the message
+            was sent, otherwise the exception that prevented it (`NotSent`
+            if the backend reported nothing sent).
+        elapsed (float): Seconds from the first send until the last finished
+        sessions (int): Number of concurrent SMTP sessions used
+    """
+    def __init__(self, results, elapsed, sessions):
+        self.results = results
+        self.elapsed = elapsed
+        self.sessions = sessions
+
+    @property
+    def sent(self):
+        """Number of messages delivered."""
+        return sum(1 for result in self.results if result is True)
+
+    @property
+    def failed(self):
+        """Number of messages that could not be delivered."""
+        return len(self.results) - self.sent
+
+    @property
+    def throughput(self):
+        """Messages delivered per second."""
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return '{0} sent, {1} failed in {2:.2f}s over {3} sessions ({4:.1f} msg/s)'.format(
+            self.sent, self.failed, self.elapsed, self.sessions, self.throughput)
+
+
+def send_concurrently(messages, connection_factory, sessions=4, rate=None):
+    """Sends email messages over several concurrent sessions.
+
+    Parameters:
+        messages (list): `EmailMessage` (or `SMSMessage`) objects to send
+        connection_factory (callable): Returns a new email (or SMS) backend
+            instance.
+            Each session gets its own instance.
+        sessions (int): Maximum number of SMTP sessions to open at once
+        rate (float): Maximum messages per second across all sessions. None
+            or 0 for no limit.
+
+    Returns:
+        SendReport: Per-message results and throughput
+    """
+    messages = list(messages)
+    sessions = max(1, min(sessions, len(messages)))
+    if not messages:
+        return SendReport([], 0.0, 0)
+    report = asyncio.run(
+        _send_all(messages, connection_factory, sessions, RateLimiter(rate)))
+    LOGGER.info('Bulk send complete: %s', report)
+    return report
+
+
+async def _send_all(messages, connection_factory, sessions, limiter):
+    queue = asyncio.Queue()
+    for index, message in enumerate(messages):
+        queue.put_nowait((index, message))
+    results = [None] * len(messages)
+    open_errors = []
+
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        await asyncio.gather(*[
+            _session_worker(loop, executor, queue, results, open_errors,
+                            connection_factory, limiter)
+            for _ in range(sessions)
+        ])
+
+    # Anything still unsent means no session could be opened to send it.
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = open_errors[-1] if open_errors else RuntimeError(
+                'No SMTP session available')
+    return SendReport(results, time.monotonic() - start, sessions)
+
+
+async def _session_worker(loop, executor, queue, results, open_errors,
+                          connection_factory, limiter):
+    """Drains the queue over one SMTP session."""
+    connection = connection_factory()
+    try:
+        await loop.run_in_executor(executor, connection.open)
+    except Exception as err:  # pylint: disable=broad-except
+        # Leave the work to the other sessions, which may still connect.
+        LOGGER.warning('Could not open SMTP session: %r', err)
+        open_errors.append(err)
+        return
+
+    try:
+        while not queue.empty():
+            index, message = queue.get_nowait()
+            await limiter.acquire()
+            try:
+                sent = await loop.run_in_executor(
+                    executor, connection.send_messages, [message])
+            except Exception as err:  # pylint: disable=broad-except
+                results[index] = err
+            else:
+                # Backends return the number of messages sent.
+                results[index] = True if sent else NotSent()
+    finally:
+        await loop.run_in_executor(executor, connection.close)
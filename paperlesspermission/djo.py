@@ -29,6 +29,7 @@ import logging
 
 import paramiko
 
+from paperlesspermission import authz, metrics, roster
 from paperlesspermission.models import Guardian, Student, Faculty, Course, Section
 from paperlesspermission.utils import bytes_io_to_tsv_dict_reader
 
@@ -136,7 +137,8 @@ class DJOImport():
         """
 
         LOGGER.info("Importing Faculty.")
-        faculty_reader = bytes_io_to_tsv_dict_reader(self.fs_faculty)
+        faculty_reader = metrics.counted_rows(
+            'faculty', bytes_io_to_tsv_dict_reader(self.fs_faculty))
 
         # Keep track of all written Faculty objects so we can later hide old
         # records that have been removed from the upstream data source.
@@ -205,7 +207,8 @@ class DJOImport():
         """
 
         LOGGER.info("Importing classes.")
-        classes_reader = bytes_io_to_tsv_dict_reader(self.fs_classes)
+        classes_reader = metrics.counted_rows(
+            'classes', bytes_io_to_tsv_dict_reader(self.fs_classes))
 
         # Keep track of all written Courses and Section objects.
         written_courses = []
@@ -286,7 +289,8 @@ class DJOImport():
 
         LOGGER.info("Importing students.")
 
-        student_reader = bytes_io_to_tsv_dict_reader(self.fs_student)
+        student_reader = metrics.counted_rows(
+            'student', bytes_io_to_tsv_dict_reader(self.fs_student))
 
         # Keep track of all written Students objects
         written_students = []
@@ -359,7 +363,8 @@ class DJOImport():
 
         LOGGER.info("Importing guardians.")
 
-        guardian_reader = bytes_io_to_tsv_dict_reader(self.fs_parent)
+        guardian_reader = metrics.counted_rows(
+            'parent', bytes_io_to_tsv_dict_reader(self.fs_parent))
 
         written_guardians = []
 
@@ -435,7 +440,8 @@ class DJOImport():
         """
 
         LOGGER.info("Importing enrollment data.")
-        enrollment_reader = bytes_io_to_tsv_dict_reader(self.fs_enrollment)
+        enrollment_reader = metrics.counted_rows(
+            'enrollment', bytes_io_to_tsv_dict_reader(self.fs_enrollment))
 
         LOGGER.info("Clearing existing enrollment.")
         # Start by clearing all existing enrollment
@@ -467,6 +473,9 @@ class DJOImport():
         self.import_students()
         self.import_guardians()
         self.import_enrollment()
+        roster.rebuild()
+        # Faculty email addresses may have changed.
+        authz.invalidate()
         LOGGER.info("DJO Importer completed.")
 
     def close(self):
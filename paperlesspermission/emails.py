@@ -0,0 +1,164 @@
+"""Renders permission slip notification emails and SMS from templates.
+
+Each email notification has a plain text and an HTML template under
+`templates/paperlesspermission/email/`, and each SMS notification a plain text
+template under `templates/paperlesspermission/sms/`. Templates are compiled
+the first time they are used and then kept for the life of the worker
+process.
+
+A release renders thousands of messages for the same trip, so
+`NotificationRenderer` builds the trip's part of the context once and only
+pushes the per-recipient variables for each message.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.template import Context, engines
+
+TEMPLATE_DIR = 'paperlesspermission/email/'
+SMS_TEMPLATE_DIR = 'paperlesspermission/sms/'
+
+# SMS messages have no subject or HTML body, and their recipient is a phone
+# number.
+RenderedMessage = namedtuple('RenderedMessage',
+                             ['subject', 'body', 'html_body', 'recipient'])
+
+
+@lru_cache(maxsize=None)
+def get_email_template(name, directory=TEMPLATE_DIR):
+    """Returns the compiled template `name` from the email (or SMS) template
+    directory.
+
+    Compiled templates are cached for the life of the process.
+    """
+    return engines['django'].get_template(directory + name).template
+
+
+class NotificationRenderer():
+    """Renders notification emails (or SMS) for one field trip.
+
+    Attributes:
+        trip (FieldTrip): The trip being notified about
+        reminder (bool): Render reminders about slips that are still
+            incomplete instead of first notifications
+        sms (bool): Render text messages to people who asked for them,
+            instead of emails
+        context (Context): Variables shared by every message for the trip
+    """
+    def __init__(self, trip, reminder=False, sms=False):
+        self.trip = trip
+        self.reminder = reminder
+        self.sms = sms
+        self.subject_prefix = 'Reminder: ' if reminder else 'New '
+        self.base_url = getattr(settings, 'BASE_URL')
+        self.context = Context({
+            'reminder': reminder,
+            'trip_name': trip.name,
+            'location': trip.location,
+            'start_date': str(trip.start_date),
+            'due_date': str(trip.due_date),
+        })
+
+    def slip_url(self, slip_link):
+        """Returns the public URL of a permission slip link."""
+        return '{0}/slip/{1}'.format(self.base_url, slip_link.link_id)
+
+    def recipient(self, person):
+        """Returns where to send `person` their message, or None if they
+        should not get one on this channel."""
+        if not self.sms:
+            return person.email
+        if person.notify_cell and person.cell_number:
+            return person.cell_number.as_e164
+        return None
+
+    def render(self, name, **recipient_context):
+        """Renders the text and HTML versions of template `name`.
+
+        SMS only have a text version.
+
+        Returns:
+            tuple: (text body, HTML body)
+        """
+        with self.context.push(**recipient_context):
+            self.context.autoescape = False
+            if self.sms:
+                body = get_email_template(name + '.txt', SMS_TEMPLATE_DIR).render(
+                    self.context)
+                return (body.rstrip('\n'), '')
+            body = get_email_template(name + '.txt').render(self.context)
+            self.context.autoescape = True
+            html_body = get_email_template(name + '.html').render(self.context)
+        return (body.rstrip('\n'), html_body)
+
+    def link_email(self, slip_link, student):
+        """Renders the notification for a single permission slip link.
+
+        Parameters:
+            slip_link (PermissionSlipLink): The link being sent
+            student (Student): The student the permission slip is for
+
+        Returns:
+            RenderedMessage: The message, or None if the person does not
+                receive messages on this channel
+        """
+        if slip_link.guardian:
+            person = slip_link.guardian
+            subject = '{0}Permission Slip for {1}'.format(
+                self.subject_prefix, student.get_full_name())
+            name = 'guardian_notification'
+        elif slip_link.student:
+            person = slip_link.student
+            subject = '{0}Permission Slip for {1}'.format(
+                self.subject_prefix, self.trip.name)
+            name = 'student_notification'
+        else:
+            raise ValueError("No student or guardian set")
+
+        recipient = self.recipient(person)
+        if recipient is None:
+            return None
+        body, html_body = self.render(
+            name,
+            recipient_name=person.get_full_name(),
+            student_name=student.get_full_name(),
+            slip_url=self.slip_url(slip_link),
+        )
+        return RenderedMessage(subject, body, html_body, recipient)
+
+    def digest_email(self, guardian, slip_links):
+        """Renders one notification listing several of a guardian's links."""
+        recipient = self.recipient(guardian)
+        if recipient is None:
+            return None
+        slips = [
+            {
+                'student_name': slip_link.permission_slip.student.get_full_name(),
+                'url': self.slip_url(slip_link),
+            }
+            for slip_link in slip_links
+        ]
+        body, html_body = self.render(
+            'guardian_digest',
+            recipient_name=guardian.get_full_name(),
+            slips=slips,
+        )
+        subject = '{0}Permission Slips for {1}'.format(
+            self.subject_prefix, self.trip.name)
+        return RenderedMessage(subject, body, html_body, recipient)
@@ -0,0 +1,107 @@
+"""Builds the rows of the permission slip status export.
+
+`slip_status_rows` walks a trip's slips with `QuerySet.iterator`, so only one
+chunk of slips is in memory at a time no matter how large the trip is. The
+guardians of each chunk's students are loaded with one extra query per chunk.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from django.conf import settings
+from django.utils import timezone
+
+from paperlesspermission.models import Guardian, PermissionSlip
+
+DEFAULT_CHUNK_SIZE = 2000
+
+HEADER = [
+    'Student Name', 'Student ID', 'Grade Level', 'Guardians', 'Complete',
+    'Student Signature', 'Student Signature Date', 'Signing Guardian',
+    'Guardian Signature', 'Guardian Signature Date', 'Due Date',
+]
+
+# Spreadsheets treat cells starting with these as formulas. Signatures are
+# typed in by the public, so they must never be evaluated.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def slip_status_rows(trip, incomplete_only=False, chunk_size=None):
+    """Yields the header and then one row per permission slip of `trip`.
+
+    Parameters:
+        trip (FieldTrip): Trip to export
+        incomplete_only (bool): Only include slips still missing the student
+            or the guardian signature
+        chunk_size (int): Slips fetched from the database at a time. Defaults
+            to the `EXPORT_CHUNK_SIZE` setting.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+    slips = PermissionSlip.objects.filter(field_trip=trip)
+    if incomplete_only:
+        slips = slips.exclude(status=PermissionSlip.COMPLETE)
+    slips = slips.select_related('student', 'guardian').order_by(
+        'student__last_name', 'student__first_name', 'id')
+
+    yield HEADER
+    chunk = []
+    for slip in slips.iterator(chunk_size=chunk_size):
+        chunk.append(slip)
+        if len(chunk) == chunk_size:
+            yield from _chunk_rows(trip, chunk)
+            chunk = []
+    yield from _chunk_rows(trip, chunk)
+
+
+def _chunk_rows(trip, slips):
+    guardians = {}
+    through = Guardian.students.through.objects.filter(
+        student_id__in=[slip.student_id for slip in slips]
+    ).select_related('guardian').order_by('guardian__last_name',
+                                          'guardian__first_name')
+    for row in through:
+        guardians.setdefault(row.student_id, []).append(
+            row.guardian.get_full_name())
+
+    for slip in slips:
+        yield [_cell(value) for value in (
+            slip.student.get_full_name(),
+            slip.student.person_id,
+            slip.student.get_grade_level_display(),
+            '; '.join(guardians.get(slip.student_id, [])),
+            'Yes' if slip.status == PermissionSlip.COMPLETE else 'No',
+            slip.student_signature,
+            _format_datetime(slip.student_signature_date),
+            slip.guardian.get_full_name() if slip.guardian else '',
+            slip.guardian_signature,
+            _format_datetime(slip.guardian_signature_date),
+            str(slip.due_date or trip.due_date),
+        )]
+
+
+def _format_datetime(value):
+    if value is None:
+        return ''
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M')
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    value = str(value)
+    if value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
@@ -18,9 +18,10 @@ from django import forms
 from django.db import transaction
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit, Layout, Fieldset, ButtonHolder, Row, Column
-from django_select2.forms import Select2MultipleWidget
+from django_select2.forms import ModelSelect2MultipleWidget
 from bootstrap_datepicker_plus import DatePickerInput, TimePickerInput
 
+from . import roster
 from .models import Student, Faculty, Course, Section
 
 class PermissionSlipFormParent(forms.Form):
@@ -36,6 +37,47 @@ class PermissionSlipFormStudent(forms.Form):
     name = forms.CharField(required=True, label='Enter your name.')
     electronic_consent = forms.BooleanField(required=True, label='By checking this box you signal that you have read and understand that the school handbook rules are in effect during this field trip.')
 
+class SearchMultipleWidget(ModelSelect2MultipleWidget):
+    """Select2 picker that searches on the server as the user types.
+
+    Only the selected options are rendered into the page. Searches go to the
+    `picker search` view, a page of `max_results` choices at a time. Search
+    fields use prefix lookups so that the database can use an index.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('data_view', 'picker search')
+        super(SearchMultipleWidget, self).__init__(*args, **kwargs)
+
+
+class RosterSearchMultipleWidget(SearchMultipleWidget):
+    """Picker for people, searched through the roster search index."""
+    # Only used to describe the widget; roster.filter_queryset does the search.
+    search_fields = ['first_name__istartswith', 'last_name__istartswith']
+
+    def filter_queryset(self, request, term, queryset=None, **dependent_fields):
+        if queryset is None:
+            queryset = self.get_queryset()
+        return roster.filter_queryset(queryset, term)
+
+
+class StudentWidget(RosterSearchMultipleWidget):
+    pass
+
+
+class FacultyWidget(RosterSearchMultipleWidget):
+    pass
+
+
+class CourseWidget(SearchMultipleWidget):
+    search_fields = ['course_name__istartswith', 'course_number__istartswith']
+
+
+class SectionWidget(SearchMultipleWidget):
+    search_fields = ['course__course_name__istartswith',
+                     'course__course_number__istartswith',
+                     'section_number__istartswith']
+
+
 class TripDetailForm(forms.Form):
     def __init__(self, *args, read_only=False, **kwargs):
         super(TripDetailForm, self).__init__(*args, **kwargs)
@@ -105,26 +147,29 @@ class TripDetailForm(forms.Form):
     faculty = forms.ModelMultipleChoiceField(
         required=True,
         label="Faculty/Staff Coordinators",
-        widget=Select2MultipleWidget,
-        queryset=Faculty.objects.filter(hidden=False)
+        widget=FacultyWidget,
+        queryset=Faculty.objects.filter(hidden=False).order_by(
+            'last_name', 'first_name')
     )
     students = forms.ModelMultipleChoiceField(
         required=False,
         label="Students Invited",
-        widget=Select2MultipleWidget,
-        queryset=Student.objects.filter(hidden=False)
+        widget=StudentWidget,
+        queryset=Student.objects.filter(hidden=False).order_by(
+            'last_name', 'first_name')
     )
     courses = forms.ModelMultipleChoiceField(
         required=False,
         label="Courses Invited",
-        widget=Select2MultipleWidget,
-        queryset=Course.objects.filter(hidden=False)
+        widget=CourseWidget,
+        queryset=Course.objects.filter(hidden=False).order_by('course_name')
     )
     sections = forms.ModelMultipleChoiceField(
         required=False,
         label="Sections Invited",
-        widget=Select2MultipleWidget,
-        queryset=Section.objects.filter(hidden=False)
+        widget=SectionWidget,
+        queryset=Section.objects.filter(hidden=False).select_related(
+            'course').order_by('course__course_name', 'section_number')
     )
 
     @transaction.atomic
@@ -0,0 +1,276 @@
+"""Defines the pooled SMTP email backend used by the Celery workers.
+
+Django's SMTP backend opens (and, with TLS, negotiates) a new session for every
+`send_messages` call and quits it again afterwards. djcelery_email calls the
+backend once per task, so a trip release ends up performing one TLS handshake
+and one login per batch of messages.
+
+`PooledEmailBackend` keeps a small per-process pool of authenticated SMTP
+sessions instead. Closing the backend hands its session back to the pool, and
+the next backend instance picks it up again without reconnecting. Sessions
+that the server dropped are detected and replaced transparently.
+
+To use it, set `CELERY_EMAIL_BACKEND` to
+`paperlesspermission.mail.PooledEmailBackend`. The pool is tuned with the
+following settings:
+
+    EMAIL_POOL_SIZE: Idle sessions kept open per worker process.
+    EMAIL_POOL_MAX_MESSAGES: Messages sent over one session before it is
+        retired. Most relays cap this.
+    EMAIL_POOL_CHECK_AFTER: Seconds a session may sit idle before it is
+        checked with NOOP on checkout.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import atexit
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.mail.message import sanitize_address
+
+LOGGER = logging.getLogger(__name__)
+
+# Errors that mean the session is unusable and a fresh one should be tried.
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError,
+                    socket.timeout)
+# "Service not available, closing transmission channel"
+SMTP_CLOSING_CODE = 421
+
+
+class PoolStats():
+    """Thread-safe counters describing how well the pool is working.
+
+    Attributes:
+        connections_opened (int): New SMTP sessions established
+        connections_reused (int): Sessions checked out of the pool
+        reconnects (int): Sessions replaced after the server dropped them
+        messages_sent (int): Messages accepted by the server
+    """
+    FIELDS = ('connections_opened', 'connections_reused', 'reconnects',
+              'messages_sent')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def increment(self, field, amount=1):
+        """Adds `amount` to the named counter."""
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def snapshot(self):
+        """Returns the current counter values as a dict."""
+        with self._lock:
+            return {field: getattr(self, field) for field in self.FIELDS}
+
+    def reset(self):
+        """Sets every counter back to zero."""
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+
+POOL_STATS = PoolStats()
+
+
+class _PooledSession():
+    """An open SMTP session along with its usage information."""
+    def __init__(self, connection):
+        self.connection = connection
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool():
+    """Per-process pool of idle SMTP sessions, keyed by server and account.
+
+    Celery's prefork workers inherit module state from the parent process, and
+    an SMTP socket must never be shared between processes, so the pool throws
+    away anything it did not create itself.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._idle = {}
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = {}
+
+    def checkout(self, key):
+        """Returns an idle session for `key`, or None if there is none."""
+        with self._lock:
+            self._check_pid()
+            sessions = self._idle.get(key)
+            return sessions.pop() if sessions else None
+
+    def checkin(self, key, session, max_size):
+        """Returns a session to the pool. Returns False if the pool is full."""
+        with self._lock:
+            self._check_pid()
+            sessions = self._idle.setdefault(key, [])
+            if len(sessions) >= max_size:
+                return False
+            session.last_used = time.monotonic()
+            sessions.append(session)
+            return True
+
+    def close_all(self):
+        """Quits every idle session in the pool."""
+        with self._lock:
+            self._check_pid()
+            idle, self._idle = self._idle, {}
+        for sessions in idle.values():
+            for session in sessions:
+                _quit(session.connection)
+
+
+POOL = SMTPConnectionPool()
+atexit.register(POOL.close_all)
+
+
+def _quit(connection):
+    """Politely ends an SMTP session, ignoring a server that already left."""
+    try:
+        connection.quit()
+    except (smtplib.SMTPException, OSError):
+        connection.close()
+
+
+class PooledEmailBackend(EmailBackend):
+    """SMTP email backend that reuses sessions from a per-process pool."""
+
+    def __init__(self, *args, **kwargs):
+        super(PooledEmailBackend, self).__init__(*args, **kwargs)
+        self.pool_size = getattr(settings, 'EMAIL_POOL_SIZE', 4)
+        self.max_messages = getattr(settings, 'EMAIL_POOL_MAX_MESSAGES', 500)
+        self.check_after = getattr(settings, 'EMAIL_POOL_CHECK_AFTER', 30)
+        self.session = None
+
+    @property
+    def pool_key(self):
+        """Sessions may only be shared between identically configured
+        backends."""
+        return (self.host, self.port, self.username, self.use_tls,
+                self.use_ssl)
+
+    def open(self):
+        """Checks out a pooled session or opens a new one.
+
+        Returns the same values as Django's SMTP backend, so a reused session
+        counts as a new connection and will be handed back by
+        `send_messages`.
+        """
+        if self.connection:
+            return False
+
+        while True:
+            session = POOL.checkout(self.pool_key)
+            if session is None:
+                break
+            if self._session_alive(session):
+                self.session = session
+                self.connection = session.connection
+                POOL_STATS.increment('connections_reused')
+                return True
+            _quit(session.connection)
+
+        opened = super(PooledEmailBackend, self).open()
+        if self.connection:
+            self.session = _PooledSession(self.connection)
+            POOL_STATS.increment('connections_opened')
+        return opened
+
+    def _session_alive(self, session):
+        """Checks a session that has been idle for a while with NOOP."""
+        if time.monotonic() - session.last_used < self.check_after:
+            return True
+        try:
+            return session.connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def close(self):
+        """Returns the session to the pool instead of quitting it."""
+        if self.connection is None:
+            return
+        session, self.session = self.session, None
+        if (session is not None
+                and session.messages_sent < self.max_messages
+                and POOL.checkin(self.pool_key, session, self.pool_size)):
+            self.connection = None
+            return
+        super(PooledEmailBackend, self).close()
+
+    def _discard(self):
+        """Throws away the current session without returning it to the pool."""
+        connection, self.connection = self.connection, None
+        self.session = None
+        if connection is not None:
+            connection.close()
+
+    def _send(self, email_message):
+        """Sends one message, reconnecting once if the session was dropped."""
+        if not email_message.recipients():
+            return False
+        encoding = email_message.encoding or settings.DEFAULT_CHARSET
+        from_email = sanitize_address(email_message.from_email, encoding)
+        recipients = [sanitize_address(addr, encoding)
+                      for addr in email_message.recipients()]
+        message = email_message.message().as_bytes(linesep='\r\n')
+
+        try:
+            self._sendmail(from_email, recipients, message)
+        except smtplib.SMTPException:
+            if not self.fail_silently:
+                raise
+            return False
+        return True
+
+    def _sendmail(self, from_email, recipients, message):
+        if self.session.messages_sent >= self.max_messages:
+            self._replace_session()
+        try:
+            self.connection.sendmail(from_email, recipients, message)
+        except RECONNECT_ERRORS + (smtplib.SMTPResponseException,) as err:
+            if (isinstance(err, smtplib.SMTPResponseException)
+                    and err.smtp_code != SMTP_CLOSING_CODE):
+                raise
+            LOGGER.warning('SMTP session lost (%r), reconnecting.', err)
+            POOL_STATS.increment('reconnects')
+            self._discard()
+            if not self.open():
+                raise smtplib.SMTPServerDisconnected(
+                    'Could not reconnect to {0}'.format(self.host))
+            self.connection.sendmail(from_email, recipients, message)
+        self.session.messages_sent += 1
+        self.session.last_used = time.monotonic()
+        POOL_STATS.increment('messages_sent')
+
+    def _replace_session(self):
+        """Retires a session that has reached EMAIL_POOL_MAX_MESSAGES."""
+        connection, self.connection = self.connection, None
+        self.session = None
+        _quit(connection)
+        if not self.open():
+            raise smtplib.SMTPServerDisconnected(
+                'Could not reconnect to {0}'.format(self.host))
@@ -0,0 +1,29 @@
+"""Defines the rebuild_roster_index command for manage.py.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from django.core.management.base import BaseCommand
+from paperlesspermission import roster
+
+
+class Command(BaseCommand):
+    """Rebuilds the roster search index without running an import."""
+
+    help = 'Rebuilds the roster search index from the current roster.'
+
+    def handle(self, *args, **options):
+        indexed = roster.rebuild()
+        self.stdout.write('Indexed {0} people.'.format(indexed))
@@ -0,0 +1,190 @@
+"""Prometheus metrics of the web and Celery workers.
+
+Metrics are recorded with prometheus_client and exported in its text format:
+
+    paperless_request_latency_seconds: Request latency by URL name and method
+    paperless_requests_total: Responses by URL name, method and status code
+    paperless_task_runtime_seconds: Runtime of each Celery task by state
+    paperless_task_queue_wait_seconds: Time tasks waited in the queue
+    paperless_messages_total: Outbox messages sent or failed by channel
+    paperless_slips_generated_total: Permission slips created
+    paperless_import_rows_total: DJO import rows read by file
+    paperless_import_duration_seconds: Time taken to read each DJO file
+
+The import rate is derived from the last two, for instance:
+
+    increase(paperless_import_rows_total[1d])
+      / increase(paperless_import_duration_seconds_sum[1d])
+
+gunicorn and the Celery prefork pool both run several processes, so each
+keeps its own counts. Set the `prometheus_multiproc_dir` environment
+variable to an empty directory shared by the processes (start-server.sh
+does), and the exported numbers are summed over all of them. See
+gunicorn.conf.py for cleaning up after workers that exit.
+
+The web numbers are served by the `metrics` view to staff and to scrapers
+sending `Authorization: Bearer <METRICS_TOKEN>`. Celery workers do not
+serve HTTP, so the main worker process serves its pool's numbers on
+`METRICS_WORKER_PORT`, which should only be reachable from the scraper.
+Nothing is served unless `METRICS_ENABLED` is set.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hmac
+import logging
+import os
+import time
+
+from celery.signals import (before_task_publish, task_postrun, task_prerun,
+                            worker_ready)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Histogram, generate_latest,
+                               multiprocess, start_http_server)
+
+LOGGER = logging.getLogger(__name__)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Tasks run from well under a second (one resend) to many minutes (imports).
+TASK_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+REQUEST_LATENCY = Histogram(
+    'paperless_request_latency_seconds', 'Request latency',
+    ['view', 'method'])
+REQUESTS = Counter(
+    'paperless_requests_total', 'Responses sent',
+    ['view', 'method', 'status'])
+TASK_RUNTIME = Histogram(
+    'paperless_task_runtime_seconds', 'Celery task runtime',
+    ['task', 'state'], buckets=TASK_BUCKETS)
+TASK_QUEUE_WAIT = Histogram(
+    'paperless_task_queue_wait_seconds',
+    'Time between a Celery task being queued and starting',
+    ['task'], buckets=TASK_BUCKETS)
+MESSAGES = Counter(
+    'paperless_messages_total', 'Outbox messages delivered',
+    ['channel', 'result'])
+SLIPS_GENERATED = Counter(
+    'paperless_slips_generated_total', 'Permission slips created')
+IMPORT_ROWS = Counter(
+    'paperless_import_rows_total', 'DJO import rows read', ['file'])
+IMPORT_DURATION = Histogram(
+    'paperless_import_duration_seconds', 'Time taken to read a DJO file',
+    ['file'], buckets=TASK_BUCKETS)
+
+
+def enabled():
+    """Returns whether the metrics are served (`METRICS_ENABLED`)."""
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+def registry():
+    """Returns the registry to export, which combines every process in
+    multiprocess mode."""
+    if 'prometheus_multiproc_dir' in os.environ:
+        combined = CollectorRegistry()
+        multiprocess.MultiProcessCollector(combined)
+        return combined
+    return REGISTRY
+
+
+def render():
+    """Returns the current metrics in the Prometheus text format."""
+    return generate_latest(registry())
+
+
+def token_matches(request):
+    """Returns whether a request carries the `METRICS_TOKEN` bearer token."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return False
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return hmac.compare_digest(header.encode(),
+                               'Bearer {0}'.format(token).encode())
+
+
+def counted_rows(file_name, rows):
+    """Yields `rows`, counting them as DJO import rows of `file_name` and
+    timing how long they take to process."""
+    count = 0
+    start = time.monotonic()
+    for row in rows:
+        count += 1
+        yield row
+    IMPORT_ROWS.labels(file_name).inc(count)
+    IMPORT_DURATION.labels(file_name).observe(time.monotonic() - start)
+
+
+class MetricsMiddleware():
+    """Records the latency of every request by URL name.
+
+    Enabled by the `METRICS_ENABLED` setting.
+    """
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        # Unresolved paths are not used as labels, which would let anybody
+        # create any number of time series.
+        view = match.view_name if match else '<unresolved>'
+        REQUEST_LATENCY.labels(view, request.method).observe(
+            time.perf_counter() - start)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        return response
+
+
+@before_task_publish.connect
+def _task_published(headers=None, **kwargs):
+    # pylint: disable=unused-argument
+    if headers is not None:
+        headers['sent_at'] = time.time()
+
+
+_task_starts = {}
+
+
+@task_prerun.connect
+def _task_started(task_id=None, task=None, **kwargs):
+    # pylint: disable=unused-argument
+    _task_starts[task_id] = time.monotonic()
+    sent_at = task.request.get('sent_at')
+    if sent_at is not None:
+        TASK_QUEUE_WAIT.labels(task.name).observe(max(time.time() - sent_at, 0))
+
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, state=None, **kwargs):
+    # pylint: disable=unused-argument
+    start = _task_starts.pop(task_id, None)
+    if start is not None:
+        TASK_RUNTIME.labels(task.name, state or 'UNKNOWN').observe(
+            time.monotonic() - start)
+
+
+@worker_ready.connect
+def _serve_worker_metrics(**kwargs):
+    # pylint: disable=unused-argument
+    port = getattr(settings, 'METRICS_WORKER_PORT', 0)
+    if enabled() and port:
+        start_http_server(port, registry=registry())
+        LOGGER.info('Serving worker metrics on port %s.', port)
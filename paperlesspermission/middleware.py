@@ -0,0 +1,233 @@
+"""Measures where the time of each request goes.
+
+`RequestTimingMiddleware` records for every request:
+
+    total: Time spent in the view and the middleware below this one
+    sql: Number of queries and time spent in them, on every database
+    tpl: Time spent rendering templates
+    cache: Hits and misses of the Django caches
+
+The numbers are sent back in a `Server-Timing` header, which browsers show
+in their developer tools, and logged as one line per request. Requests
+slower than `REQUEST_SLOW_MS` are also logged as warnings together with
+their slowest SQL statements, for a `REQUEST_SLOW_SAMPLE_RATE` share of them.
+
+The middleware is turned on by `REQUEST_TIMING_ENABLED`. When it is off,
+Django drops it from the middleware chain at startup and nothing is
+measured. Template and cache timings are taken by wrapping the template and
+cache backend classes once the middleware is loaded; the wrappers only
+record anything while a request is being timed on the same thread.
+
+The time of a streaming response (such as the CSV export) only covers
+making the response, not sending its rows.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from contextlib import ExitStack
+from functools import wraps
+import heapq
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SLOW_MS = 1000
+DEFAULT_SLOW_QUERIES = 5
+
+_local = threading.local()
+_patch_lock = threading.Lock()
+_patched = set()
+
+
+class RequestTiming():
+    """The measurements of one request."""
+    def __init__(self, slow_queries=DEFAULT_SLOW_QUERIES):
+        self.slow_queries = slow_queries
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Min-heap of the slowest (duration, sql) statements.
+        self._slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper timing every query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.sql_count += 1
+            self.sql_time += duration
+            if len(self._slowest) < self.slow_queries:
+                heapq.heappush(self._slowest, (duration, sql))
+            elif self._slowest and duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (duration, sql))
+
+    def slowest_queries(self):
+        """Returns the slowest (seconds, sql) statements, slowest first."""
+        return sorted(self._slowest, reverse=True)
+
+
+def current_timing():
+    """Returns the `RequestTiming` of the request on this thread, or None."""
+    return getattr(_local, 'timing', None)
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, *args, **kwargs):
+        timing = current_timing()
+        # Templates rendered while rendering another one (crispy forms, for
+        # instance) are already covered by the outer render.
+        if timing is None or timing.template_depth:
+            return render(self, *args, **kwargs)
+        timing.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            timing.template_time += time.perf_counter() - start
+            timing.template_depth -= 1
+    return wrapper
+
+
+def _counted_get(get):
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        value = get(self, key, default, version)
+        timing = current_timing()
+        if timing is not None:
+            if value is default:
+                timing.cache_misses += 1
+            else:
+                timing.cache_hits += 1
+        return value
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @wraps(get_many)
+    def wrapper(self, keys, version=None):
+        keys = list(keys)
+        values = get_many(self, keys, version)
+        timing = current_timing()
+        if timing is not None:
+            timing.cache_hits += len(values)
+            timing.cache_misses += len(keys) - len(values)
+        return values
+    return wrapper
+
+
+def _patch(cls, name, decorator):
+    with _patch_lock:
+        if (cls, name) in _patched:
+            return
+        setattr(cls, name, decorator(getattr(cls, name)))
+        _patched.add((cls, name))
+
+
+def install_hooks():
+    """Wraps the template and cache backends so that they report to the
+    request being timed. Safe to call more than once."""
+    _patch(Template, 'render', _timed_render)
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        _patch(backend, 'get', _counted_get)
+        _patch(backend, 'get_many', _counted_get_many)
+
+
+def server_timing(total, timing):
+    """Returns the `Server-Timing` header value of a timed request."""
+    return ', '.join([
+        'total;dur={0:.1f}'.format(total * 1000),
+        'sql;dur={0:.1f};desc="{1} queries"'.format(timing.sql_time * 1000,
+                                                     timing.sql_count),
+        'tpl;dur={0:.1f}'.format(timing.template_time * 1000),
+        'cache;desc="{0} hits {1} misses"'.format(timing.cache_hits,
+                                                  timing.cache_misses),
+    ])
+
+
+class RequestTimingMiddleware():
+    """Adds `Server-Timing` headers and timing logs to every request.
+
+    Enable with the `REQUEST_TIMING_ENABLED` setting. Put it first in
+    `MIDDLEWARE` so that it covers the rest of the chain.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'REQUEST_SLOW_MS', DEFAULT_SLOW_MS)
+        self.sample_rate = getattr(settings, 'REQUEST_SLOW_SAMPLE_RATE', 1.0)
+        self.slow_queries = getattr(settings, 'REQUEST_SLOW_QUERIES',
+                                    DEFAULT_SLOW_QUERIES)
+        install_hooks()
+
+    def __call__(self, request):
+        timing = RequestTiming(self.slow_queries)
+        _local.timing = timing
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing))
+                response = self.get_response(request)
+        finally:
+            _local.timing = None
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = server_timing(total, timing)
+        self.log(request, response, total, timing)
+        return response
+
+    def log(self, request, response, total, timing):
+        """Logs the timing of a request, and its slowest queries if it was
+        slow."""
+        match = getattr(request, 'resolver_match', None)
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'sql_count': timing.sql_count,
+            'sql_ms': round(timing.sql_time * 1000, 1),
+            'template_ms': round(timing.template_time * 1000, 1),
+            'cache_hits': timing.cache_hits,
+            'cache_misses': timing.cache_misses,
+        }
+        LOGGER.info(' '.join('{0}=%s'.format(name) for name in fields),
+                    *fields.values(), extra={'timing': fields})
+
+        if total * 1000 >= self.slow_ms and random.random() < self.sample_rate:
+            LOGGER.warning(
+                'Slow request %s %s took %.0f ms. Slowest queries:\n%s',
+                request.method, request.path, total * 1000,
+                '\n'.join('{0:.1f} ms: {1}'.format(duration * 1000, sql)
+                          for duration, sql in timing.slowest_queries()),
+                extra={'timing': fields})
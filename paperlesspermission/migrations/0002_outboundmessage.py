@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-19 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.EmailField(max_length=254)),
+                ('subject', models.CharField(max_length=200)),
+                ('body', models.TextField()),
+                ('body_hash', models.CharField(max_length=64)),
+                ('status', models.IntegerField(choices=[(0, 'Queued'), (1, 'Sent'), (2, 'Failed')], default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('sent', models.DateTimeField(blank=True, null=True)),
+                ('permission_slip_links', models.ManyToManyField(to='paperlesspermission.PermissionSlipLink')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outboundmessage',
+            index=models.Index(fields=['status', 'id'], name='outbox_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outboundmessage',
+            index=models.Index(fields=['body_hash'], name='outbox_body_hash_idx'),
+        ),
+    ]
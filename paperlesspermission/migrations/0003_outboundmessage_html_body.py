@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-19 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0002_outboundmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundmessage',
+            name='html_body',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
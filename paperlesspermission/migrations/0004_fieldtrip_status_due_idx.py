@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-19 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0003_outboundmessage_html_body'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fieldtrip',
+            index=models.Index(fields=['status', 'due_date'], name='trip_status_due_idx'),
+        ),
+    ]
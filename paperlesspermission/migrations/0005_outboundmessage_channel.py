@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-19 09:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0004_fieldtrip_status_due_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='outboundmessage',
+            name='outbox_status_idx',
+        ),
+        migrations.AddField(
+            model_name='outboundmessage',
+            name='channel',
+            field=models.IntegerField(choices=[(0, 'Email'), (1, 'SMS')], default=0),
+        ),
+        migrations.AlterField(
+            model_name='outboundmessage',
+            name='recipient',
+            field=models.CharField(max_length=254),
+        ),
+        migrations.AddIndex(
+            model_name='outboundmessage',
+            index=models.Index(fields=['channel', 'status', 'id'], name='outbox_channel_status_idx'),
+        ),
+    ]
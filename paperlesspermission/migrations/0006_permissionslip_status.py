@@ -0,0 +1,57 @@
+# Generated by Django 3.1.14 on 2026-10-19 09:51
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Copied from PermissionSlip, historical models do not have class attributes.
+NONE = 0
+STUDENT = 1
+GUARDIAN = 2
+COMPLETE = 3
+
+
+def backfill_status(apps, schema_editor):
+    """Sets the status of existing slips from their signatures.
+
+    Slips are updated in id ranges of BATCH_SIZE, with one UPDATE per status,
+    so no single statement locks the whole table. The migration is not
+    atomic, so each batch is committed as it goes.
+    """
+    PermissionSlip = apps.get_model('paperlesspermission', 'PermissionSlip')
+    db_alias = schema_editor.connection.alias
+    slips = PermissionSlip.objects.using(db_alias)
+    last_id = slips.order_by('-id').values_list('id', flat=True).first()
+    if last_id is None:
+        return
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        batch = slips.filter(id__gte=start, id__lt=start + BATCH_SIZE)
+        batch.filter(student_signature__isnull=False,
+                     guardian_signature__isnull=True).update(status=STUDENT)
+        batch.filter(student_signature__isnull=True,
+                     guardian_signature__isnull=False).update(status=GUARDIAN)
+        batch.filter(student_signature__isnull=False,
+                     guardian_signature__isnull=False).update(status=COMPLETE)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('paperlesspermission', '0005_outboundmessage_channel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='permissionslip',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Not Signed'), (1, 'Student Signed'), (2, 'Guardian Signed'), (3, 'Complete')], default=0),
+        ),
+        # Every slip starts out as NONE, so only signed slips are updated.
+        migrations.RunPython(backfill_status, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='permissionslip',
+            index=models.Index(fields=['field_trip', 'status'], name='slip_trip_status_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-19 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0006_permissionslip_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fieldtrip',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='permissionslip',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
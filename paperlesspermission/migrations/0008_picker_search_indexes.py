@@ -0,0 +1,41 @@
+# Generated by Django 3.1.14 on 2026-10-19 09:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0007_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['course_name'], name='course_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='faculty',
+            index=models.Index(fields=['last_name'], name='faculty_last_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='faculty',
+            index=models.Index(fields=['first_name'], name='faculty_first_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guardian',
+            index=models.Index(fields=['last_name'], name='guardian_last_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guardian',
+            index=models.Index(fields=['first_name'], name='guardian_first_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['last_name'], name='student_last_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['first_name'], name='student_first_name_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.1.14 on 2026-10-19 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0008_picker_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RosterToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('person_type', models.IntegerField(choices=[(0, 'Student'), (1, 'Guardian'), (2, 'Faculty')])),
+                ('person_pk', models.IntegerField()),
+                ('token', models.CharField(max_length=254)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RosterTrigram',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=254)),
+                ('word_trigrams', models.IntegerField()),
+                ('trigram', models.CharField(max_length=3)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='rostertrigram',
+            index=models.Index(fields=['trigram'], name='roster_trigram_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rostertoken',
+            index=models.Index(fields=['token', 'person_type'], name='roster_token_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rostertoken',
+            index=models.Index(fields=['person_type', 'person_pk'], name='roster_token_person_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.1.14 on 2026-10-19 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0009_roster_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['hidden', 'course_name'], name='course_hidden_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='faculty',
+            index=models.Index(fields=['hidden', 'last_name', 'first_name'], name='faculty_hidden_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='faculty',
+            index=models.Index(fields=['email'], name='faculty_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fieldtrip',
+            index=models.Index(fields=['hidden', 'status'], name='trip_hidden_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guardian',
+            index=models.Index(fields=['hidden', 'last_name', 'first_name'], name='guardian_hidden_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guardian',
+            index=models.Index(fields=['email'], name='guardian_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='permissionsliplink',
+            index=models.Index(fields=['permission_slip', 'student'], name='slip_link_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='permissionsliplink',
+            index=models.Index(fields=['permission_slip', 'guardian'], name='slip_link_guardian_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='section',
+            index=models.Index(fields=['hidden', 'course'], name='section_hidden_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['hidden', 'last_name', 'first_name'], name='student_hidden_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['email'], name='student_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['grade_level', 'hidden'], name='student_grade_level_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-19 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0010_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.IntegerField(choices=[(0, 'Request'), (1, 'Task')])),
+                ('name', models.CharField(max_length=200)),
+                ('description', models.CharField(blank=True, max_length=500)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('duration', models.FloatField()),
+                ('sql_count', models.IntegerField()),
+                ('sql_time', models.FloatField()),
+                ('report', models.TextField()),
+                ('stats', models.BinaryField()),
+            ],
+        ),
+    ]
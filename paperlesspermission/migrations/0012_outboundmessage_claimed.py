@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-19 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0011_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundmessage',
+            name='claimed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='outboundmessage',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Queued'), (1, 'Sent'), (2, 'Failed'), (3, 'Sending')], default=0),
+        ),
+    ]
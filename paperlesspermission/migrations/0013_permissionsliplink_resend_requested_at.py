@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-19 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0012_outboundmessage_claimed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='permissionsliplink',
+            name='resend_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
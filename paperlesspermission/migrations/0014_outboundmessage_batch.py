@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-19 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0013_permissionsliplink_resend_requested_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundmessage',
+            name='batch',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
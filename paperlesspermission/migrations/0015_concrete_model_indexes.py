@@ -0,0 +1,33 @@
+# Generated by Django 3.1.14 on 2026-10-19 11:38
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperlesspermission', '0014_outboundmessage_batch'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='guardian',
+            name='guardian_hidden_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='guardian',
+            name='guardian_email_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='permissionsliplink',
+            name='slip_link_student_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='permissionsliplink',
+            name='slip_link_guardian_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='student',
+            name='student_email_idx',
+        ),
+    ]
@@ -21,12 +21,16 @@ limitations under the License.
 from hashlib import sha256
 
 from django.db import models
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.db import transaction
 from django.conf import settings
+from django.utils import timezone
 
 from phonenumber_field.modelfields import PhoneNumberField
 
+from . import metrics, slipcache
+from .emails import NotificationRenderer
+
 class Person(models.Model):
     """This is an abstract class that defines the common attributes of people.
 
@@ -49,6 +53,11 @@ class Person(models.Model):
 
     class Meta:
         abstract = True
+        indexes = [
+            # Prefix searches of the trip form pickers.
+            models.Index(fields=['last_name'], name='%(class)s_last_name_idx'),
+            models.Index(fields=['first_name'], name='%(class)s_first_name_idx'),
+        ]
 
     def get_full_name(self):
         """Returns the full name of a person"""
@@ -99,6 +108,16 @@ class Student(Person):
         choices=GRADE_LEVEL_CHOICES,
     )
 
+    class Meta(Person.Meta):
+        indexes = Person.Meta.indexes + [
+            # Visible students in name order, as listed by the trip form.
+            models.Index(fields=['hidden', 'last_name', 'first_name'],
+                         name='student_hidden_name_idx'),
+            # Used to invite whole grade levels to a trip.
+            models.Index(fields=['grade_level', 'hidden'],
+                         name='student_grade_level_idx'),
+        ]
+
     def __str__(self):
         return self.email.split('@')[0]
 
@@ -112,6 +131,15 @@ class Faculty(Person):
     """
     preferred_name = models.CharField(max_length=200)
 
+    class Meta(Person.Meta):
+        indexes = Person.Meta.indexes + [
+            # Visible faculty in name order, as listed by the trip form.
+            models.Index(fields=['hidden', 'last_name', 'first_name'],
+                         name='faculty_hidden_name_idx'),
+            # Trip authorization looks faculty up by email address.
+            models.Index(fields=['email'], name='faculty_email_idx'),
+        ]
+
     def __str__(self):
         return self.preferred_name
 
@@ -133,6 +161,15 @@ class Course(models.Model):
     def __str__(self):
         return self.course_name
 
+    class Meta:
+        indexes = [
+            # Prefix searches of the trip form pickers.
+            models.Index(fields=['course_name'], name='course_name_idx'),
+            # Visible courses in name order, as listed by the trip form.
+            models.Index(fields=['hidden', 'course_name'],
+                         name='course_hidden_name_idx'),
+        ]
+
 
 class Section(models.Model):
     """Defines a `Section` of a `Course`.
@@ -168,6 +205,57 @@ class Section(models.Model):
     def __str__(self):
         return "{0} - Section {1}".format(self.course, self.section_number)
 
+    class Meta:
+        indexes = [
+            # Visible sections, as listed by the trip form.
+            models.Index(fields=['hidden', 'course'], name='section_hidden_idx'),
+        ]
+
+
+class FieldTripQuerySet(models.QuerySet):
+    """Adds permission slip statistics to `FieldTrip` queries."""
+
+    def with_slip_stats(self, today=None):
+        """Annotates each trip with counts of its permission slips.
+
+        The counts are aggregated by the database in the same query that
+        loads the trips:
+
+            slips_total: Every permission slip of the trip
+            slips_student_signed: Slips the student has signed
+            slips_guardian_signed: Slips a guardian has signed
+            slips_complete: Slips signed by both
+            slips_overdue: Incomplete slips past their due date. A slip's own
+                due date overrides the trip's.
+        """
+        if today is None:
+            today = timezone.localdate()
+        student_signed = Q(permissionslip__status__in=(PermissionSlip.STUDENT,
+                                                        PermissionSlip.COMPLETE))
+        guardian_signed = Q(permissionslip__status__in=(PermissionSlip.GUARDIAN,
+                                                         PermissionSlip.COMPLETE))
+        complete = Q(permissionslip__status=PermissionSlip.COMPLETE)
+        incomplete = Q(permissionslip__status__in=(PermissionSlip.NONE,
+                                                    PermissionSlip.STUDENT,
+                                                    PermissionSlip.GUARDIAN))
+        past_due = (
+            Q(permissionslip__due_date__lt=today)
+            | Q(permissionslip__due_date__isnull=True, due_date__lt=today)
+        )
+
+        def count(condition=None):
+            # distinct keeps the counts right when the query also joins other
+            # multi-valued relations, such as the faculty filter in trip_list.
+            return Count('permissionslip', filter=condition, distinct=True)
+
+        return self.annotate(
+            slips_total=count(),
+            slips_student_signed=count(student_signed),
+            slips_guardian_signed=count(guardian_signed),
+            slips_complete=count(complete),
+            slips_overdue=count(past_due & incomplete),
+        )
+
 
 class FieldTrip(models.Model):
     """Defines a `FieldTrip`.
@@ -190,6 +278,8 @@ class FieldTrip(models.Model):
         status (IntegerField Choice): Current status of the trip. DO NOT update
             this field directly. Instead use the appropriate approve(),
             initial_notify(), or archive() method.
+        updated_at (DateTimeField): When the trip was last saved. Used to
+            answer conditional requests for its pages.
     """
     name = models.CharField(max_length=100)
     group_name = models.CharField(max_length=100)
@@ -207,6 +297,7 @@ class FieldTrip(models.Model):
     grade_levels = models.CharField(max_length=30, null=True, blank=True)
     due_date = models.DateField()
     hidden = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     # Default value. This is set when a teacher submits a new trip. While the
     # status is still 0, teachers are still able to make changes.
@@ -257,6 +348,17 @@ class FieldTrip(models.Model):
     )
     status = models.IntegerField(choices=STATUS_CHOICES, default=NEW)
 
+    objects = FieldTripQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        """Overrides default save method by invalidating the cached slip
+        pages of the trip."""
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'updated_at'}
+        super(FieldTrip, self).save(*args, **kwargs)
+        slipcache.invalidate_trip(self.id)
+
     def faculty_is_moderator(self, email):
         """Returns whether a faculty member is a moderator for a trip.
 
@@ -328,12 +430,104 @@ class FieldTrip(models.Model):
             )
             if created:
                 permission_slip.generate_slip_links()
+                metrics.SLIPS_GENERATED.inc()
 
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            # Used by the daily reminder run to find released trips due soon.
+            models.Index(fields=['status', 'due_date'], name='trip_status_due_idx'),
+            # Used by the trip list and the archive.
+            models.Index(fields=['hidden', 'status'], name='trip_hidden_idx'),
+        ]
+
+
+class PermissionSlipQuerySet(models.QuerySet):
+    """Adds bulk staff actions to `PermissionSlip` queries."""
+
+    def reset(self):
+        """Resets every slip in the query with a single UPDATE.
+
+        Does the same as `PermissionSlip.reset()` followed by `save()` on each
+        slip, including invalidating the cached slip pages.
+
+        Returns:
+            int: Number of slips reset
+        """
+        trip_ids = set(self.values_list('field_trip_id', flat=True))
+        count = self.update(
+            guardian=None,
+            student_signature=None,
+            student_signature_date=None,
+            guardian_signature=None,
+            guardian_signature_date=None,
+            flagged_for_review=False,
+            status=PermissionSlip.NONE,
+            updated_at=timezone.now(),
+        )
+        for trip_id in trip_ids:
+            slipcache.invalidate_trip(trip_id)
+        return count
+
+    @transaction.atomic
+    def claim_resend(self, cooldown):
+        """Records that the slips in the query are about to be resent, except
+        for those sent or resent too recently.
+
+        The links of the slips are locked while they are checked, so a slip
+        is claimed by at most one of several concurrent requests. The claim
+        is kept in `PermissionSlipLink.resend_requested_at`; `last_sent` is
+        only set once a message is delivered, and a failed delivery releases
+        the claim (see `paperlesspermission.outbox`).
+
+        Parameters:
+            cooldown (timedelta): How long after a link was last sent, or its
+                resend was requested, it may not be resent
+
+        Returns:
+            list: Ids of the slips that may be resent
+        """
+        now = timezone.now()
+        links = list(PermissionSlipLink.objects.select_for_update().filter(
+            permission_slip__in=self).values_list(
+                'id', 'permission_slip_id', 'last_sent', 'resend_requested_at'))
+        refused = {slip_id for _, slip_id, last_sent, requested in links
+                   if (last_sent and last_sent > now - cooldown) or
+                   (requested and requested > now - cooldown)}
+        claimed = sorted(set(self.values_list('id', flat=True)) - refused)
+        PermissionSlipLink.objects.filter(id__in=[
+            link_id for link_id, slip_id, _, _ in links
+            if slip_id not in refused
+        ]).update(resend_requested_at=now)
+        return claimed
+
 
 class PermissionSlip(models.Model):
+    """Defines a student's permission slip for a `FieldTrip`.
+
+    `status` summarizes which signatures the slip has so that complete and
+    incomplete slips can be found through an index. It is derived from the
+    signatures by `save()`, so code that changes signatures with
+    `QuerySet.update()` must set it too (see `status_for_signatures`), as
+    well as `updated_at`, which answers conditional requests for slip pages.
+    """
+    # Nobody has signed yet.
+    NONE = 0
+    # Only the student has signed.
+    STUDENT = 1
+    # Only a guardian has signed.
+    GUARDIAN = 2
+    # Both the student and a guardian have signed.
+    COMPLETE = 3
+    STATUS_CHOICES = (
+        (NONE, 'Not Signed'),
+        (STUDENT, 'Student Signed'),
+        (GUARDIAN, 'Guardian Signed'),
+        (COMPLETE, 'Complete'),
+    )
+
     field_trip = models.ForeignKey(FieldTrip, on_delete=models.PROTECT)
     guardian = models.ForeignKey(Guardian, null=True, blank=True, on_delete=models.PROTECT)
     student = models.ForeignKey(Student, on_delete=models.PROTECT)
@@ -343,6 +537,37 @@ class PermissionSlip(models.Model):
     guardian_signature = models.CharField(max_length=100, null=True, blank=True)
     guardian_signature_date = models.DateTimeField(null=True, blank=True)
     flagged_for_review = models.BooleanField(default=False, blank=True)
+    status = models.IntegerField(choices=STATUS_CHOICES, default=NONE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PermissionSlipQuerySet.as_manager()
+
+    @classmethod
+    def status_for_signatures(cls, student_signed, guardian_signed):
+        """Returns the status of a slip with the given signatures."""
+        if student_signed and guardian_signed:
+            return cls.COMPLETE
+        if student_signed:
+            return cls.STUDENT
+        if guardian_signed:
+            return cls.GUARDIAN
+        return cls.NONE
+
+    def update_status(self):
+        """Sets `status` from the slip's signatures."""
+        self.status = self.status_for_signatures(
+            self.student_signature is not None,
+            self.guardian_signature is not None)
+
+    def save(self, *args, **kwargs):
+        """Overrides default save method by updating the status and
+        invalidating the cached slip pages."""
+        self.update_status()
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'status', 'updated_at'}
+        super(PermissionSlip, self).save(*args, **kwargs)
+        slipcache.invalidate_slip(self.id)
 
     def reset(self):
         self.guardian = None
@@ -351,85 +576,56 @@ class PermissionSlip(models.Model):
         self.guardian_signature = None
         self.guardian_signature_date = None
         self.flagged_for_review = False
+        self.status = self.NONE
 
     def generate_slip_links(self):
-        # Get list of all guardians of this student
-        student_guardians = Guardian.objects.filter(students__id=self.student.id)
+        """Creates the links of the student and each of their guardians that
+        do not exist yet."""
+        existing = set(PermissionSlipLink.objects.filter(
+            permission_slip=self).values_list('student_id', 'guardian_id'))
+        slip_links = []
 
         # Generate link for student (if not created already)
-        PermissionSlipLink.objects.get_or_create(
-            permission_slip=self,
-            student=self.student
-        )
+        if (self.student_id, None) not in existing:
+            slip_links.append(PermissionSlipLink(permission_slip=self,
+                                                 student=self.student))
 
         # Generate links for each guardian (if not created already)
-        for guardian in student_guardians:
-            PermissionSlipLink.objects.get_or_create(
-                permission_slip=self,
-                guardian=guardian
-            )
+        for guardian in Guardian.objects.filter(students__id=self.student_id):
+            if (None, guardian.id) not in existing:
+                slip_links.append(PermissionSlipLink(permission_slip=self,
+                                                     guardian=guardian))
+
+        PermissionSlipLink.set_link_ids(slip_links)
+        # A link created concurrently has the same link_id and is skipped.
+        PermissionSlipLink.objects.bulk_create(slip_links, ignore_conflicts=True)
+
+    def claim_resend(self, cooldown):
+        """Records that this slip is about to be resent, unless it was sent
+        or resent too recently.
+
+        The slip's links are locked while they are checked, so of several
+        concurrent requests to resend the same slip only one succeeds.
+
+        Parameters:
+            cooldown (timedelta): How long after a link was last sent, or its
+                resend was requested, it may not be resent
+
+        Returns:
+            bool: True if the resend may go ahead, False if it was refused
+        """
+        return bool(PermissionSlip.objects.filter(id=self.id).claim_resend(cooldown))
 
     def generate_emails(self):
-        slip_links = PermissionSlipLink.objects.filter(permission_slip=self)
-        emails = []
-        student = self.student
+        """Returns a (subject, message, from, to) tuple for each slip link."""
+        slip_links = PermissionSlipLink.objects.filter(
+            permission_slip=self).select_related('guardian', 'student')
+        renderer = NotificationRenderer(self.field_trip)
         efrom = getattr(settings, 'EMAIL_FROM_ADDRESS')
-        base_url = getattr(settings, 'BASE_URL')
+        emails = []
         for slip_link in slip_links:
-
-            if slip_link.guardian:
-                to = [slip_link.guardian.email]
-                subject = 'New Permission Slip for {0}'.format(student.get_full_name())
-                message = """{0},
-
-There is a new permission slip for you to fill out for your student, {1}.
-
-Trip: {2}
-Location: {3}
-Date: {4}
-Permission Slip Link (click): {5}
-
-Please visit the above link to view and fill out the permission slip by the due date, {6}.
-
-Thank you for your time,
-
--- 
-DJO Activities Office""".format(
-                    slip_link.guardian.get_full_name(),
-                    student.get_full_name(),
-                    self.field_trip.name,
-                    self.field_trip.location,
-                    self.field_trip.start_date,
-                    "{0}/slip/{1}".format(base_url, slip_link.link_id),
-                    self.field_trip.due_date
-                )
-            elif slip_link.student:
-                to = [slip_link.student.email]
-                subject = 'New Permission Slip for {0}'.format(self.field_trip.name)
-                message = """{0},
-
-There is a new permission slip for you to fill out:
-
-Trip: {1}
-Location: {2}
-Date: {3}
-Permission Slip Link (click): {4}
-
-Please visit the above link to view and fill out the permission slip by the due date, {5}
-
-Thank you for your time,
-
--- 
-DJO Activities Office""".format(
-                    slip_link.student.get_full_name(),
-                    self.field_trip.name,
-                    self.field_trip.location,
-                    self.field_trip.start_date,
-                    "{0}/slip/{1}".format(base_url, slip_link.link_id),
-                    self.field_trip.due_date
-                )
-
-            emails.append((subject, message, efrom, to))
+            email = renderer.link_email(slip_link, self.student)
+            emails.append((email.subject, email.body, efrom, [email.recipient]))
         return emails
 
     class Meta:
@@ -461,6 +657,10 @@ DJO Activities Office""".format(
                 name='Each stu can have at most one slip per field trip.'
             )
         ]
+        indexes = [
+            # Used to find a trip's complete or incomplete slips.
+            models.Index(fields=['field_trip', 'status'], name='slip_trip_status_idx'),
+        ]
 
 
 class PermissionSlipLink(models.Model):
@@ -470,25 +670,80 @@ class PermissionSlipLink(models.Model):
     student = models.ForeignKey(Student, on_delete=models.PROTECT, null=True, blank=True)
     link_id = models.CharField(max_length=64, unique=True, blank=True, null=True)
     last_sent = models.DateTimeField(null=True, blank=True)
+    # When staff last asked for the link to be resent, cleared if the resend
+    # fails. See PermissionSlipQuerySet.claim_resend.
+    resend_requested_at = models.DateTimeField(null=True, blank=True)
+
+    @staticmethod
+    def make_link_id(permission_slip_id, person_id):
+        """Returns the link identifier of a permission slip and a person.
+
+        Parameters:
+            permission_slip_id (int): Primary key of the `PermissionSlip`
+            person_id (str): `person_id` of the `Guardian` or `Student`
+        """
+        salt = getattr(settings, "LINK_ID_SALT", '')
+        link_composite = '{0}-{1}-{2}'.format(
+            salt, permission_slip_id, person_id).encode()
+        return sha256(link_composite).hexdigest()
 
     def calculate_link_id(self):
         """Generates a hash-based link identifier for a permission slip link."""
-        salt = getattr(settings, "LINK_ID_SALT", '')
-        if self.guardian:
+        if self.guardian_id:
             person_id = self.guardian.person_id
-        elif self.student:
+        elif self.student_id:
             person_id = self.student.person_id
         else:
             raise ValueError("No student or guardian set")
 
-        link_composite = '{0}-{1}-{2}'.format(
-            salt, self.permission_slip.id, person_id).encode()
+        self.link_id = self.make_link_id(self.permission_slip_id, person_id)
+
+    @classmethod
+    def set_link_ids(cls, slip_links):
+        """Calculates the link_id of every link that does not have one yet.
 
-        self.link_id = sha256(link_composite).hexdigest()
+        Meant for code creating many links with `bulk_create`, which skips
+        `save()`. Guardians and students that are not already loaded on their
+        links are looked up with one query per model instead of one per link.
+
+        Parameters:
+            slip_links (list): Unsaved `PermissionSlipLink` objects
+        """
+        slip_links = [slip_link for slip_link in slip_links if not slip_link.link_id]
+        person_ids = {}
+        for field, model in (('guardian', Guardian), ('student', Student)):
+            missing = {getattr(slip_link, field + '_id') for slip_link in slip_links
+                       if not getattr(cls, field).is_cached(slip_link)}
+            missing.discard(None)
+            if missing:
+                person_ids.update(
+                    ((field, pk), person_id)
+                    for pk, person_id in model.objects.filter(
+                        id__in=missing).values_list('id', 'person_id'))
+
+        for slip_link in slip_links:
+            if slip_link.guardian_id:
+                field = 'guardian'
+            elif slip_link.student_id:
+                field = 'student'
+            else:
+                raise ValueError("No student or guardian set")
+            if getattr(cls, field).is_cached(slip_link):
+                person_id = getattr(slip_link, field).person_id
+            else:
+                person_id = person_ids[(field, getattr(slip_link, field + '_id'))]
+            slip_link.link_id = cls.make_link_id(slip_link.permission_slip_id,
+                                                 person_id)
 
     def save(self, *args, **kwargs):
-        """Overrides default save method by calculating the link_id."""
-        self.calculate_link_id()
+        """Overrides default save method by calculating the link_id of new
+        links.
+
+        The link_id never changes once set, so saving an existing link loads
+        neither its permission slip nor its person.
+        """
+        if not self.link_id:
+            self.calculate_link_id()
         super(PermissionSlipLink, self).save(*args, **kwargs)
 
     class Meta:
@@ -504,3 +759,169 @@ class PermissionSlipLink(models.Model):
                 name='Only tied to one person.'
             )
         ]
+
+
+class OutboundMessage(models.Model):
+    """Defines a notification email or SMS waiting in (or delivered from) the
+    outbox.
+
+    Messages are written to the outbox before any SMTP work is done so that
+    delivery can be retried or resumed without sending duplicates. See
+    `paperlesspermission.outbox` for the code that queues and drains them.
+
+    Attributes:
+        permission_slip_links (ManyToManyField): The links this message
+            notifies the recipient about
+        channel (IntegerField Choice): Whether this is an email or an SMS
+        recipient (CharField): Email address or E.164 phone number the message
+            is delivered to
+        subject (CharField): Email subject line
+        body (TextField): Rendered plain text email body
+        html_body (TextField): Rendered HTML alternative of the body
+        body_hash (CharField): SHA-256 of the rendered body. The body includes
+            the trip details, so this doubles as the trip version.
+        status (IntegerField Choice): Delivery status of the message
+        created (DateTimeField): When the message was queued
+        claimed (DateTimeField): When a worker took the message for delivery
+        sent (DateTimeField): When the message was handed to the mail server
+        batch (CharField): Token of the bulk insert that queued the message,
+            used to read the new rows back
+    """
+    QUEUED = 0
+    SENT = 1
+    FAILED = 2
+    # Claimed by a worker that is sending it right now.
+    SENDING = 3
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+        (SENDING, 'Sending'),
+    )
+
+    EMAIL = 0
+    SMS = 1
+    CHANNEL_CHOICES = (
+        (EMAIL, 'Email'),
+        (SMS, 'SMS'),
+    )
+
+    permission_slip_links = models.ManyToManyField(PermissionSlipLink)
+    channel = models.IntegerField(choices=CHANNEL_CHOICES, default=EMAIL)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    body_hash = models.CharField(max_length=64)
+    status = models.IntegerField(choices=STATUS_CHOICES, default=QUEUED)
+    created = models.DateTimeField(auto_now_add=True)
+    claimed = models.DateTimeField(null=True, blank=True)
+    sent = models.DateTimeField(null=True, blank=True)
+    batch = models.CharField(max_length=32, blank=True, default='')
+
+    @staticmethod
+    def hash_body(body):
+        """Returns the hash stored in `body_hash` for a rendered body."""
+        return sha256(body.encode()).hexdigest()
+
+    def __str__(self):
+        return '{0} ({1})'.format(self.subject, self.recipient)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['channel', 'status', 'id'],
+                         name='outbox_channel_status_idx'),
+            models.Index(fields=['body_hash'], name='outbox_body_hash_idx'),
+        ]
+
+
+class RosterToken(models.Model):
+    """Defines one normalized word of a person's names or email address.
+
+    Together with `RosterTrigram` this is the index behind roster search. The
+    rows are rebuilt from `Student`, `Guardian` and `Faculty` by
+    `paperlesspermission.roster` and must not be edited by hand.
+
+    Attributes:
+        person_type (IntegerField Choice): Model of the person
+        person_pk (IntegerField): Primary key of the person
+        token (CharField): Lower case word without accents
+    """
+    STUDENT = 0
+    GUARDIAN = 1
+    FACULTY = 2
+    PERSON_TYPE_CHOICES = (
+        (STUDENT, 'Student'),
+        (GUARDIAN, 'Guardian'),
+        (FACULTY, 'Faculty'),
+    )
+
+    person_type = models.IntegerField(choices=PERSON_TYPE_CHOICES)
+    person_pk = models.IntegerField()
+    token = models.CharField(max_length=254)
+
+    class Meta:
+        indexes = [
+            # Prefix matches: token LIKE 'term%'.
+            models.Index(fields=['token', 'person_type'], name='roster_token_idx'),
+            models.Index(fields=['person_type', 'person_pk'],
+                         name='roster_token_person_idx'),
+        ]
+
+
+class RosterTrigram(models.Model):
+    """Defines one trigram of a word in `RosterToken`, for fuzzy roster search.
+
+    Trigrams are stored once per distinct word, not per person, so this
+    table only grows with the vocabulary of the roster.
+
+    Attributes:
+        word (CharField): A `RosterToken.token`
+        word_trigrams (IntegerField): Number of trigrams of the word
+        trigram (CharField): Three characters of the padded word
+    """
+    word = models.CharField(max_length=254)
+    word_trigrams = models.IntegerField()
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trigram'], name='roster_trigram_idx'),
+        ]
+
+
+class Profile(models.Model):
+    """Defines a saved profile of one request or Celery task.
+
+    Profiles are only taken on request, see `paperlesspermission.profiling`.
+
+    Attributes:
+        kind (IntegerField Choice): Whether a request or a task was profiled
+        name (CharField): URL name of the request or name of the task
+        description (CharField): Request method and path, or task arguments
+        created (DateTimeField): When the profile was saved
+        duration (FloatField): Seconds the request or task took
+        sql_count (IntegerField): Number of SQL queries run
+        sql_time (FloatField): Seconds spent in the SQL queries
+        report (TextField): Slowest functions and SQL statements, as text
+        stats (BinaryField): The cProfile stats, as written by `dump_stats`
+    """
+    REQUEST = 0
+    TASK = 1
+    KIND_CHOICES = (
+        (REQUEST, 'Request'),
+        (TASK, 'Task'),
+    )
+
+    kind = models.IntegerField(choices=KIND_CHOICES)
+    name = models.CharField(max_length=200)
+    description = models.CharField(max_length=500, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    duration = models.FloatField()
+    sql_count = models.IntegerField()
+    sql_time = models.FloatField()
+    report = models.TextField()
+    stats = models.BinaryField()
+
+    def __str__(self):
+        return '{0} ({1:.0f} ms)'.format(self.name, self.duration * 1000)
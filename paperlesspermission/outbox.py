@@ -0,0 +1,500 @@
+"""Queues and delivers notification emails and SMS through the outbox.
+
+Notifications are never sent straight from the code that generates them.
+Instead they are written to the `OutboundMessage` table and a delivery worker
+drains the table in batches. Because every message records the hash of its
+rendered body, queueing the same notification twice (for example after a
+worker crash part way through a release) is a no-op for every message that was
+already delivered.
+
+Each message belongs to a channel, email or SMS. The channels are drained
+separately so that a release can deliver both at the same time, each at the
+concurrency and rate its gateway allows.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from paperlesspermission import metrics
+from paperlesspermission.bulkmail import send_concurrently
+from paperlesspermission.emails import NotificationRenderer
+from paperlesspermission.models import OutboundMessage, PermissionSlipLink
+from paperlesspermission.sms import SMSMessage, get_sms_connection
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_LEASE_MINUTES = 60
+
+# How far a message got, for picking one of several copies of the same
+# message.
+_STATUS_RANK = {
+    OutboundMessage.FAILED: 0,
+    OutboundMessage.QUEUED: 1,
+    OutboundMessage.SENDING: 2,
+    OutboundMessage.SENT: 3,
+}
+
+
+def get_delivery_connection():
+    """Returns a connection to the backend that actually talks to SMTP.
+
+    `EMAIL_BACKEND` hands messages off to another Celery task, which would
+    make "sent" mean "queued somewhere else". The outbox is drained from a
+    Celery worker already, so it uses the backend djcelery_email would.
+    """
+    backend = getattr(settings, 'CELERY_EMAIL_BACKEND',
+                      'django.core.mail.backends.smtp.EmailBackend')
+    return get_connection(backend)
+
+
+def sms_enabled():
+    """Returns whether SMS notifications are turned on (`SMS_ENABLED`)."""
+    return getattr(settings, 'SMS_ENABLED', False)
+
+
+def enabled_channels():
+    """Returns the channels notifications are currently sent on."""
+    if sms_enabled():
+        return [OutboundMessage.EMAIL, OutboundMessage.SMS]
+    return [OutboundMessage.EMAIL]
+
+
+def queue_slip_notifications(slips, force=False, digest=False):
+    """Queues the notifications for the given slips on every enabled channel.
+
+    Takes the same parameters as `queue_slip_emails`.
+
+    Returns:
+        list: The `OutboundMessage` objects that are now waiting for delivery
+    """
+    slip_links = PermissionSlipLink.objects.filter(permission_slip__in=list(slips))
+    queued = []
+    for channel in enabled_channels():
+        queued.extend(queue_link_messages(slip_links, channel=channel,
+                                          force=force, digest=digest))
+    return queued
+
+
+def queue_slip_emails(slips, force=False, digest=False):
+    """Writes notification emails for the given permission slips to the outbox.
+
+    A message is skipped if one with the same body has already been queued or
+    sent for its links. Failed messages with the same body are queued again
+    instead of being duplicated.
+
+    Parameters:
+        slips (iterable): `PermissionSlip` objects to notify about
+        force (bool): Queue a fresh copy even if an identical message was
+            already sent. Used when staff explicitly ask for a resend.
+        digest (bool): Send each guardian a single message per trip listing
+            all of their students' permission slip links, instead of one
+            message per student.
+
+    Returns:
+        list: The `OutboundMessage` objects that are now waiting for delivery
+    """
+    slip_links = PermissionSlipLink.objects.filter(permission_slip__in=list(slips))
+    return queue_link_messages(slip_links, force=force, digest=digest)
+
+
+@transaction.atomic
+def queue_link_messages(slip_links, channel=OutboundMessage.EMAIL, force=False,
+                        digest=False, reminder=False):
+    """Writes notifications for the given slip links to the outbox.
+
+    See `queue_slip_emails`, which emails every link of a set of slips. SMS
+    are only queued for people with `notify_cell` set.
+
+    Parameters:
+        slip_links (QuerySet): `PermissionSlipLink` objects to notify
+        channel (int): `OutboundMessage.EMAIL` or `OutboundMessage.SMS`
+        force (bool): Queue a fresh copy even if an identical message was
+            already sent
+        digest (bool): Combine a guardian's links on the same trip into one
+            message
+        reminder (bool): Render reminders instead of first notifications
+
+    Returns:
+        list: The `OutboundMessage` objects that are now waiting for delivery
+    """
+    slip_links = slip_links.select_related(
+        'guardian', 'student', 'permission_slip__field_trip',
+        'permission_slip__student'
+    ).order_by('id')
+
+    renderers = _RendererCache(reminder, sms=(channel == OutboundMessage.SMS))
+    if digest:
+        candidates = _digest_candidates(slip_links, renderers)
+    else:
+        candidates = [
+            ([slip_link], renderers.link_email(slip_link))
+            for slip_link in slip_links
+        ]
+    # People who do not want messages on this channel have nothing to send.
+    candidates = [(links, message) for links, message in candidates
+                  if message is not None]
+
+    existing = {}
+    if candidates:
+        rows = OutboundMessage.permission_slip_links.through.objects.filter(
+            permissionsliplink__in=[slip_link
+                                    for links, _ in candidates
+                                    for slip_link in links]
+        )
+        if force:
+            rows = rows.exclude(outboundmessage__status=OutboundMessage.SENT)
+        # A link can hold several copies of a message after a forced resend.
+        # The one that got furthest decides: a failed copy must not hide a
+        # copy the recipient already received.
+        for link_id, body_hash, message_id, status in rows.values_list(
+                'permissionsliplink_id', 'outboundmessage__body_hash',
+                'outboundmessage_id', 'outboundmessage__status'):
+            key = (link_id, body_hash)
+            if (key not in existing or _STATUS_RANK[status] >
+                    _STATUS_RANK[existing[key][1]]):
+                existing[key] = (message_id, status)
+
+    new = []
+    requeue_ids = []
+    for links, email in candidates:
+        body_hash = OutboundMessage.hash_body(email.body)
+        matches = {existing.get((slip_link.id, body_hash)) for slip_link in links}
+        if None not in matches and len(matches) == 1:
+            # This exact message was queued before for every one of its links.
+            message_id, status = matches.pop()
+            if status == OutboundMessage.FAILED:
+                requeue_ids.append(message_id)
+            continue
+        new.append((links, OutboundMessage(
+            channel=channel,
+            recipient=email.recipient,
+            subject=email.subject,
+            body=email.body,
+            html_body=email.html_body,
+            body_hash=body_hash,
+        )))
+
+    queued = []
+    through = OutboundMessage.permission_slip_links.through
+    batch_size = getattr(settings, 'OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    for start in range(0, len(new), batch_size):
+        batch = new[start:start + batch_size]
+        saved = _bulk_create_messages([message for _, message in batch])
+        queued.extend(saved)
+        through.objects.bulk_create([
+            through(outboundmessage_id=message.id, permissionsliplink_id=slip_link.id)
+            for (links, _), message in zip(batch, saved)
+            for slip_link in links
+        ])
+
+    if requeue_ids:
+        OutboundMessage.objects.filter(id__in=requeue_ids).update(
+            status=OutboundMessage.QUEUED)
+
+    LOGGER.info('Queued %s new and %s retried messages.', len(queued),
+                len(requeue_ids))
+    return queued + list(OutboundMessage.objects.filter(id__in=requeue_ids))
+
+
+def _bulk_create_messages(messages):
+    """Inserts `messages` in one query and returns them as saved, in the same
+    order.
+
+    bulk_create does not set primary keys on MariaDB, which the link rows
+    need, so the new rows are read back by a token shared by the batch.
+    """
+    token = uuid.uuid4().hex
+    for message in messages:
+        message.batch = token
+    OutboundMessage.objects.bulk_create(messages)
+    saved = {}
+    # body_hash is indexed; the token tells these rows apart from older
+    # copies of the same message.
+    for message in OutboundMessage.objects.filter(
+            batch=token,
+            body_hash__in={message.body_hash for message in messages},
+    ).order_by('id'):
+        saved.setdefault((message.recipient, message.body_hash), []).append(message)
+    return [saved[(message.recipient, message.body_hash)].pop(0)
+            for message in messages]
+
+
+class _RendererCache():
+    """Keeps one NotificationRenderer per trip while queueing messages."""
+    def __init__(self, reminder=False, sms=False):
+        self.reminder = reminder
+        self.sms = sms
+        self._renderers = {}
+
+    def for_trip(self, trip):
+        if trip.id not in self._renderers:
+            self._renderers[trip.id] = NotificationRenderer(
+                trip, reminder=self.reminder, sms=self.sms)
+        return self._renderers[trip.id]
+
+    def link_email(self, slip_link):
+        permission_slip = slip_link.permission_slip
+        return self.for_trip(permission_slip.field_trip).link_email(
+            slip_link, permission_slip.student)
+
+
+def _digest_candidates(slip_links, renderers):
+    """Groups guardian links by guardian and trip into digest messages.
+
+    Student links, and guardians with a single student on the trip, get the
+    usual per-link message.
+
+    Returns:
+        list: (links, RenderedMessage) tuples. The message is None for
+            people who do not receive messages on the renderers' channel.
+    """
+    candidates = []
+    groups = {}
+    for slip_link in slip_links:
+        if slip_link.guardian_id is None:
+            candidates.append(([slip_link], renderers.link_email(slip_link)))
+        else:
+            key = (slip_link.guardian_id, slip_link.permission_slip.field_trip_id)
+            groups.setdefault(key, []).append(slip_link)
+
+    for links in groups.values():
+        if len(links) == 1:
+            candidates.append((links, renderers.link_email(links[0])))
+            continue
+        renderer = renderers.for_trip(links[0].permission_slip.field_trip)
+        candidates.append(
+            (links, renderer.digest_email(links[0].guardian, links)))
+    return candidates
+
+
+def deliver_queued_messages(batch_size=None, connection=None,
+                            channel=OutboundMessage.EMAIL):
+    """Drains one channel of the outbox in batches, marking each message sent
+    or failed.
+
+    Each batch is claimed in a short transaction that marks its messages
+    `SENDING`, so other workers draining at the same time skip them and no
+    rows stay locked while the batch is sent. Once a batch is done, message
+    statuses, `PermissionSlipLink.last_sent` and the resend claims of failed
+    messages are written in a second short transaction, with one UPDATE
+    each rather than a save per row.
+
+    Each email batch is spread over `EMAIL_SEND_CONCURRENCY` concurrent SMTP
+    sessions, capped at `EMAIL_SEND_RATE` messages per second. SMS batches
+    use `SMS_SEND_CONCURRENCY` and `SMS_SEND_RATE` instead.
+
+    Messages still `SENDING` after `OUTBOX_LEASE_MINUTES` belong to a worker
+    that died mid-batch. Whether they were delivered is unknown, so they are
+    marked failed rather than sent again; queueing them again retries them.
+
+    Parameters:
+        batch_size (int): Number of messages to load per batch. Defaults to
+            the `OUTBOX_BATCH_SIZE` setting.
+        connection: Email (or SMS) backend instance to deliver with. If
+            given, every message is sent over this one connection instead.
+        channel (int): `OutboundMessage.EMAIL` or `OutboundMessage.SMS`
+
+    Returns:
+        tuple: (number of messages sent, number of messages failed)
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    expire_leases(channel)
+    start = time.monotonic()
+    total_sent = 0
+    total_failed = 0
+    channel_name = OutboundMessage(channel=channel).get_channel_display()
+    while True:
+        batch = claim_batch(channel, batch_size)
+        if not batch:
+            break
+
+        if connection is None:
+            sent_ids, failed_ids = _send_batch_concurrently(batch, channel)
+        else:
+            sent_ids, failed_ids = _send_batch(connection, batch)
+
+        with transaction.atomic():
+            now = timezone.now()
+            if sent_ids:
+                OutboundMessage.objects.filter(id__in=sent_ids).update(
+                    status=OutboundMessage.SENT, sent=now)
+                PermissionSlipLink.objects.filter(
+                    outboundmessage__id__in=sent_ids
+                ).update(last_sent=now)
+            if failed_ids:
+                OutboundMessage.objects.filter(id__in=failed_ids).update(
+                    status=OutboundMessage.FAILED)
+                # Staff may try a failed resend again straight away.
+                PermissionSlipLink.objects.filter(
+                    outboundmessage__id__in=failed_ids
+                ).update(resend_requested_at=None)
+
+        total_sent += len(sent_ids)
+        total_failed += len(failed_ids)
+        metrics.MESSAGES.labels(channel_name.lower(), 'sent').inc(len(sent_ids))
+        metrics.MESSAGES.labels(channel_name.lower(), 'failed').inc(len(failed_ids))
+
+    elapsed = time.monotonic() - start
+    LOGGER.info('Outbox drained (%s): %s sent, %s failed in %.2fs (%.1f msg/s).',
+                channel_name, total_sent, total_failed, elapsed,
+                total_sent / elapsed if elapsed else 0.0)
+    return (total_sent, total_failed)
+
+
+@transaction.atomic
+def claim_batch(channel, batch_size):
+    """Marks up to `batch_size` queued messages of a channel `SENDING` and
+    returns them.
+
+    The rows are only locked until this transaction commits. Rows another
+    worker is claiming at the same moment are skipped where the database
+    supports it, and are no longer `QUEUED` once its claim commits.
+    """
+    skip_locked = db_connection.features.has_select_for_update_skip_locked
+    batch = list(OutboundMessage.objects.select_for_update(
+        skip_locked=skip_locked,
+    ).filter(
+        channel=channel,
+        status=OutboundMessage.QUEUED,
+    ).order_by('id')[:batch_size])
+    if batch:
+        OutboundMessage.objects.filter(
+            id__in=[message.id for message in batch]
+        ).update(status=OutboundMessage.SENDING, claimed=timezone.now())
+    return batch
+
+
+def expire_leases(channel):
+    """Marks the messages of a channel failed that have been `SENDING` for
+    longer than `OUTBOX_LEASE_MINUTES`.
+
+    Returns:
+        int: Number of expired messages
+    """
+    lease = datetime.timedelta(
+        minutes=getattr(settings, 'OUTBOX_LEASE_MINUTES', DEFAULT_LEASE_MINUTES))
+    expired_ids = list(OutboundMessage.objects.filter(
+        channel=channel,
+        status=OutboundMessage.SENDING,
+        claimed__lt=timezone.now() - lease,
+    ).values_list('id', flat=True))
+    expired = len(expired_ids)
+    if expired:
+        with transaction.atomic():
+            OutboundMessage.objects.filter(id__in=expired_ids).update(
+                status=OutboundMessage.FAILED)
+            PermissionSlipLink.objects.filter(
+                outboundmessage__id__in=expired_ids
+            ).update(resend_requested_at=None)
+    if expired:
+        LOGGER.warning('%s outbound messages were abandoned while sending and '
+                       'are marked failed; they may have been delivered.',
+                       expired)
+    return expired
+
+
+def _as_email(message):
+    email = EmailMultiAlternatives(message.subject, message.body,
+                                   getattr(settings, 'EMAIL_FROM_ADDRESS'),
+                                   [message.recipient])
+    if message.html_body:
+        email.attach_alternative(message.html_body, 'text/html')
+    return email
+
+
+def _as_message(message):
+    if message.channel == OutboundMessage.SMS:
+        return SMSMessage(message.body, [message.recipient])
+    return _as_email(message)
+
+
+def _send_batch_concurrently(batch, channel=OutboundMessage.EMAIL):
+    """Sends one batch of messages over several concurrent sessions.
+
+    Returns:
+        tuple: (list of sent message ids, list of failed message ids)
+    """
+    if channel == OutboundMessage.SMS:
+        connection_factory = get_sms_connection
+        sessions = getattr(settings, 'SMS_SEND_CONCURRENCY', 1)
+        rate = getattr(settings, 'SMS_SEND_RATE', None)
+    else:
+        connection_factory = get_delivery_connection
+        sessions = getattr(settings, 'EMAIL_SEND_CONCURRENCY', 1)
+        rate = getattr(settings, 'EMAIL_SEND_RATE', None)
+    report = send_concurrently(
+        [_as_message(message) for message in batch],
+        connection_factory,
+        sessions=sessions,
+        rate=rate,
+    )
+    sent_ids = []
+    failed_ids = []
+    for message, result in zip(batch, report.results):
+        if result is True:
+            sent_ids.append(message.id)
+        else:
+            LOGGER.error('Failed to send outbound message id=%s: %r',
+                         message.id, result)
+            failed_ids.append(message.id)
+    return (sent_ids, failed_ids)
+
+
+def _send_batch(connection, batch):
+    """Sends one batch of messages over a single connection.
+
+    Returns:
+        tuple: (list of sent message ids, list of failed message ids)
+    """
+    sent_ids = []
+    failed_ids = []
+
+    try:
+        connection.open()
+    except Exception:  # pylint: disable=broad-except
+        LOGGER.exception('Could not open mail connection, batch failed.')
+        return ([], [message.id for message in batch])
+
+    try:
+        for message in batch:
+            try:
+                sent = connection.send_messages([_as_message(message)])
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Failed to send outbound message id=%s',
+                                 message.id)
+                failed_ids.append(message.id)
+            else:
+                if sent:
+                    sent_ids.append(message.id)
+                else:
+                    LOGGER.error('Backend did not send outbound message id=%s',
+                                 message.id)
+                    failed_ids.append(message.id)
+    finally:
+        connection.close()
+
+    return (sent_ids, failed_ids)
@@ -0,0 +1,250 @@
+"""Opt-in profiles of single requests and Celery tasks.
+
+A profile holds a cProfile run of the request or task together with a
+summary of its SQL statements, and is saved as a `Profile` which staff can
+read and download (as a `.prof` file for pstats or snakeviz) in the admin.
+
+Requests are profiled when a staff user adds a `profile` query parameter or
+an `X-Profile` header to them, and `PROFILING_ENABLED` is set. Views
+queueing Celery tasks pass the request on to those tasks through
+`task_options`, so profiling a DJO import or a trip release also profiles
+the background work.
+
+Celery tasks are profiled when they are queued with a `profile` header:
+
+    async_generate_permission_slips.apply_async(
+        (trip.id,), headers={'profile': True})
+
+or when their name is listed in the `PROFILE_TASKS` setting (or
+environment variable), which profiles every run of them.
+
+Only the thread running the request or task is profiled; the concurrent
+SMTP sessions of the outbox are not. Profiles do not nest: a task run
+eagerly inside a profiled request is part of the request's profile.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from contextlib import ExitStack
+import cProfile
+from io import StringIO
+import logging
+import marshal
+import pstats
+import threading
+import time
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.urls import reverse
+
+from paperlesspermission.models import Profile
+
+LOGGER = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'profile'
+
+DEFAULT_TOP_FUNCTIONS = 40
+DEFAULT_TOP_QUERIES = 20
+DEFAULT_KEEP = 100
+
+_local = threading.local()
+
+
+class SQLSummary():
+    """Database execute wrapper adding up the time of each distinct SQL
+    statement."""
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        # {sql: [executions, seconds]}
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.time += duration
+            totals = self.statements.setdefault(sql, [0, 0.0])
+            totals[0] += 1
+            totals[1] += duration
+
+    def report(self, limit=DEFAULT_TOP_QUERIES):
+        """Returns the statements taking the most time, as text."""
+        lines = ['{0} queries in {1:.1f} ms, {2} distinct statements.'.format(
+            self.count, self.time * 1000, len(self.statements))]
+        statements = sorted(self.statements.items(),
+                            key=lambda item: item[1][1], reverse=True)
+        for sql, (count, seconds) in statements[:limit]:
+            lines.append('{0:10.1f} ms {1:6}x  {2}'.format(seconds * 1000,
+                                                          count, sql))
+        return '\n'.join(lines)
+
+
+class Profiler():
+    """Profiles the code run in its `with` block on the current thread.
+
+    Does nothing if another profile is already running on the thread, in
+    which case `active` is False.
+    """
+    def __init__(self):
+        self.active = False
+        self.duration = 0.0
+        self.sql = SQLSummary()
+        self.profile = cProfile.Profile()
+        self._stack = ExitStack()
+        self._start = None
+
+    def __enter__(self):
+        if getattr(_local, 'profiling', False):
+            return self
+        _local.profiling = True
+        self.active = True
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self.sql))
+        self._start = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.active:
+            return
+        self.profile.disable()
+        self.duration = time.perf_counter() - self._start
+        self._stack.close()
+        _local.profiling = False
+
+    def report(self):
+        """Returns the functions taking the most time followed by the SQL
+        summary, as text."""
+        stream = StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(
+            getattr(settings, 'PROFILING_TOP_FUNCTIONS', DEFAULT_TOP_FUNCTIONS))
+        return '{0}\n\nSQL\n\n{1}'.format(
+            stream.getvalue().strip(),
+            self.sql.report(getattr(settings, 'PROFILING_TOP_QUERIES',
+                                    DEFAULT_TOP_QUERIES)))
+
+    def stats(self):
+        """Returns the profile in the `.prof` format read by pstats."""
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+    def save(self, kind, name, description):
+        """Saves the profile as a `Profile`, dropping the oldest ones beyond
+        `PROFILING_KEEP`."""
+        profile = Profile.objects.create(
+            kind=kind,
+            name=name[:200],
+            description=description[:500],
+            duration=self.duration,
+            sql_count=self.sql.count,
+            sql_time=self.sql.time,
+            report=self.report(),
+            stats=self.stats(),
+        )
+        keep = getattr(settings, 'PROFILING_KEEP', DEFAULT_KEEP)
+        old_ids = Profile.objects.order_by('-id').values_list(
+            'id', flat=True)[keep:]
+        Profile.objects.filter(id__in=list(old_ids)).delete()
+        LOGGER.info('Saved profile %s of %s (%.0f ms).', profile.id, name,
+                    self.duration * 1000)
+        return profile
+
+
+def requested(request):
+    """Returns whether a staff user asked for a request to be profiled."""
+    if not getattr(settings, 'PROFILING_ENABLED', False):
+        return False
+    if 'profile' not in request.GET and 'HTTP_X_PROFILE' not in request.META:
+        return False
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def task_options(request):
+    """Returns the `apply_async` options profiling the tasks queued by a
+    request if the request is profiled."""
+    if requested(request):
+        return {'headers': {PROFILE_HEADER: True}}
+    return {}
+
+
+class ProfilingMiddleware():
+    """Profiles the requests staff ask to be profiled.
+
+    Enabled by the `PROFILING_ENABLED` setting. Must come after
+    `AuthenticationMiddleware` in `MIDDLEWARE`. The saved profile is linked
+    from the `X-Profile-URL` header of the response.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not requested(request):
+            return self.get_response(request)
+
+        with Profiler() as profiler:
+            response = self.get_response(request)
+        if profiler.active:
+            match = getattr(request, 'resolver_match', None)
+            profile = profiler.save(
+                Profile.REQUEST,
+                match.view_name if match else request.path,
+                '{0} {1}'.format(request.method, request.get_full_path()))
+            response['X-Profile-URL'] = reverse(
+                'admin:paperlesspermission_profile_change', args=[profile.id])
+        return response
+
+
+def _profile_requested(task):
+    if task.name in getattr(settings, 'PROFILE_TASKS', ()):
+        return True
+    # Worker requests carry custom headers as attributes, eager ones only
+    # in `headers`.
+    return bool(task.request.get(PROFILE_HEADER) or
+                (task.request.headers or {}).get(PROFILE_HEADER))
+
+
+_task_profilers = {}
+
+
+@task_prerun.connect
+def _task_started(task_id=None, task=None, **kwargs):
+    # pylint: disable=unused-argument
+    if _profile_requested(task):
+        profiler = Profiler()
+        profiler.__enter__()
+        _task_profilers[task_id] = profiler
+
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, args=None, kwargs=None, **extra):
+    # pylint: disable=unused-argument
+    if task_id not in _task_profilers:
+        return
+    profiler = _task_profilers.pop(task_id)
+    profiler.__exit__(None, None, None)
+    if profiler.active:
+        profiler.save(Profile.TASK, task.name,
+                      'args={0!r} kwargs={1!r}'.format(args, kwargs))
@@ -0,0 +1,106 @@
+"""Finds incomplete permission slips that are due soon and reminds people.
+
+`queue_reminders` is run every day by celery beat (see `CELERY_BEAT_SCHEDULE`
+in settings.py). For each released trip with slips due within
+`REMINDER_DAYS_BEFORE_DUE` days, a single query picks the links whose person
+still has to sign: the student's link if the student has not signed, and the
+guardians' links if no guardian has signed. Links that were emailed within
+the last `REMINDER_COOLDOWN_HOURS` hours are left alone.
+
+Reminders go through the outbox like every other notification, so they are
+also sent by SMS when that is enabled, and `PermissionSlipLink.last_sent` is
+updated in bulk once they are delivered.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.db.models import DateField, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from paperlesspermission.models import (FieldTrip, PermissionSlip,
+                                        PermissionSlipLink)
+from paperlesspermission.outbox import enabled_channels, queue_link_messages
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DAYS_BEFORE_DUE = 3
+DEFAULT_COOLDOWN_HOURS = 48
+
+
+def _reminder_window(now):
+    today = timezone.localdate(now)
+    days = getattr(settings, 'REMINDER_DAYS_BEFORE_DUE', DEFAULT_DAYS_BEFORE_DUE)
+    return (today, today + timedelta(days=days))
+
+
+def trips_due_soon(now=None):
+    """Returns released trips with permission slips due in the reminder window.
+
+    A slip's own due date overrides the trip's, so a trip also counts if any
+    one of its slips is due soon.
+    """
+    window = _reminder_window(now or timezone.now())
+    return FieldTrip.objects.filter(
+        Q(due_date__range=window) | Q(permissionslip__due_date__range=window),
+        status=FieldTrip.RELEASED,
+    ).distinct()
+
+
+def links_needing_reminder(trip, now=None):
+    """Returns the links of `trip` whose person still has to sign, is due
+    soon and has not been emailed within the cool-down."""
+    now = now or timezone.now()
+    cooldown = getattr(settings, 'REMINDER_COOLDOWN_HOURS', DEFAULT_COOLDOWN_HOURS)
+    return PermissionSlipLink.objects.annotate(
+        due=Coalesce('permission_slip__due_date',
+                     Value(trip.due_date, output_field=DateField())),
+    ).filter(
+        Q(student__isnull=False,
+          permission_slip__status__in=(PermissionSlip.NONE,
+                                       PermissionSlip.GUARDIAN))
+        | Q(guardian__isnull=False,
+            permission_slip__status__in=(PermissionSlip.NONE,
+                                         PermissionSlip.STUDENT)),
+        Q(last_sent__isnull=True) | Q(last_sent__lt=now - timedelta(hours=cooldown)),
+        permission_slip__field_trip=trip,
+        due__range=_reminder_window(now),
+    )
+
+
+def queue_reminders(now=None):
+    """Queues reminders for every incomplete slip that is due soon.
+
+    Returns:
+        list: The `OutboundMessage` objects that are now waiting for delivery
+    """
+    digest = getattr(settings, 'EMAIL_GUARDIAN_DIGEST', False)
+    queued = []
+    for trip in trips_due_soon(now):
+        # An earlier reminder with the same text was already delivered, so
+        # force is needed to send another one once the cool-down is over.
+        slip_links = links_needing_reminder(trip, now)
+        trip_queued = []
+        for channel in enabled_channels():
+            trip_queued.extend(queue_link_messages(
+                slip_links, channel=channel, force=True, digest=digest,
+                reminder=True))
+        LOGGER.info('Queued %s reminders for %s.', len(trip_queued), trip)
+        queued.extend(trip_queued)
+    return queued
@@ -0,0 +1,262 @@
+"""Searches students, guardians and faculty by name.
+
+Names are split into normalized words (lower case, accents removed) and
+stored in `RosterToken`, one row per word. The words come from the first,
+last and preferred names and the local part of the email address. Each word
+of the roster is also split into trigrams in `RosterTrigram`, which finds
+people when a name is misspelled.
+
+A search term matches a person if every word of the term starts one of the
+person's words. A word that starts nobody's words is treated as misspelled
+and matches the words it shares enough trigrams with. Both lookups are
+answered by an index, so searching does not scan the person tables the way
+`icontains` does. Exact words rank above prefixes, which rank above
+misspellings.
+
+The index is rebuilt by `rebuild` at the end of every `DJOImport.import_all`
+run, so people added in between are found after the next import.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from paperlesspermission.models import (Faculty, Guardian, RosterToken,
+                                        RosterTrigram, Student)
+
+LOGGER = logging.getLogger(__name__)
+
+PERSON_TYPES = {
+    Student: RosterToken.STUDENT,
+    Guardian: RosterToken.GUARDIAN,
+    Faculty: RosterToken.FACULTY,
+}
+
+# Minimum trigram similarity of a misspelled word, as in pg_trgm.
+SIMILARITY_THRESHOLD = 0.3
+
+# Words shorter than this are never treated as misspelled.
+MIN_TRIGRAM_WORD_LENGTH = 3
+
+BATCH_SIZE = 1000
+
+# Most people filter_queryset narrows a queryset down to.
+FILTER_LIMIT = 100
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """Returns the lower case, accent free words of `text`."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [word for word in _NON_WORD.split(text.lower()) if word]
+
+
+def trigrams(word):
+    """Returns the trigrams of `word`, padded like PostgreSQL's pg_trgm."""
+    padded = '  {0} '.format(word)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def person_words(person):
+    """Returns the set of words `person` can be found by."""
+    words = set()
+    for name in (person.first_name, person.last_name,
+                 getattr(person, 'preferred_name', None)):
+        words.update(normalize(name))
+    local_part = (person.email or '').split('@')[0]
+    local_words = normalize(local_part)
+    words.update(local_words)
+    # "mark.stenglein" can also be searched for as "markstenglein".
+    if len(local_words) > 1:
+        words.add(''.join(local_words))
+    return words
+
+
+@transaction.atomic
+def rebuild(models=None):
+    """Rebuilds the roster search index.
+
+    Parameters:
+        models (iterable): `Student`, `Guardian` and/or `Faculty`. Defaults to
+            all three.
+
+    Returns:
+        int: Number of people indexed
+    """
+    indexed = 0
+    for model in models or PERSON_TYPES:
+        person_type = PERSON_TYPES[model]
+        RosterToken.objects.filter(person_type=person_type).delete()
+
+        fields = ['id', 'first_name', 'last_name', 'email']
+        if model is Faculty:
+            fields.append('preferred_name')
+        tokens = []
+        for person in model.objects.only(*fields).iterator(chunk_size=BATCH_SIZE):
+            tokens.extend(RosterToken(person_type=person_type, person_pk=person.id,
+                                      token=word)
+                          for word in person_words(person))
+            indexed += 1
+            if len(tokens) >= BATCH_SIZE:
+                RosterToken.objects.bulk_create(tokens)
+                tokens = []
+        RosterToken.objects.bulk_create(tokens)
+
+    # The trigrams cover the words of every person type, so they are rebuilt
+    # from all tokens.
+    RosterTrigram.objects.all().delete()
+    grams = []
+    words = RosterToken.objects.values_list('token', flat=True).distinct()
+    for word in words.iterator(chunk_size=BATCH_SIZE):
+        word_grams = trigrams(word)
+        grams.extend(RosterTrigram(word=word, word_trigrams=len(word_grams),
+                                   trigram=gram)
+                     for gram in word_grams)
+        if len(grams) >= BATCH_SIZE:
+            RosterTrigram.objects.bulk_create(grams)
+            grams = []
+    RosterTrigram.objects.bulk_create(grams)
+
+    LOGGER.info('Roster search index rebuilt for %s people.', indexed)
+    return indexed
+
+
+def similar_words(word):
+    """Returns {word: similarity} for the indexed words that share enough
+    trigrams with `word`.
+
+    Similarity is the number of shared trigrams over the number of distinct
+    trigrams of both words, like PostgreSQL's pg_trgm `similarity()`.
+    """
+    word_grams = trigrams(word)
+    shared_counts = RosterTrigram.objects.filter(
+        trigram__in=word_grams,
+    ).values('word', 'word_trigrams').annotate(
+        shared=Count('id'),
+    ).values_list('word', 'word_trigrams', 'shared')
+    similar = {}
+    for other, other_trigrams, shared in shared_counts:
+        similarity = shared / (len(word_grams) + other_trigrams - shared)
+        if similarity >= SIMILARITY_THRESHOLD:
+            similar[other] = similarity
+    return similar
+
+
+def _word_scores(person_type, word, candidates=None):
+    """Returns {person_pk: score} for the people matching one search word.
+
+    People whose words start with `word` match, and score higher if one of
+    their words is exactly `word`. Only if nobody matches that way are
+    misspellings looked for through the trigrams. If given, only the people
+    whose primary key is in the `candidates` subquery are scored.
+    """
+    scores = {}
+    tokens = RosterToken.objects.filter(person_type=person_type)
+    if candidates is not None:
+        tokens = tokens.filter(person_pk__in=candidates)
+    # Tokens are lower case already. Unlike `startswith`, which is a LIKE
+    # BINARY on MariaDB, `istartswith` compares in the column's collation and
+    # so can use roster_token_idx.
+    prefixed = tokens.filter(
+        token__istartswith=word,
+    ).values_list('person_pk', 'token')
+    for person_pk, token in prefixed:
+        score = 2 if token == word else 1
+        scores[person_pk] = max(score, scores.get(person_pk, 0))
+    if scores or len(word) < MIN_TRIGRAM_WORD_LENGTH:
+        return scores
+
+    similar = similar_words(word)
+    if not similar:
+        return scores
+    fuzzy = tokens.filter(
+        token__in=similar,
+    ).values_list('person_pk', 'token')
+    for person_pk, token in fuzzy:
+        scores[person_pk] = max(similar[token], scores.get(person_pk, 0))
+    return scores
+
+
+def search_pks(model, term, queryset=None):
+    """Returns the primary keys of the people of `model` matching `term`,
+    best matches first.
+
+    Parameters:
+        model (Model): `Student`, `Guardian` or `Faculty`
+        term (str): What the user typed
+        queryset (QuerySet): Only people in it are matched, for instance
+            those that are not hidden. Defaults to every person of `model`.
+
+    Returns:
+        list: Primary keys, or None if `term` has no words to search for
+    """
+    words = normalize(term)
+    if not words:
+        return None
+    person_type = PERSON_TYPES[model]
+    candidates = queryset.values('pk') if queryset is not None else None
+    totals = None
+    # Longer words are more selective, so they are looked up first.
+    for word in sorted(set(words), key=len, reverse=True):
+        scores = _word_scores(person_type, word, candidates)
+        if totals is None:
+            totals = scores
+        else:
+            totals = {person_pk: totals[person_pk] + score
+                      for person_pk, score in scores.items()
+                      if person_pk in totals}
+        if not totals:
+            return []
+    return sorted(totals, key=lambda person_pk: (-totals[person_pk], person_pk))
+
+
+def search(model, term, limit=25):
+    """Returns up to `limit` people of `model` matching `term`, best matches
+    first. An empty term matches nobody."""
+    pks = (search_pks(model, term) or [])[:limit]
+    people = model.objects.in_bulk(pks)
+    return [people[pk] for pk in pks if pk in people]
+
+
+def filter_queryset(queryset, term, limit=FILTER_LIMIT):
+    """Narrows a queryset of people down to the `limit` best matches of
+    `term` in it, ordered best first. An empty term leaves it unchanged.
+
+    The first letters typed into a picker match most of the roster, so only
+    the best matches are kept rather than filtering on thousands of ids.
+    Pass `limit=None` to keep every match; only the first `FILTER_LIMIT` of
+    them are then ordered by rank, the rest follow by primary key.
+    """
+    pks = search_pks(queryset.model, term, queryset)
+    if pks is None:
+        return queryset
+    if limit is not None:
+        pks = pks[:limit]
+    if not pks:
+        return queryset.none()
+    ranked = pks[:FILTER_LIMIT]
+    rank = Case(*[When(pk=pk, then=Value(position))
+                  for position, pk in enumerate(ranked)],
+                default=Value(len(ranked)), output_field=IntegerField())
+    return queryset.filter(pk__in=pks).order_by(rank, 'pk')
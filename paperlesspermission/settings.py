@@ -27,6 +27,7 @@ limitations under the License.
 import os
 import ldap
 import environ
+from celery.schedules import crontab
 from django_auth_ldap.config import (LDAPSearch, LDAPSearchUnion,
                                      LDAPGroupQuery, NestedMemberDNGroupType)
 import logging.config
@@ -75,7 +76,12 @@ env = environ.Env(
     DJANGO_HTTPS=(bool, True),
     DJANGO_HOST=(str, ''),
     DJANGO_PORT=(str, ''),
-    DJANGO_ALLOWED_HOSTS=(str, '')
+    DJANGO_ALLOWED_HOSTS=(str, ''),
+    METRICS_ENABLED=(bool, False),
+    METRICS_TOKEN=(str, ''),
+    METRICS_WORKER_PORT=(int, 0),
+    PROFILING_ENABLED=(bool, False),
+    PROFILE_TASKS=(list, [])
 )
 environ.Env.read_env()
 
@@ -108,7 +114,7 @@ ALLOWED_HOSTS = env('DJANGO_ALLOWED_HOSTS').split(' ')
 # Application definition
 
 INSTALLED_APPS = [
-    'paperlesspermission',
+    'paperlesspermission.apps.PaperlessPermissionConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -125,11 +131,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'paperlesspermission.middleware.RequestTimingMiddleware',
+    'paperlesspermission.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'paperlesspermission.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.contrib.admindocs.middleware.XViewMiddleware',
@@ -299,6 +308,14 @@ CELERY_BROKER_HOST = env('CELERY_BROKER_HOST')
 CELERY_BROKER_PORT = env('CELERY_BROKER_PORT')
 CELERY_BROKER_VHOST = env('CELERY_BROKER_VHOST')
 
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'send-reminders': {
+        'task': 'paperlesspermission.tasks.async_send_reminders',
+        'schedule': crontab(hour=7, minute=0),
+    },
+}
+
 DJO_SFTP_HOST = env('DJO_SFTP_HOST')
 DJO_SFTP_USER = env('DJO_SFTP_USER')
 DJO_SFTP_PASS = env('DJO_SFTP_PASS')
@@ -307,6 +324,7 @@ DJO_SFTP_FINGERPRINT = env('DJO_SFTP_FINGERPRINT')
 
 EMAIL_HOST = env('EMAIL_HOST')
 EMAIL_PORT = env('EMAIL_PORT')
+EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = env('EMAIL_USE_TLS')
 EMAIL_USE_SSL = env('EMAIL_USE_SSL')
@@ -314,4 +332,74 @@ EMAIL_USE_SSL = env('EMAIL_USE_SSL')
 EMAIL_SSL_KEYFILE = env('EMAIL_SSL_KEYFILE')
 EMAIL_SSL_CERTFILE = env('EMAIL_SSL_CERTFILE')
 EMAIL_BACKEND = 'djcelery_email.backends.CeleryEmailBackend'
+CELERY_EMAIL_BACKEND = 'paperlesspermission.mail.PooledEmailBackend'
 EMAIL_FROM_ADDRESS = env('EMAIL_FROM_ADDRESS')
+
+# Send guardians one notification per trip covering all of their students.
+EMAIL_GUARDIAN_DIGEST = True
+
+# Number of outbox messages loaded and sent per database batch.
+OUTBOX_BATCH_SIZE = 500
+# Messages claimed by a worker that have not been sent after this many
+# minutes are marked failed, as the worker must have died while sending them.
+OUTBOX_LEASE_MINUTES = 60
+# Concurrent SMTP sessions used to send each batch (see bulkmail.py), and the
+# maximum messages per second across all of them (0 for no limit).
+EMAIL_SEND_CONCURRENCY = 4
+EMAIL_SEND_RATE = 0
+
+# SMTP connection pool used by the Celery workers (see mail.py).
+EMAIL_POOL_SIZE = 4
+EMAIL_POOL_MAX_MESSAGES = 500
+EMAIL_POOL_CHECK_AFTER = 30
+
+# Text message notifications for people with notify_cell set (see sms.py).
+# SMS_BACKEND must point at a gateway backend before enabling them.
+SMS_ENABLED = False
+SMS_BACKEND = 'paperlesspermission.sms.ConsoleSMSBackend'
+SMS_FILE_PATH = os.path.join(BASE_DIR, 'sms-messages.log')
+# Concurrent gateway sessions, and maximum messages per second (0 for no
+# limit). Most gateways enforce a per-account rate.
+SMS_SEND_CONCURRENCY = 2
+SMS_SEND_RATE = 1
+
+# Remind people who still have to sign a slip due within this many days, at
+# most once per cool-down period.
+REMINDER_DAYS_BEFORE_DUE = 3
+REMINDER_COOLDOWN_HOURS = 48
+
+# Staff may not resend a permission slip sent within this many minutes.
+RESEND_COOLDOWN_MINUTES = 15
+
+# Permission slips loaded from the database at a time by the CSV export.
+EXPORT_CHUNK_SIZE = 2000
+
+# Seconds the data of a public permission slip page stays cached. Signing or
+# resetting a slip and editing its trip invalidate the cache immediately.
+SLIP_PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Per-request timing (see middleware.py): adds Server-Timing headers and logs
+# one line per request. Requests slower than REQUEST_SLOW_MS are logged with
+# their REQUEST_SLOW_QUERIES slowest SQL statements, for a
+# REQUEST_SLOW_SAMPLE_RATE share (0 to 1) of them.
+REQUEST_TIMING_ENABLED = False
+REQUEST_SLOW_MS = 1000
+REQUEST_SLOW_SAMPLE_RATE = 1.0
+REQUEST_SLOW_QUERIES = 5
+
+# Prometheus metrics (see metrics.py), served at /metrics/ to staff and to
+# requests with an `Authorization: Bearer <METRICS_TOKEN>` header. Celery
+# workers serve theirs over HTTP on METRICS_WORKER_PORT when it is set.
+METRICS_ENABLED = env('METRICS_ENABLED')
+METRICS_TOKEN = env('METRICS_TOKEN')
+METRICS_WORKER_PORT = env('METRICS_WORKER_PORT')
+
+# Profiling (see profiling.py). When enabled, staff can profile a request by
+# adding `?profile=1` or an X-Profile header, which also profiles the tasks it
+# queues. Every run of the tasks named in PROFILE_TASKS is profiled. Profiles
+# are listed in the admin; only the newest PROFILING_KEEP are kept.
+PROFILING_ENABLED = env('PROFILING_ENABLED')
+PROFILE_TASKS = env('PROFILE_TASKS')
+PROFILING_KEEP = 100
+PROFILING_TOP_FUNCTIONS = 40
+PROFILING_TOP_QUERIES = 20
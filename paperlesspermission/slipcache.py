@@ -0,0 +1,185 @@
+"""Caches the context of public permission slip pages.
+
+People often open the same slip link several times, so the data shown on a
+slip page is cached per `link_id` in the default cache (memcached in
+production). Only the data is cached. The form and CSRF token are still made
+for each request, so cached pages are not shared between visitors.
+
+Entries are invalidated with generation tokens. Each permission slip and each
+field trip has a token in the cache, and a cached page is only used while
+both tokens still match the ones it was stored with. Saving a `PermissionSlip`
+or a `FieldTrip` replaces its token (see `invalidate_slip` and
+`invalidate_trip`), which invalidates every page of that slip or trip without
+having to know their link ids. A page hit therefore takes two cache round
+trips and no database queries.
+
+The tokens a page is stored with are read before its data is loaded from
+the database (see `page_tokens`), so a signature saved while the page is
+being loaded leaves a page that is never used rather than a stale one. This
+needs the ids of the link's slip and trip, which are remembered from the
+first time the link is loaded; that first load is not cached.
+
+Names of students and guardians are also shown on the page but are not
+tracked, so entries expire after `SLIP_PAGE_CACHE_TIMEOUT` seconds.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULT_TIMEOUT = 60 * 60
+
+# Bump whenever the data cached for a page changes shape, so that entries
+# stored by an older release are not used.
+PAGE_VERSION = 2
+
+HITS_KEY = 'slip-page:hits'
+MISSES_KEY = 'slip-page:misses'
+
+
+def _page_key(link_id):
+    return 'slip-page:link:{0}'.format(link_id)
+
+
+def _slip_key(slip_id):
+    return 'slip-page:slip:{0}'.format(slip_id)
+
+
+def _trip_key(trip_id):
+    return 'slip-page:trip:{0}'.format(trip_id)
+
+
+def _ids_key(link_id):
+    return 'slip-page:ids:{0}'.format(link_id)
+
+
+def _count(key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was evicted between add() and incr().
+        pass
+
+
+def get_page(link_id):
+    """Returns the cached context of a slip page, or None on a miss."""
+    entry = cache.get(_page_key(link_id), version=PAGE_VERSION)
+    if entry is not None:
+        slip_key = _slip_key(entry['slip_id'])
+        trip_key = _trip_key(entry['trip_id'])
+        tokens = cache.get_many([slip_key, trip_key])
+        if (tokens.get(slip_key) == entry['slip_token']
+                and tokens.get(trip_key) == entry['trip_token']):
+            _count(HITS_KEY)
+            return entry['context']
+    _count(MISSES_KEY)
+    return None
+
+
+def page_tokens(link_id):
+    """Returns the current tokens of the slip page of `link_id`, creating
+    them if needed. Must be called before the page data is loaded from the
+    database, and the result passed on to `set_page`.
+
+    Returns:
+        dict: Slip and trip ids and tokens, or None if the ids of the link
+            are not known yet
+    """
+    ids = cache.get(_ids_key(link_id))
+    if ids is None:
+        return None
+    slip_id, trip_id = ids
+    slip_key = _slip_key(slip_id)
+    trip_key = _trip_key(trip_id)
+    # add() keeps tokens another process has set in the meantime.
+    cache.add(slip_key, uuid.uuid4().hex, None)
+    cache.add(trip_key, uuid.uuid4().hex, None)
+    tokens = cache.get_many([slip_key, trip_key])
+    if slip_key not in tokens or trip_key not in tokens:
+        return None
+    return {
+        'slip_id': slip_id,
+        'trip_id': trip_id,
+        'slip_token': tokens[slip_key],
+        'trip_token': tokens[trip_key],
+    }
+
+
+def set_page(link_id, slip_id, trip_id, context, tokens):
+    """Caches the context of the slip page of `link_id`, unless its slip or
+    trip changed since `tokens` were read.
+
+    Parameters:
+        link_id (str): Link the page was loaded through
+        slip_id (int): Id of the page's `PermissionSlip`
+        trip_id (int): Id of the page's `FieldTrip`
+        context (dict): Picklable template context of the page
+        tokens (dict): What `page_tokens` returned before the page was loaded
+    """
+    # A link always belongs to the same slip, and a slip to the same trip.
+    cache.add(_ids_key(link_id), (slip_id, trip_id), None)
+    if (tokens is None or tokens['slip_id'] != slip_id
+            or tokens['trip_id'] != trip_id):
+        return
+    slip_key = _slip_key(slip_id)
+    trip_key = _trip_key(trip_id)
+    current = cache.get_many([slip_key, trip_key])
+    if (current.get(slip_key) != tokens['slip_token']
+            or current.get(trip_key) != tokens['trip_token']):
+        return
+    cache.set(_page_key(link_id), dict(tokens, context=context),
+              getattr(settings, 'SLIP_PAGE_CACHE_TIMEOUT', DEFAULT_TIMEOUT),
+              version=PAGE_VERSION)
+
+
+def _invalidate(key):
+    cache.set(key, uuid.uuid4().hex, None)
+    # A page rendered by another request before this transaction commits
+    # could be cached with the new token, so replace it again afterwards.
+    transaction.on_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
+
+
+def invalidate_slip(slip_id):
+    """Invalidates the cached pages of one permission slip."""
+    _invalidate(_slip_key(slip_id))
+
+
+def invalidate_trip(trip_id):
+    """Invalidates the cached pages of every permission slip of a trip."""
+    _invalidate(_trip_key(trip_id))
+
+
+def stats():
+    """Returns the page cache hits, misses and hit rate since the counters
+    were last reset."""
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counts.get(HITS_KEY, 0)
+    misses = counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    """Resets the hit and miss counters."""
+    cache.delete_many([HITS_KEY, MISSES_KEY])
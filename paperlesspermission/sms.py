@@ -0,0 +1,138 @@
+"""Defines the SMS message type and the pluggable SMS gateway backends.
+
+SMS backends follow the shape of Django's email backends: `open()`,
+`close()` and `send_messages(messages)`, which returns the number of messages
+sent. That lets `bulkmail.send_concurrently` drive SMS sessions exactly like
+SMTP sessions.
+
+The backend is chosen with the `SMS_BACKEND` setting. This module ships
+stand-ins for development and tests: `ConsoleSMSBackend`, `FileSMSBackend`
+(writes to `SMS_FILE_PATH`) and `LocMemSMSBackend` (collects messages in
+`paperlesspermission.sms.outbox`). A real gateway is plugged in by subclassing
+`BaseSMSBackend`.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Messages sent through LocMemSMSBackend, like django.core.mail.outbox.
+outbox = []
+
+
+class SMSMessage():
+    """A text message to one or more phone numbers.
+
+    Attributes:
+        body (str): Text of the message
+        to (list): E.164 formatted phone numbers to send it to
+    """
+    def __init__(self, body, to):
+        self.body = body
+        self.to = list(to)
+
+    def recipients(self):
+        return self.to
+
+
+class BaseSMSBackend():
+    """Base class for SMS gateway backends.
+
+    Subclasses must implement `send_messages`. Gateways that keep a session
+    open should override `open` and `close` as well.
+    """
+    def __init__(self, fail_silently=False, **kwargs):
+        self.fail_silently = fail_silently
+
+    def open(self):
+        """Opens a session with the gateway. Returns True if one was opened."""
+        return False
+
+    def close(self):
+        """Closes the session with the gateway."""
+
+    def send_messages(self, messages):
+        """Sends `SMSMessage` objects and returns the number sent."""
+        raise NotImplementedError(
+            'subclasses of BaseSMSBackend must override send_messages()')
+
+
+class ConsoleSMSBackend(BaseSMSBackend):
+    """Writes messages to a stream (stdout by default) instead of sending."""
+    def __init__(self, *args, stream=None, **kwargs):
+        super(ConsoleSMSBackend, self).__init__(*args, **kwargs)
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def write_message(self, message):
+        self.stream.write('To: {0}\n{1}\n{2}\n'.format(
+            ', '.join(message.to), message.body, '-' * 79))
+
+    def send_messages(self, messages):
+        sent = 0
+        with self._lock:
+            for message in messages:
+                if not message.recipients():
+                    continue
+                self.write_message(message)
+                sent += 1
+            self.stream.flush()
+        return sent
+
+
+class FileSMSBackend(ConsoleSMSBackend):
+    """Appends messages to the file at `SMS_FILE_PATH`."""
+    def __init__(self, *args, file_path=None, **kwargs):
+        self.file_path = file_path or getattr(settings, 'SMS_FILE_PATH')
+        super(FileSMSBackend, self).__init__(*args, **kwargs)
+        self.stream = None
+
+    def open(self):
+        if self.stream is None:
+            self.stream = open(self.file_path, 'a')
+            return True
+        return False
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def send_messages(self, messages):
+        opened = self.open()
+        try:
+            return super(FileSMSBackend, self).send_messages(messages)
+        finally:
+            if opened:
+                self.close()
+
+
+class LocMemSMSBackend(BaseSMSBackend):
+    """Keeps messages in `paperlesspermission.sms.outbox` for tests."""
+    def send_messages(self, messages):
+        sent = [message for message in messages if message.recipients()]
+        outbox.extend(sent)
+        return len(sent)
+
+
+def get_sms_connection(backend=None, fail_silently=False, **kwargs):
+    """Returns an instance of the SMS backend named by `SMS_BACKEND`."""
+    klass = import_string(backend or getattr(
+        settings, 'SMS_BACKEND', 'paperlesspermission.sms.ConsoleSMSBackend'))
+    return klass(fail_silently=fail_silently, **kwargs)
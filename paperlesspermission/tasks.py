@@ -17,14 +17,15 @@ limitations under the License.
 
 from __future__ import absolute_import, unicode_literals
 
-from celery import shared_task
+from celery import group, shared_task
 from celery.utils.log import get_task_logger
 
 from django.conf import settings
-from django.core.mail import send_mass_mail
 
 from .djo import DJOImport
-from .models import FieldTrip, PermissionSlip, PermissionSlipLink
+from .models import FieldTrip, OutboundMessage, PermissionSlip, PermissionSlipLink
+from .outbox import enabled_channels, queue_slip_notifications, deliver_queued_messages
+from .reminders import queue_reminders
 
 LOGGER = get_task_logger(__name__)
 
@@ -57,21 +58,59 @@ def async_generate_permission_slips(field_trip_id, notify=False):
         async_initial_trip_notifications.delay(field_trip_id)
 
 @shared_task
-def async_initial_trip_notifications(field_trip_id):
-    """ Send trip notification emails. """
+def async_initial_trip_notifications(field_trip_id, digest=None):
+    """ Send trip notification emails, and SMS if they are enabled.
+
+    With `digest` (which defaults to the EMAIL_GUARDIAN_DIGEST setting),
+    guardians receive one message listing all of their students' slips. """
+    if digest is None:
+        digest = getattr(settings, 'EMAIL_GUARDIAN_DIGEST', False)
     # Fetch the field trip
     trip = FieldTrip.objects.get(id=field_trip_id)
     # Fetch all the permission slips
     slips = PermissionSlip.objects.filter(field_trip=trip)
-    emails = []
 
-    for slip in slips:
-        emails.extend(slip.generate_emails())
+    # Messages already delivered for this version of the trip are skipped, so
+    # re-running this task after a failure only sends what is missing.
+    queue_slip_notifications(slips, digest=digest)
+    deliver_all_channels()
+
+@shared_task
+def async_deliver_outbound_messages(channel=OutboundMessage.EMAIL):
+    """ Deliver every message waiting in one channel of the outbox. """
+    deliver_queued_messages(channel=channel)
+
+def deliver_all_channels():
+    """ Drain every enabled outbox channel in parallel, one task each. """
+    return group(async_deliver_outbound_messages.si(channel)
+                 for channel in enabled_channels()).delay()
+
+@shared_task
+def async_send_reminders():
+    """ Remind students and guardians about incomplete slips due soon.
 
-    send_mass_mail(tuple(emails))
+    Run daily by celery beat. """
+    queue_reminders()
+    deliver_all_channels()
 
+@shared_task
+def async_resend_permission_slips(slip_ids):
+    """ Resend the notifications for several permission slips at once.
+
+    Use `PermissionSlip.objects.claim_resend` before queueing this task. The
+    messages of all the slips are queued together and then delivered by one
+    drain per channel. """
+    slips = PermissionSlip.objects.filter(id__in=slip_ids)
+    queued = queue_slip_notifications(slips, force=True)
+    LOGGER.info('Queued %s messages to resend %s slips.', len(queued), len(slip_ids))
+    deliver_all_channels()
+
+@shared_task
 def async_resend_permission_slip(slip_id):
-    """Resend notification for specific field trip."""
+    """ Resend the notifications for a permission slip.
+
+    Use `PermissionSlip.claim_resend` before queueing this task. An identical
+    resend that is still waiting in the outbox is not queued a second time. """
     slip = PermissionSlip.objects.get(id=slip_id)
-    emails = slip.generate_emails()
-    send_mass_mail(tuple(emails))
+    queue_slip_notifications([slip], force=True)
+    deliver_all_channels()
@@ -0,0 +1,119 @@
+"""Test module for authz.py
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from django.test import RequestFactory
+from django.urls import reverse
+
+import paperlesspermission.models as models
+from paperlesspermission import authz
+from paperlesspermission.test_views import ViewTest
+
+
+class TripAuthorizationTest(ViewTest):
+    """Tests for the moderated trip ids of a user."""
+    def setUp(self):
+        super(TripAuthorizationTest, self).setUp()
+        self.trip = models.FieldTrip.objects.get(name='Test Trip')
+        self.trip2 = models.FieldTrip.objects.get(name='Trip 2')
+        self.archived = models.FieldTrip.objects.get(name='Trip 3 Hidden')
+        self.teacher = models.Faculty.objects.get(email='tuser@school.test')
+
+    def test_trip_ids(self):
+        """a user moderates the trips listing their faculty record"""
+        authorization = authz.TripAuthorization(self.teacher_user)
+        self.assertEqual(authorization.trip_ids,
+                         {self.trip.id, self.archived.id})
+        self.assertEqual(authorization.faculty, self.teacher)
+        self.assertTrue(authorization.can_moderate(self.trip.id))
+        self.assertFalse(authorization.can_moderate(self.trip2.id))
+
+    def test_one_query(self):
+        """the moderated trip ids are looked up once"""
+        authorization = authz.TripAuthorization(self.teacher_user)
+        with self.assertNumQueries(1):
+            for trip in (self.trip, self.trip2, self.archived):
+                authorization.can_moderate(trip.id)
+
+    def test_staff_no_queries(self):
+        """staff may moderate every trip without any lookup"""
+        authorization = authz.TripAuthorization(self.admin_user)
+        with self.assertNumQueries(0):
+            self.assertTrue(authorization.can_moderate(self.trip2.id))
+            self.assertEqual(str(authorization.moderated_trips().query),
+                             str(models.FieldTrip.objects.all().query))
+
+    def test_user_without_email(self):
+        """a user without an email address moderates nothing"""
+        self.teacher_user.email = ''
+        authorization = authz.TripAuthorization(self.teacher_user)
+        with self.assertNumQueries(0):
+            self.assertEqual(authorization.trip_ids, frozenset())
+            self.assertIsNone(authorization.faculty)
+
+    def test_session_cache(self):
+        """later authorizations reuse the ids cached in the session"""
+        session = {}
+        authz.TripAuthorization(self.teacher_user, session).trip_ids
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                authz.TripAuthorization(self.teacher_user, session).trip_ids,
+                {self.trip.id, self.archived.id})
+
+    def test_session_cache_other_email(self):
+        """ids cached for another email address are not used"""
+        session = {}
+        authz.TripAuthorization(self.teacher_user, session).trip_ids
+        self.teacher_user.email = 'jwest@school.test'
+        self.assertEqual(
+            authz.TripAuthorization(self.teacher_user, session).trip_ids,
+            {self.trip2.id})
+
+    def test_faculty_change_invalidates(self):
+        """adding or removing trip faculty invalidates the cached ids"""
+        session = {}
+        authz.TripAuthorization(self.teacher_user, session).trip_ids
+        self.trip2.faculty.add(self.teacher)
+        self.assertIn(self.trip2.id,
+                      authz.TripAuthorization(self.teacher_user, session).trip_ids)
+        self.trip.faculty.remove(self.teacher)
+        self.assertNotIn(self.trip.id,
+                         authz.TripAuthorization(self.teacher_user, session).trip_ids)
+
+    def test_invalidate(self):
+        """invalidate() should drop the cached ids of every session"""
+        session = {}
+        authz.TripAuthorization(self.teacher_user, session).trip_ids
+        authz.invalidate()
+        with self.assertNumQueries(1):
+            authz.TripAuthorization(self.teacher_user, session).trip_ids
+
+    def test_for_request(self):
+        """one authorization is made per request"""
+        request = RequestFactory().get('/trip/')
+        request.user = self.teacher_user
+        authorization = authz.for_request(request)
+        self.assertIs(authz.for_request(request), authorization)
+        request.user = self.admin_user
+        self.assertTrue(authz.for_request(request).is_staff)
+
+    def test_trip_detail_after_faculty_change(self):
+        """a coordinator added to a trip may open it on their next request"""
+        self.client.force_login(self.teacher_user)
+        url = reverse('trip detail', kwargs={'trip_id': self.trip2.id})
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.trip2.faculty.add(self.teacher)
+        self.assertEqual(self.client.get(url).status_code, 200)
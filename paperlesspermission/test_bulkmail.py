@@ -0,0 +1,112 @@
+"""Test module for bulkmail.py
+
+Set PAPERLESS_BENCHMARKS=1 to also run the bulk send benchmark.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import socket
+from unittest import skipUnless
+
+from django.core.mail.backends.smtp import EmailBackend
+
+from paperlesspermission.bulkmail import NotSent, send_concurrently
+from paperlesspermission.mail import PooledEmailBackend
+from paperlesspermission.test_mail import SMTPSinkTestCase
+from paperlesspermission.test_outbox import SilentEmailBackend
+
+
+def unused_port():
+    """Returns a local port that nothing is listening on."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class SendConcurrentlyTest(SMTPSinkTestCase):
+    """Tests for send_concurrently."""
+    def test_sends_every_message(self):
+        """All messages should be delivered and reported as sent."""
+        report = send_concurrently(self.make_messages(40), PooledEmailBackend,
+                                   sessions=4)
+        self.assertEqual(report.sent, 40)
+        self.assertEqual(report.failed, 0)
+        self.assertEqual(len(self.sink.messages), 40)
+        self.assertTrue(report.throughput > 0)
+
+    def test_uses_concurrent_sessions(self):
+        """Each session should send over its own SMTP connection."""
+        send_concurrently(self.make_messages(40), PooledEmailBackend, sessions=4)
+        self.assertEqual(self.sink.counts['sessions'], 4)
+
+    def test_sessions_limited_to_message_count(self):
+        """No more sessions than messages should be opened."""
+        report = send_concurrently(self.make_messages(2), PooledEmailBackend,
+                                   sessions=8)
+        self.assertEqual(report.sessions, 2)
+
+    def test_rate_limit(self):
+        """The configured messages per second should not be exceeded."""
+        report = send_concurrently(self.make_messages(20), PooledEmailBackend,
+                                   sessions=4, rate=100)
+        self.assertEqual(report.sent, 20)
+        self.assertGreaterEqual(report.elapsed, 0.19)
+
+    def test_unreachable_server(self):
+        """Messages should be reported as failed when no session can open."""
+        port = unused_port()
+        report = send_concurrently(
+            self.make_messages(5),
+            lambda: EmailBackend(host='127.0.0.1', port=port),
+            sessions=2)
+        self.assertEqual(report.sent, 0)
+        self.assertEqual(report.failed, 5)
+        self.assertIsInstance(report.results[0], OSError)
+
+    def test_nothing_sent(self):
+        """Messages the backend did not send should be reported as failed."""
+        report = send_concurrently(self.make_messages(3), SilentEmailBackend,
+                                   sessions=2)
+        self.assertEqual(report.sent, 0)
+        self.assertEqual(report.failed, 3)
+        self.assertIsInstance(report.results[0], NotSent)
+
+    def test_no_messages(self):
+        """Sending nothing should not open any sessions."""
+        report = send_concurrently([], PooledEmailBackend)
+        self.assertEqual(report.sent, 0)
+        self.assertEqual(self.sink.counts['sessions'], 0)
+
+
+@skipUnless(os.environ.get('PAPERLESS_BENCHMARKS'), 'benchmarks disabled')
+class SendConcurrentlyBenchmark(SMTPSinkTestCase):
+    """Time to deliver a 5,000 message trip release to a local SMTP sink.
+
+    The sink waits 1ms before each reply to stand in for the network round
+    trip to a real relay.
+    """
+    MESSAGES = 5000
+    latency = 0.001
+
+    def test_benchmark(self):
+        messages = self.make_messages(self.MESSAGES)
+        for sessions in (1, 4, 8):
+            self.sink.messages = []
+            report = send_concurrently(messages, PooledEmailBackend,
+                                       sessions=sessions)
+            self.assertEqual(len(self.sink.messages), self.MESSAGES)
+            print('\n{0} messages, {1} sessions: {2:.2f}s ({3:.0f} msg/s)'.format(
+                self.MESSAGES, sessions, report.elapsed, report.throughput))
@@ -18,6 +18,7 @@ limitations under the License.
 from io import BytesIO
 from django.test import TestCase
 from paperlesspermission.models import Faculty, Course, Section, Student, Guardian
+from paperlesspermission import roster
 from paperlesspermission.djo import DJOImport
 from paperlesspermission.utils import disable_logging
 
@@ -537,6 +538,13 @@ class ImportAllTests(DJOImportTestCase):
         except Exception:
             self.fail("DJOImport.import_all() did not successfully run.")
 
+    @disable_logging
+    def test_import_all_rebuilds_roster_index(self):
+        """Imported people should be found by roster search."""
+        self.importer.import_all()
+        student = Student.objects.filter(hidden=False).first()
+        self.assertIn(student.pk, roster.search_pks(Student, student.last_name))
+
     @disable_logging
     def test_with_obj_use(self):
         """Ensure the __enter__/__exit__ functions work."""
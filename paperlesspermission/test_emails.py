@@ -0,0 +1,166 @@
+"""Test module for emails.py
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import time
+from unittest import skipUnless
+
+from django.core import mail
+from django.template.loader import render_to_string
+from django.test import override_settings
+
+import paperlesspermission.models as models
+from paperlesspermission.emails import (NotificationRenderer, TEMPLATE_DIR,
+                                        get_email_template)
+from paperlesspermission.outbox import queue_slip_emails, deliver_queued_messages
+from paperlesspermission.test_outbox import OutboxTest
+
+GUARDIAN_BODY = """Guardian Student,
+
+There is a new permission slip for you to fill out for your student, Test Student.
+
+Trip: Test Trip
+Location: Bermuda Triangle
+Date: 2020-03-01
+Permission Slip Link (click): https://permission.test/slip/{0}
+
+Please visit the above link to view and fill out the permission slip by the due date, 2020-02-15.
+
+Thank you for your time,
+
+-- 
+DJO Activities Office"""
+
+STUDENT_BODY = """Test Student,
+
+There is a new permission slip for you to fill out:
+
+Trip: Test Trip
+Location: Bermuda Triangle
+Date: 2020-03-01
+Permission Slip Link (click): https://permission.test/slip/{0}
+
+Please visit the above link to view and fill out the permission slip by the due date, 2020-02-15
+
+Thank you for your time,
+
+-- 
+DJO Activities Office"""
+
+
+class NotificationRendererTest(OutboxTest):
+    """Tests for NotificationRenderer."""
+    def setUp(self):
+        super(NotificationRendererTest, self).setUp()
+        self.trip = models.FieldTrip.objects.get(id=self.trip.id)
+        self.renderer = NotificationRenderer(self.trip)
+        self.links = models.PermissionSlipLink.objects.filter(
+            permission_slip__field_trip=self.trip)
+
+    def test_guardian_body(self):
+        """The guardian text body should keep its original wording."""
+        slip_link = self.links.get(guardian__person_id='2001')
+        email = self.renderer.link_email(slip_link, self.student)
+        self.assertEqual(email.subject, 'New Permission Slip for Test Student')
+        self.assertEqual(email.body, GUARDIAN_BODY.format(slip_link.link_id))
+        self.assertEqual(email.recipient, 'guardian@email.test')
+
+    def test_student_body(self):
+        """The student text body should keep its original wording."""
+        slip_link = self.links.get(student__isnull=False)
+        email = self.renderer.link_email(slip_link, self.student)
+        self.assertEqual(email.subject, 'New Permission Slip for Test Trip')
+        self.assertEqual(email.body, STUDENT_BODY.format(slip_link.link_id))
+
+    def test_text_is_not_escaped(self):
+        """Plain text bodies must not contain HTML entities."""
+        self.trip.location = 'Smith & Sons <Warehouse>'
+        email = NotificationRenderer(self.trip).link_email(
+            self.links.get(student__isnull=False), self.student)
+        self.assertIn('Location: Smith & Sons <Warehouse>', email.body)
+        self.assertIn('Smith &amp; Sons &lt;Warehouse&gt;', email.html_body)
+
+    def test_html_body_links_slip(self):
+        """The HTML alternative should link to the permission slip."""
+        slip_link = self.links.get(student__isnull=False)
+        email = self.renderer.link_email(slip_link, self.student)
+        self.assertIn('href="https://permission.test/slip/{0}"'.format(
+            slip_link.link_id), email.html_body)
+
+    def test_recipient_context_does_not_leak(self):
+        """Per-recipient variables must be popped after each render."""
+        for slip_link in self.links:
+            self.renderer.link_email(slip_link, self.student)
+        self.assertEqual(len(self.renderer.context.dicts), 2)
+        self.assertNotIn('recipient_name', self.renderer.context)
+
+    def test_templates_compiled_once(self):
+        """Templates should be compiled on first use and then reused."""
+        get_email_template.cache_clear()
+        for slip_link in self.links:
+            self.renderer.link_email(slip_link, self.student)
+        info = get_email_template.cache_info()
+        self.assertEqual(info.misses, 4)
+        self.assertEqual(info.hits, 2)
+
+    def test_sent_with_html_alternative(self):
+        """Delivered messages should carry both the text and HTML bodies."""
+        queue_slip_emails(self.slips)
+        deliver_queued_messages()
+        self.assertEqual(len(mail.outbox), 3)
+        for message in mail.outbox:
+            self.assertEqual(message.alternatives[0][1], 'text/html')
+            self.assertIn('/slip/', message.alternatives[0][0])
+
+
+@skipUnless(os.environ.get('PAPERLESS_BENCHMARKS'), 'benchmarks disabled')
+class RenderBenchmark(OutboxTest):
+    """Compares per-message `render_to_string` with NotificationRenderer.
+
+    Run with PAPERLESS_BENCHMARKS=1 and -s to see the numbers.
+    """
+    MESSAGES = 5000
+
+    @override_settings(BASE_URL='https://permission.test')
+    def test_benchmark_render(self):
+        slip_link = models.PermissionSlipLink.objects.filter(
+            guardian__isnull=False).select_related('guardian').first()
+
+        start = time.perf_counter()
+        for _ in range(self.MESSAGES):
+            context = {
+                'recipient_name': slip_link.guardian.get_full_name(),
+                'student_name': self.student.get_full_name(),
+                'trip_name': self.trip.name,
+                'location': self.trip.location,
+                'start_date': str(self.trip.start_date),
+                'due_date': str(self.trip.due_date),
+                'slip_url': 'https://permission.test/slip/' + slip_link.link_id,
+            }
+            render_to_string(TEMPLATE_DIR + 'guardian_notification.txt', context)
+            render_to_string(TEMPLATE_DIR + 'guardian_notification.html', context)
+        naive = time.perf_counter() - start
+
+        start = time.perf_counter()
+        renderer = NotificationRenderer(self.trip)
+        for _ in range(self.MESSAGES):
+            renderer.link_email(slip_link, self.student)
+        compiled = time.perf_counter() - start
+
+        print('\nrender_to_string: {0:.0f} msg/s, NotificationRenderer: '
+              '{1:.0f} msg/s'.format(self.MESSAGES / naive,
+                                     self.MESSAGES / compiled))
@@ -0,0 +1,62 @@
+"""Test module for exports.py
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from django.utils import timezone
+
+import paperlesspermission.models as models
+from paperlesspermission.exports import HEADER, slip_status_rows
+from paperlesspermission.test_outbox import OutboxTest
+
+
+class SlipStatusRowsTest(OutboxTest):
+    """Tests for slip_status_rows."""
+    def setUp(self):
+        super(SlipStatusRowsTest, self).setUp()
+        for i in range(9):
+            self.trip.students.add(models.Student.objects.create(
+                person_id='2024000{0}'.format(i),
+                first_name='Extra{0}'.format(i),
+                last_name='Student',
+                email='extra{0}@school.test'.format(i),
+                cell_number='+17035555555',
+                notify_cell=False,
+                grade_level=models.Student.FRESHMAN
+            ))
+        self.trip.generate_permission_slips()
+
+    def test_header_and_rows(self):
+        """The header should be followed by one row per slip."""
+        rows = list(slip_status_rows(self.trip))
+        self.assertEqual(rows[0], HEADER)
+        self.assertEqual(len(rows), 11)
+        self.assertTrue(all(len(row) == len(HEADER) for row in rows))
+
+    def test_one_guardian_query_per_chunk(self):
+        """Guardians should be loaded per chunk, not per slip."""
+        # One query for the slips and one for each of the four chunks.
+        with self.assertNumQueries(5):
+            list(slip_status_rows(self.trip, chunk_size=3))
+
+    def test_formulas_are_escaped(self):
+        """Signatures must not be exported as spreadsheet formulas."""
+        slip = self.slips.get(student=self.student)
+        slip.student_signature = '=HYPERLINK("http://evil.test")'
+        slip.student_signature_date = timezone.now()
+        slip.save()
+        row = [row for row in slip_status_rows(self.trip)
+               if row[0] == 'Test Student'][0]
+        self.assertEqual(row[5], '\'=HYPERLINK("http://evil.test")')
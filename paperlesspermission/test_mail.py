@@ -0,0 +1,224 @@
+"""Test module for mail.py
+
+The tests in this module talk real SMTP to `SMTPSink`, a small threaded
+stand-in for an SMTP relay that records every session and message it sees.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import socketserver
+import threading
+import time
+
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase, override_settings
+
+from paperlesspermission.mail import PooledEmailBackend, POOL, POOL_STATS
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib to deliver messages."""
+    def reply(self, line):
+        if self.server.sink.latency:
+            time.sleep(self.server.sink.latency)
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        sink.record('sessions')
+        messages_this_session = 0
+        self.reply('220 sink.test ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-sink.test')
+                self.reply('250-AUTH PLAIN')
+                self.reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 sink.test')
+            elif verb == 'AUTH':
+                sink.record('logins')
+                self.reply('235 Authentication successful')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if data_line in (b'.\r\n', b''):
+                        break
+                    data.append(data_line)
+                sink.add_message(b''.join(data))
+                self.reply('250 OK')
+                messages_this_session += 1
+                if (sink.drop_after is not None
+                        and messages_this_session >= sink.drop_after):
+                    # Hang up without a word, like an overloaded relay.
+                    return
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink():
+    """Local SMTP server that accepts and records every message.
+
+    Attributes:
+        host (str): Address the server is listening on
+        port (int): Port the server is listening on
+        messages (list): Raw bytes of every message received
+        drop_after (int): Close each session after this many messages without
+            warning the client. None keeps sessions open.
+        latency (float): Seconds to wait before each reply, to stand in for
+            the round trip to a real relay
+    """
+    def __init__(self, drop_after=None, latency=0):
+        self.drop_after = drop_after
+        self.latency = latency
+        self.messages = []
+        self.counts = {'sessions': 0, 'logins': 0}
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0), _SMTPSinkHandler)
+        self._server.daemon_threads = True
+        self._server.sink = self
+        self.host, self.port = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+
+    def record(self, counter):
+        with self._lock:
+            self.counts[counter] += 1
+
+    def add_message(self, data):
+        with self._lock:
+            self.messages.append(data)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class SMTPSinkTestCase(SimpleTestCase):
+    """Starts a fresh SMTPSink and an empty connection pool for each test."""
+    drop_after = None
+    latency = 0
+
+    def setUp(self):
+        # pylint: disable=invalid-name
+        super(SMTPSinkTestCase, self).setUp()
+        logging.disable(logging.CRITICAL)
+        self.sink = SMTPSink(drop_after=self.drop_after,
+                             latency=self.latency).start()
+        POOL.close_all()
+        POOL_STATS.reset()
+        self.settings_override = override_settings(
+            EMAIL_HOST=self.sink.host,
+            EMAIL_PORT=self.sink.port,
+            EMAIL_HOST_USER='mailer',
+            EMAIL_HOST_PASSWORD='secret',
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        # pylint: disable=invalid-name
+        POOL.close_all()
+        self.settings_override.disable()
+        self.sink.stop()
+        logging.disable(logging.NOTSET)
+        super(SMTPSinkTestCase, self).tearDown()
+
+    @staticmethod
+    def make_messages(count):
+        return [
+            EmailMessage('Subject {0}'.format(i), 'Body {0}'.format(i),
+                         'noreply@school.test', ['parent{0}@email.test'.format(i)])
+            for i in range(count)
+        ]
+
+
+class PooledEmailBackendTest(SMTPSinkTestCase):
+    """Tests for PooledEmailBackend."""
+    def test_sends_messages(self):
+        """Messages should be delivered to the server."""
+        sent = PooledEmailBackend().send_messages(self.make_messages(5))
+        self.assertEqual(sent, 5)
+        self.assertEqual(len(self.sink.messages), 5)
+        self.assertIn(b'Subject: Subject 3', self.sink.messages[3])
+
+    def test_session_reused_between_backends(self):
+        """Separate backend instances should share one authenticated session."""
+        for _ in range(10):
+            PooledEmailBackend().send_messages(self.make_messages(3))
+        self.assertEqual(len(self.sink.messages), 30)
+        self.assertEqual(self.sink.counts['sessions'], 1)
+        self.assertEqual(self.sink.counts['logins'], 1)
+
+    def test_metrics(self):
+        """Connections opened and messages sent should be counted."""
+        for _ in range(4):
+            PooledEmailBackend().send_messages(self.make_messages(5))
+        stats = POOL_STATS.snapshot()
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 3)
+        self.assertEqual(stats['messages_sent'], 20)
+
+    @override_settings(EMAIL_POOL_MAX_MESSAGES=4)
+    def test_session_retired_after_max_messages(self):
+        """A session should be replaced once it reaches its message cap."""
+        PooledEmailBackend().send_messages(self.make_messages(10))
+        self.assertEqual(len(self.sink.messages), 10)
+        self.assertEqual(self.sink.counts['sessions'], 3)
+
+    def test_close_all(self):
+        """Closing the pool should quit idle sessions."""
+        PooledEmailBackend().send_messages(self.make_messages(1))
+        POOL.close_all()
+        PooledEmailBackend().send_messages(self.make_messages(1))
+        self.assertEqual(self.sink.counts['sessions'], 2)
+
+
+class PooledEmailBackendReconnectTest(SMTPSinkTestCase):
+    """Tests PooledEmailBackend against a server that drops sessions."""
+    drop_after = 3
+
+    def test_reconnects_when_dropped(self):
+        """Messages should still all arrive when the server hangs up."""
+        sent = PooledEmailBackend().send_messages(self.make_messages(10))
+        self.assertEqual(sent, 10)
+        self.assertEqual(len(self.sink.messages), 10)
+        self.assertEqual(POOL_STATS.snapshot()['reconnects'], 3)
+
+    def test_reconnects_stale_pooled_session(self):
+        """A pooled session the server dropped should be replaced."""
+        PooledEmailBackend().send_messages(self.make_messages(3))
+        sent = PooledEmailBackend().send_messages(self.make_messages(1))
+        self.assertEqual(sent, 1)
+        self.assertEqual(len(self.sink.messages), 4)
+        self.assertEqual(self.sink.counts['sessions'], 2)
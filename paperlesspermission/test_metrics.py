@@ -0,0 +1,134 @@
+"""Test module for metrics.py
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+
+import paperlesspermission.models as models
+from paperlesspermission import metrics
+from paperlesspermission.tasks import async_generate_permission_slips
+from paperlesspermission.test_outbox import EagerTasksMixin
+from paperlesspermission.test_views import ViewTest
+
+
+def sample(name, **labels):
+    """Returns the current value of a metric sample, 0 if it has none."""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN='scrape-token')
+class MetricsViewTest(ViewTest):
+    """Tests for the metrics view and MetricsMiddleware."""
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        """nothing is recorded or served unless enabled"""
+        with self.assertRaises(MiddlewareNotUsed):
+            metrics.MetricsMiddleware(lambda request: None)
+        self.client.force_login(self.admin_user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    def test_forbidden(self):
+        """only staff and holders of the token may read the metrics"""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(self.teacher_user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token(self):
+        """an empty token lets no scraper in"""
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 403)
+
+    def test_token(self):
+        """scrapers holding the token read the metrics"""
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(b'paperless_request_latency_seconds', response.content)
+
+    def test_staff(self):
+        """staff read the metrics from their browser"""
+        self.client.force_login(self.admin_user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_request_latency(self):
+        """requests are counted by URL name rather than path"""
+        labels = {'view': 'trip detail', 'method': 'GET'}
+        before = sample('paperless_request_latency_seconds_count', **labels)
+        responses = sample('paperless_requests_total', status='200', **labels)
+        trip = models.FieldTrip.objects.get(name='Test Trip')
+        self.client.force_login(self.teacher_user)
+        self.client.get(reverse('trip detail', kwargs={'trip_id': trip.id}))
+        self.assertEqual(
+            sample('paperless_request_latency_seconds_count', **labels),
+            before + 1)
+        self.assertEqual(
+            sample('paperless_requests_total', status='200', **labels),
+            responses + 1)
+
+    def test_unresolved(self):
+        """unknown paths share one label"""
+        labels = {'view': '<unresolved>', 'method': 'GET', 'status': '404'}
+        before = sample('paperless_requests_total', **labels)
+        self.client.get('/no/such/page/')
+        self.assertEqual(sample('paperless_requests_total', **labels),
+                         before + 1)
+
+
+class TaskMetricsTest(EagerTasksMixin, ViewTest):
+    """Tests for the Celery task and permission slip metrics."""
+    def test_task_runtime(self):
+        """task runs are timed, and their new slips counted"""
+        trip = models.FieldTrip.objects.get(name='Test Trip')
+        models.PermissionSlipLink.objects.filter(
+            permission_slip__field_trip=trip).delete()
+        trip.permissionslip_set.all().delete()
+        task = async_generate_permission_slips.name
+        runs = sample('paperless_task_runtime_seconds_count',
+                      task=task, state='SUCCESS')
+        slips = sample('paperless_slips_generated_total')
+
+        async_generate_permission_slips.delay(trip.id)
+
+        self.assertEqual(sample('paperless_task_runtime_seconds_count',
+                                task=task, state='SUCCESS'), runs + 1)
+        self.assertEqual(sample('paperless_slips_generated_total'),
+                         slips + trip.permissionslip_set.count())
+
+
+class CountedRowsTest(SimpleTestCase):
+    """Tests for counted_rows."""
+    def test_counted_rows(self):
+        """rows pass through unchanged and are counted and timed once read"""
+        before = sample('paperless_import_rows_total', file='test')
+        runs = sample('paperless_import_duration_seconds_count', file='test')
+        rows = metrics.counted_rows('test', iter([{'ID': 1}, {'ID': 2}]))
+        self.assertEqual(sample('paperless_import_rows_total', file='test'),
+                         before)
+        self.assertEqual(list(rows), [{'ID': 1}, {'ID': 2}])
+        self.assertEqual(sample('paperless_import_rows_total', file='test'),
+                         before + 2)
+        self.assertEqual(
+            sample('paperless_import_duration_seconds_count', file='test'),
+            runs + 1)
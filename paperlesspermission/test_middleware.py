@@ -0,0 +1,110 @@
+"""Test module for middleware.py
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import re
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+import paperlesspermission.models as models
+from paperlesspermission.middleware import RequestTimingMiddleware
+from paperlesspermission.test_views import ViewTest
+
+
+def timing_metrics(response):
+    """Returns {name: (duration, description)} of a Server-Timing header."""
+    metrics = {}
+    for metric in response['Server-Timing'].split(', '):
+        name = metric.split(';')[0]
+        duration = re.search(r';dur=([0-9.]+)', metric)
+        description = re.search(r';desc="([^"]*)"', metric)
+        metrics[name] = (float(duration.group(1)) if duration else None,
+                         description.group(1) if description else None)
+    return metrics
+
+
+@override_settings(REQUEST_TIMING_ENABLED=True, REQUEST_SLOW_MS=60000)
+class RequestTimingMiddlewareTest(ViewTest):
+    """Tests for RequestTimingMiddleware."""
+    @override_settings(REQUEST_TIMING_ENABLED=False)
+    def test_disabled(self):
+        """the middleware removes itself unless enabled"""
+        with self.assertRaises(MiddlewareNotUsed):
+            RequestTimingMiddleware(lambda request: None)
+        self.client.force_login(self.teacher_user)
+        response = self.client.get(reverse('trip list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_server_timing(self):
+        """every timed response carries its total, SQL and template time"""
+        self.client.force_login(self.teacher_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('trip list'))
+        metrics = timing_metrics(response)
+        self.assertGreater(metrics['total'][0], 0)
+        self.assertEqual(metrics['sql'][1], '{0} queries'.format(len(context)))
+        self.assertGreater(metrics['tpl'][0], 0)
+        self.assertLessEqual(metrics['sql'][0] + metrics['tpl'][0],
+                             metrics['total'][0] + 0.1)
+
+    def test_cache_hits(self):
+        """cache lookups are counted as hits and misses"""
+        slip_link = models.PermissionSlipLink.objects.filter(
+            student__isnull=False).first()
+        url = reverse('permission slip', kwargs={'slip_id': slip_link.link_id})
+        miss = timing_metrics(self.client.get(url))['cache'][1]
+        self.assertRegex(miss, r' [1-9][0-9]* misses$')
+        # The first load of a link is not cached, see slipcache.
+        self.client.get(url)
+        hit = timing_metrics(self.client.get(url))['cache'][1]
+        self.assertRegex(hit, r'^[1-9][0-9]* hits 0 misses$')
+
+    def test_log_line(self):
+        """each request is logged with its view and counts"""
+        logging.disable(logging.NOTSET)
+        self.client.force_login(self.teacher_user)
+        with self.assertLogs('paperlesspermission.middleware', 'INFO') as logs:
+            self.client.get(reverse('trip list'))
+        self.assertEqual(len(logs.records), 1)
+        timing = logs.records[0].timing
+        self.assertEqual(timing['view'], 'trip list')
+        self.assertEqual(timing['status'], 200)
+        self.assertIn('sql_count={0}'.format(timing['sql_count']),
+                      logs.output[0])
+
+    @override_settings(REQUEST_SLOW_MS=0, REQUEST_SLOW_QUERIES=2)
+    def test_slow_request(self):
+        """slow requests are logged with their slowest queries"""
+        logging.disable(logging.NOTSET)
+        self.client.force_login(self.teacher_user)
+        with self.assertLogs('paperlesspermission.middleware', 'WARNING') as logs:
+            self.client.get(reverse('trip list'))
+        self.assertIn('Slowest queries', logs.output[0])
+        self.assertEqual(logs.output[0].count(' ms: '), 2)
+
+    @override_settings(REQUEST_SLOW_MS=0, REQUEST_SLOW_SAMPLE_RATE=0)
+    def test_slow_request_sampling(self):
+        """only a sample of the slow requests is logged in full"""
+        logging.disable(logging.NOTSET)
+        self.client.force_login(self.teacher_user)
+        with self.assertLogs('paperlesspermission.middleware', 'INFO') as logs:
+            self.client.get(reverse('trip list'))
+        self.assertEqual([record.levelname for record in logs.records], ['INFO'])
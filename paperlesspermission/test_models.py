@@ -0,0 +1,347 @@
+"""Test module for models.py
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from datetime import timedelta
+from importlib import import_module
+import os
+import time
+from types import SimpleNamespace
+from unittest import skipUnless
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+import paperlesspermission.models as models
+from paperlesspermission.test_outbox import OutboxTest
+
+
+class PermissionSlipStatusTest(OutboxTest):
+    """Tests for the denormalized PermissionSlip.status column."""
+    def setUp(self):
+        super(PermissionSlipStatusTest, self).setUp()
+        self.slip = self.slips.get()
+
+    def sign_student(self):
+        self.slip.student_signature = 'Test Student'
+        self.slip.student_signature_date = timezone.now()
+
+    def sign_guardian(self):
+        self.slip.guardian = models.Guardian.objects.get(person_id='2001')
+        self.slip.guardian_signature = 'Guardian Student'
+        self.slip.guardian_signature_date = timezone.now()
+
+    def stored_status(self):
+        return models.PermissionSlip.objects.values_list(
+            'status', flat=True).get(id=self.slip.id)
+
+    def test_new_slip_is_unsigned(self):
+        """Freshly generated slips have nobody's signature."""
+        self.assertEqual(self.stored_status(), models.PermissionSlip.NONE)
+
+    def test_save_tracks_signatures(self):
+        """Saving a slip should store the status matching its signatures."""
+        self.sign_guardian()
+        self.slip.save()
+        self.assertEqual(self.stored_status(), models.PermissionSlip.GUARDIAN)
+        self.sign_student()
+        self.slip.save()
+        self.assertEqual(self.stored_status(), models.PermissionSlip.COMPLETE)
+
+    def test_save_with_update_fields(self):
+        """The status is written even if only the signatures are saved."""
+        self.sign_student()
+        self.slip.save(update_fields=['student_signature',
+                                      'student_signature_date'])
+        self.assertEqual(self.stored_status(), models.PermissionSlip.STUDENT)
+
+    def test_reset(self):
+        """Resetting a slip makes it unsigned again."""
+        self.sign_student()
+        self.sign_guardian()
+        self.slip.save()
+        self.slip.reset()
+        self.assertEqual(self.slip.status, models.PermissionSlip.NONE)
+        self.slip.save()
+        self.assertEqual(self.stored_status(), models.PermissionSlip.NONE)
+
+    def test_backfill(self):
+        """The migration should derive the status of existing slips."""
+        self.sign_student()
+        self.sign_guardian()
+        self.slip.save()
+        models.PermissionSlip.objects.update(status=models.PermissionSlip.NONE)
+
+        migration = import_module(
+            'paperlesspermission.migrations.0006_permissionslip_status')
+        migration.backfill_status(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(self.stored_status(), models.PermissionSlip.COMPLETE)
+
+
+class PermissionSlipQuerySetTest(OutboxTest):
+    """Tests for the bulk actions of PermissionSlip.objects."""
+    def setUp(self):
+        super(PermissionSlipQuerySetTest, self).setUp()
+        self.slip = self.slips.get()
+        self.slip.student_signature = 'Test Student'
+        self.slip.student_signature_date = timezone.now()
+        self.slip.guardian = models.Guardian.objects.get(person_id='2001')
+        self.slip.guardian_signature = 'Guardian Student'
+        self.slip.guardian_signature_date = timezone.now()
+        self.slip.save()
+
+    def test_reset(self):
+        """Bulk reset matches reset() and save() in a single UPDATE."""
+        updated_at = models.PermissionSlip.objects.get().updated_at
+        with self.assertNumQueries(2):
+            self.assertEqual(models.PermissionSlip.objects.all().reset(), 1)
+        slip = models.PermissionSlip.objects.get()
+        self.assertIsNone(slip.guardian)
+        self.assertIsNone(slip.student_signature)
+        self.assertIsNone(slip.guardian_signature_date)
+        self.assertEqual(slip.status, models.PermissionSlip.NONE)
+        self.assertGreater(slip.updated_at, updated_at)
+
+    def test_claim_resend(self):
+        """Slips sent within the cool-down are left out of the claim."""
+        cooldown = timedelta(minutes=15)
+        slips = models.PermissionSlip.objects.all()
+        self.assertEqual(slips.claim_resend(cooldown), [self.slip.id])
+        self.assertEqual(slips.claim_resend(cooldown), [])
+        self.assertFalse(self.slip.claim_resend(cooldown))
+
+
+class PermissionSlipLinkTest(OutboxTest):
+    """Tests for the link_id of PermissionSlipLink."""
+    def setUp(self):
+        super(PermissionSlipLinkTest, self).setUp()
+        self.slip = self.slips.get()
+        self.links = models.PermissionSlipLink.objects.filter(
+            permission_slip=self.slip).order_by('id')
+
+    def test_link_id(self):
+        """The link_id hashes the slip and the person's person_id."""
+        slip_link = self.links.get(student__isnull=False)
+        self.assertEqual(slip_link.link_id, models.PermissionSlipLink.make_link_id(
+            self.slip.id, self.student.person_id))
+
+    def test_save_existing_link(self):
+        """Saving an existing link does not load its slip or person."""
+        slip_link = self.links.get(student__isnull=False)
+        link_id = slip_link.link_id
+        slip_link.last_sent = timezone.now()
+        with self.assertNumQueries(1):
+            slip_link.save()
+        self.assertEqual(slip_link.link_id, link_id)
+
+    def test_set_link_ids(self):
+        """The batch helper matches calculate_link_id with one query per
+        model of people that are not loaded yet."""
+        slip_links = [
+            models.PermissionSlipLink(permission_slip_id=slip_link.permission_slip_id,
+                                      guardian_id=slip_link.guardian_id,
+                                      student_id=slip_link.student_id)
+            for slip_link in self.links]
+        with self.assertNumQueries(2):
+            models.PermissionSlipLink.set_link_ids(slip_links)
+        self.assertEqual([slip_link.link_id for slip_link in slip_links],
+                         [slip_link.link_id for slip_link in self.links])
+
+        slip_link = models.PermissionSlipLink(permission_slip=self.slip,
+                                              student=self.student)
+        with self.assertNumQueries(0):
+            models.PermissionSlipLink.set_link_ids([slip_link])
+        self.assertEqual(slip_link.link_id, self.links.first().link_id)
+
+    def test_generate_slip_links(self):
+        """Generating the links again creates only the missing ones."""
+        link_ids = list(self.links.values_list('link_id', flat=True))
+        self.links.filter(guardian__isnull=False).first().delete()
+        self.slip.generate_slip_links()
+        self.assertEqual(sorted(self.links.values_list('link_id', flat=True)),
+                         sorted(link_ids))
+
+
+@skipUnless(os.environ.get('PAPERLESS_BENCHMARKS'), 'benchmarks disabled')
+class LinkSaveBenchmark(TestCase):
+    """Times saving `last_sent` on 10,000 links.
+
+    Run with PAPERLESS_BENCHMARKS=1 and -s to see the numbers.
+    """
+    STUDENTS = 100
+    TRIPS = 100
+
+    def setUp(self):
+        for number in range(self.STUDENTS):
+            models.Student.objects.create(
+                person_id='2023{0:05}'.format(number), first_name='Student',
+                last_name='Number{0}'.format(number),
+                email='student{0}@school.test'.format(number),
+                cell_number='+17035555555', notify_cell=False,
+                grade_level=models.Student.FRESHMAN)
+        for number in range(self.TRIPS):
+            models.FieldTrip.objects.create(
+                name='Trip {0}'.format(number), group_name='Benchmark Club',
+                location='Lab', start_date='2020-03-01', dropoff_time='13:30',
+                dropoff_location='Front Entrance', end_date='2020-04-01',
+                pickup_time='13:30', pickup_location='Front Entrance',
+                due_date='2020-02-15')
+        models.PermissionSlip.objects.bulk_create(
+            models.PermissionSlip(field_trip_id=trip_id, student_id=student_id)
+            for trip_id in models.FieldTrip.objects.values_list('id', flat=True)
+            for student_id in models.Student.objects.values_list('id', flat=True))
+        slip_links = [
+            models.PermissionSlipLink(permission_slip_id=slip_id,
+                                      student_id=student_id)
+            for slip_id, student_id in models.PermissionSlip.objects.values_list(
+                'id', 'student_id')]
+        models.PermissionSlipLink.set_link_ids(slip_links)
+        models.PermissionSlipLink.objects.bulk_create(slip_links)
+
+    def timed_saves(self, slip_links, recalculate):
+        """Returns the seconds and queries it takes to save `slip_links`."""
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        now = timezone.now()
+        start = time.perf_counter()
+        with connection.execute_wrapper(count):
+            for slip_link in slip_links:
+                if recalculate:
+                    slip_link.calculate_link_id()
+                slip_link.last_sent = now
+                slip_link.save()
+        return time.perf_counter() - start, len(queries)
+
+    def test_benchmark_save(self):
+        slip_links = list(models.PermissionSlipLink.objects.all())
+        self.assertEqual(len(slip_links), self.STUDENTS * self.TRIPS)
+
+        # What every save did before: load the slip and person, then hash.
+        recalculated, recalculated_queries = self.timed_saves(slip_links, True)
+        slip_links = list(models.PermissionSlipLink.objects.all())
+        saved, saved_queries = self.timed_saves(slip_links, False)
+
+        self.assertEqual(saved_queries, len(slip_links))
+        print('\nrecalculating link_id: {0:.0f} saves/s ({1} queries), '
+              'computed once: {2:.0f} saves/s ({3} queries)'.format(
+                  len(slip_links) / recalculated, recalculated_queries,
+                  len(slip_links) / saved, saved_queries))
+
+
+@skipUnless(connection.vendor in ('sqlite', 'mysql'),
+            'Query plans are only checked on SQLite and MariaDB')
+class QueryPlanTest(TestCase):
+    """Checks that hot lookups are answered by an index, not a full scan.
+
+    Django compares boolean columns as `NOT hidden` on SQLite, which no index
+    can answer, but as `hidden = 0` on MariaDB. Lookups on hidden flags are
+    therefore only explained on MariaDB; everywhere else the test checks that
+    the index they need exists.
+    """
+    def assertUsesIndex(self, queryset, *index_names):
+        # pylint: disable=invalid-name
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+        for line in plan.splitlines():
+            if connection.vendor == 'sqlite':
+                # "SCAN table" without an index reads every row.
+                full_scan = ' SCAN ' in ' {0} '.format(line) and 'USING' not in line
+            else:
+                # EXPLAIN rows have an access type of ALL for full scans.
+                full_scan = ' ALL ' in ' {0} '.format(line)
+            self.assertFalse(full_scan, plan)
+
+    def assertHasIndex(self, model, columns):
+        """Fails unless the table of `model` has an index starting with
+        `columns`, and returns its name."""
+        # pylint: disable=invalid-name
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table)
+        for name, constraint in constraints.items():
+            if (constraint['index'] or constraint['foreign_key']) and \
+                    constraint['columns'][:len(columns)] == columns:
+                return name
+        self.fail('No index on {0} {1}'.format(model._meta.db_table, columns))
+        return None
+
+    def assertHiddenLookupUsesIndex(self, queryset, columns, index_name):
+        # pylint: disable=invalid-name
+        self.assertEqual(
+            self.assertHasIndex(queryset.model, columns), index_name)
+        if connection.vendor == 'mysql':
+            self.assertUsesIndex(queryset, index_name)
+
+    def test_faculty_by_email(self):
+        """trip authorization should find faculty by email address"""
+        self.assertUsesIndex(
+            models.FieldTrip.faculty.through.objects.filter(
+                faculty__email='tuser@school.test').values_list('fieldtrip_id'),
+            'faculty_email_idx')
+
+    def test_trip_list(self):
+        """the trip list should find trips by their hidden flag"""
+        self.assertHiddenLookupUsesIndex(
+            models.FieldTrip.objects.filter(hidden=False),
+            ['hidden', 'status'], 'trip_hidden_idx')
+
+    def test_students_by_grade_level(self):
+        """whole grade levels should be found without scanning students"""
+        self.assertUsesIndex(
+            models.Student.objects.filter(grade_level__in=[models.Student.FRESHMAN]),
+            'student_grade_level_idx')
+
+    def test_form_querysets(self):
+        """the trip form should list visible people and courses by index"""
+        for model in (models.Student, models.Faculty):
+            self.assertHiddenLookupUsesIndex(
+                model.objects.filter(hidden=False).order_by('last_name',
+                                                             'first_name'),
+                ['hidden', 'last_name', 'first_name'],
+                '{0}_hidden_name_idx'.format(model._meta.model_name))
+        self.assertHiddenLookupUsesIndex(
+            models.Course.objects.filter(hidden=False).order_by('course_name'),
+            ['hidden', 'course_name'], 'course_hidden_name_idx')
+        self.assertHiddenLookupUsesIndex(
+            models.Section.objects.filter(hidden=False),
+            ['hidden', 'course_id'], 'section_hidden_idx')
+
+    # SQLite only answers case insensitive LIKE from an index on NOCASE
+    # columns.
+    @skipUnless(connection.vendor == 'mysql', 'SQLite LIKE needs NOCASE')
+    def test_roster_prefix(self):
+        """roster search should find word prefixes by index"""
+        self.assertUsesIndex(models.RosterToken.objects.filter(
+            person_type=models.RosterToken.STUDENT, token__istartswith='smi'),
+            'roster_token_idx')
+
+    def test_slip_link_lookup(self):
+        """generate_slip_links should find existing links by their foreign
+        key indexes"""
+        slip_index = self.assertHasIndex(models.PermissionSlipLink,
+                                         ['permission_slip_id'])
+        for person in ('student_id', 'guardian_id'):
+            self.assertUsesIndex(
+                models.PermissionSlipLink.objects.filter(
+                    permission_slip_id=1, **{person: 1}),
+                slip_index,
+                self.assertHasIndex(models.PermissionSlipLink, [person]))
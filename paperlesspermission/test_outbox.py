@@ -0,0 +1,423 @@
+"""Test module for outbox.py
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import logging
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from paperlesspermission import celery_app
+import paperlesspermission.models as models
+from paperlesspermission.outbox import (claim_batch, deliver_queued_messages,
+                                        queue_slip_emails)
+from paperlesspermission.tasks import (async_initial_trip_notifications,
+                                       async_resend_permission_slip,
+                                       async_resend_permission_slips)
+
+
+class FailingEmailBackend(LocmemEmailBackend):
+    """Email backend that refuses to send anything."""
+    def send_messages(self, messages):
+        raise ConnectionError('SMTP relay unavailable')
+
+
+class SilentEmailBackend(LocmemEmailBackend):
+    """Email backend that sends nothing and says so, like a backend failing
+    silently."""
+    def send_messages(self, messages):
+        return 0
+
+
+class EagerTasksMixin():
+    """Runs celery tasks, including the delivery groups, in the test process."""
+    def setUp(self):
+        # pylint: disable=invalid-name
+        super(EagerTasksMixin, self).setUp()
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+    def tearDown(self):
+        # pylint: disable=invalid-name
+        celery_app.conf.task_always_eager = self.always_eager
+        super(EagerTasksMixin, self).tearDown()
+
+
+@override_settings(
+    CELERY_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    BASE_URL='https://permission.test',
+)
+class OutboxTest(TestCase):
+    """Defines data available to all outbox test cases."""
+    def setUp(self):
+        # pylint: disable=invalid-name
+        super(OutboxTest, self).setUp()
+
+        logging.disable(logging.CRITICAL)
+
+        self.student = models.Student.objects.create(
+            person_id='202300001',
+            first_name='Test',
+            last_name='Student',
+            email='tstudent@school.test',
+            cell_number='+17035555555',
+            notify_cell=True,
+            grade_level=models.Student.FRESHMAN
+        )
+        for person_id, first_name in (('2001', 'Guardian'), ('2002', 'Other')):
+            guardian = models.Guardian.objects.create(
+                person_id=person_id,
+                first_name=first_name,
+                last_name='Student',
+                email='{0}@email.test'.format(first_name.lower()),
+                cell_number='+17035555555',
+                notify_cell=True,
+            )
+            guardian.students.add(self.student)
+        teacher = models.Faculty.objects.create(
+            person_id='1000001',
+            first_name='Teacher',
+            last_name='User',
+            email='tuser@school.test',
+            cell_number='+17035555555',
+            notify_cell=True,
+            preferred_name='Mrs. Teacher'
+        )
+
+        self.trip = models.FieldTrip.objects.create(
+            name='Test Trip',
+            group_name='Fishing Club',
+            location='Bermuda Triangle',
+            start_date='2020-03-01',
+            dropoff_time='13:30',
+            dropoff_location='Front Entrance',
+            end_date='2020-04-01',
+            pickup_time='13:30',
+            pickup_location='Front Entrance',
+            due_date='2020-02-15'
+        )
+        self.trip.students.add(self.student)
+        self.trip.faculty.add(teacher)
+        self.trip.generate_permission_slips()
+        self.slips = models.PermissionSlip.objects.filter(field_trip=self.trip)
+
+    def tearDown(self):
+        # pylint: disable=invalid-name
+        super(OutboxTest, self).tearDown()
+
+        logging.disable(logging.NOTSET)
+
+
+class QueueSlipEmailsTest(OutboxTest):
+    """Tests for queue_slip_emails."""
+    def test_queues_one_message_per_link(self):
+        """A message should be queued for the student and each guardian."""
+        queued = queue_slip_emails(self.slips)
+        self.assertEqual(len(queued), 3)
+        self.assertEqual(
+            models.OutboundMessage.objects.filter(
+                status=models.OutboundMessage.QUEUED).count(),
+            3
+        )
+        recipients = sorted(message.recipient for message in queued)
+        self.assertEqual(recipients, ['guardian@email.test', 'other@email.test',
+                                      'tstudent@school.test'])
+
+    def test_messages_are_tied_to_links(self):
+        """Each message should reference the link it notifies about."""
+        for message in queue_slip_emails(self.slips):
+            slip_link = message.permission_slip_links.get()
+            self.assertIn(slip_link.link_id, message.body)
+
+    def test_queued_in_batches(self):
+        """Messages inserted in several batches are each tied to their link."""
+        with self.settings(OUTBOX_BATCH_SIZE=2):
+            queued = queue_slip_emails(self.slips)
+        self.assertEqual(len(queued), 3)
+        self.assertEqual(len({message.batch for message in queued}), 2)
+        for message in queued:
+            self.assertIn(message.permission_slip_links.get().link_id, message.body)
+
+    def test_requeue_is_noop(self):
+        """Queueing the same notification twice must not duplicate it."""
+        queue_slip_emails(self.slips)
+        self.assertEqual(queue_slip_emails(self.slips), [])
+        self.assertEqual(models.OutboundMessage.objects.count(), 3)
+
+    def test_trip_change_queues_new_version(self):
+        """A changed trip renders a new body, which must be sent again."""
+        queue_slip_emails(self.slips)
+        deliver_queued_messages()
+        self.trip.location = 'Atlantis'
+        self.trip.save()
+        self.assertEqual(len(queue_slip_emails(self.slips)), 3)
+
+    def test_force_queues_sent_messages(self):
+        """force=True should queue a copy of messages that were already sent."""
+        queue_slip_emails(self.slips)
+        deliver_queued_messages()
+        self.assertEqual(queue_slip_emails(self.slips), [])
+        self.assertEqual(len(queue_slip_emails(self.slips, force=True)), 3)
+
+    def test_failed_messages_are_retried(self):
+        """Failed messages should be queued again instead of duplicated."""
+        queue_slip_emails(self.slips)
+        deliver_queued_messages(connection=FailingEmailBackend())
+        requeued = queue_slip_emails(self.slips)
+        self.assertEqual(len(requeued), 3)
+        self.assertEqual(models.OutboundMessage.objects.count(), 3)
+
+    def test_failed_copy_does_not_hide_sent_message(self):
+        """A failed forced resend must not requeue a message already sent."""
+        queue_slip_emails(self.slips)
+        deliver_queued_messages()
+        queue_slip_emails(self.slips, force=True)
+        deliver_queued_messages(connection=FailingEmailBackend())
+        self.assertEqual(models.OutboundMessage.objects.filter(
+            status=models.OutboundMessage.FAILED).count(), 3)
+        self.assertEqual(queue_slip_emails(self.slips), [])
+        self.assertFalse(models.OutboundMessage.objects.filter(
+            status=models.OutboundMessage.QUEUED).exists())
+
+
+class DeliverQueuedMessagesTest(OutboxTest):
+    """Tests for deliver_queued_messages."""
+    def test_delivers_queued_messages(self):
+        """Every queued message should be sent and marked as sent."""
+        queue_slip_emails(self.slips)
+        self.assertEqual(deliver_queued_messages(batch_size=2), (3, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(models.OutboundMessage.objects.exclude(
+            status=models.OutboundMessage.SENT).exists())
+
+    def test_sets_last_sent(self):
+        """Delivering a message should record when its link was last sent."""
+        links = models.PermissionSlipLink.objects.filter(
+            permission_slip__field_trip=self.trip)
+        self.assertFalse(links.filter(last_sent__isnull=False).exists())
+        queue_slip_emails(self.slips)
+        deliver_queued_messages()
+        self.assertFalse(links.filter(last_sent__isnull=True).exists())
+
+    def test_rerun_sends_nothing(self):
+        """Draining an already drained outbox must not send anything."""
+        queue_slip_emails(self.slips)
+        deliver_queued_messages()
+        queue_slip_emails(self.slips)
+        self.assertEqual(deliver_queued_messages(), (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failures_are_recorded(self):
+        """Messages the backend refuses should be marked as failed."""
+        queue_slip_emails(self.slips)
+        self.assertEqual(
+            deliver_queued_messages(connection=FailingEmailBackend()), (0, 3))
+        self.assertEqual(
+            models.OutboundMessage.objects.filter(
+                status=models.OutboundMessage.FAILED).count(),
+            3
+        )
+        self.assertFalse(models.PermissionSlipLink.objects.filter(
+            last_sent__isnull=False).exists())
+
+    def test_unsent_messages_are_failed(self):
+        """Messages the backend reports as not sent should be marked as
+        failed, whether sent over one connection or concurrently."""
+        queue_slip_emails(self.slips)
+        self.assertEqual(
+            deliver_queued_messages(connection=SilentEmailBackend()), (0, 3))
+        queue_slip_emails(self.slips)
+        with self.settings(CELERY_EMAIL_BACKEND=(
+                'paperlesspermission.test_outbox.SilentEmailBackend')):
+            self.assertEqual(deliver_queued_messages(), (0, 3))
+        self.assertFalse(models.OutboundMessage.objects.exclude(
+            status=models.OutboundMessage.FAILED).exists())
+        self.assertFalse(models.PermissionSlipLink.objects.filter(
+            last_sent__isnull=False).exists())
+
+    def test_claimed_messages_are_skipped(self):
+        """A second drainer must not pick up messages another one claimed."""
+        queue_slip_emails(self.slips)
+        claimed = claim_batch(models.OutboundMessage.EMAIL, 2)
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(deliver_queued_messages(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            set(models.OutboundMessage.objects.filter(
+                status=models.OutboundMessage.SENDING).values_list(
+                    'id', flat=True)),
+            {message.id for message in claimed})
+
+    def test_abandoned_claims_expire(self):
+        """Messages claimed by a worker that died are failed, not resent."""
+        queue_slip_emails(self.slips)
+        claim_batch(models.OutboundMessage.EMAIL, 3)
+        models.OutboundMessage.objects.update(
+            claimed=timezone.now() - datetime.timedelta(hours=2))
+        self.assertEqual(deliver_queued_messages(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(models.OutboundMessage.objects.filter(
+            status=models.OutboundMessage.FAILED).count(), 3)
+        # Queueing the slips again retries them.
+        self.assertEqual(len(queue_slip_emails(self.slips)), 3)
+
+
+class ResendTest(OutboxTest):
+    """Tests for async_resend_permission_slip and its batch version."""
+    def test_duplicate_resends_collapse(self):
+        """Resends waiting in the outbox should not be queued twice."""
+        slip = self.slips.get()
+        async_resend_permission_slip(slip.id)
+        async_resend_permission_slip(slip.id)
+        self.assertEqual(models.OutboundMessage.objects.count(), 3)
+
+    def test_batch_resend(self):
+        """Several slips are resent by one task."""
+        async_resend_permission_slips(list(self.slips.values_list('id', flat=True)))
+        self.assertEqual(models.OutboundMessage.objects.count(), 3)
+
+    def test_delivered_resend_starts_cooldown(self):
+        """A delivered resend refuses another one within the cool-down."""
+        slip = self.slips.get()
+        cooldown = datetime.timedelta(minutes=15)
+        self.assertTrue(slip.claim_resend(cooldown))
+        async_resend_permission_slip(slip.id)
+        deliver_queued_messages()
+        self.assertFalse(models.PermissionSlipLink.objects.filter(
+            permission_slip=slip, last_sent__isnull=True).exists())
+        models.PermissionSlipLink.objects.update(resend_requested_at=None)
+        self.assertFalse(slip.claim_resend(cooldown))
+
+    def test_failed_resend_may_be_retried(self):
+        """A resend that fails to deliver releases its claim."""
+        slip = self.slips.get()
+        cooldown = datetime.timedelta(minutes=15)
+        self.assertTrue(slip.claim_resend(cooldown))
+        self.assertFalse(slip.claim_resend(cooldown))
+        async_resend_permission_slip(slip.id)
+        deliver_queued_messages(connection=FailingEmailBackend())
+        links = models.PermissionSlipLink.objects.filter(permission_slip=slip)
+        self.assertFalse(links.filter(last_sent__isnull=False).exists())
+        self.assertFalse(links.filter(resend_requested_at__isnull=False).exists())
+        self.assertTrue(slip.claim_resend(cooldown))
+
+    def test_resend_after_delivery(self):
+        """Once delivered, a resend queues a fresh copy."""
+        slip = self.slips.get()
+        async_resend_permission_slip(slip.id)
+        deliver_queued_messages()
+        async_resend_permission_slip(slip.id)
+        self.assertEqual(models.OutboundMessage.objects.filter(
+            status=models.OutboundMessage.QUEUED).count(), 3)
+
+
+class DigestTest(EagerTasksMixin, OutboxTest):
+    """Tests for guardian digest messages."""
+    def setUp(self):
+        super(DigestTest, self).setUp()
+        # Give both guardians two more students on the same trip, plus a third
+        # guardian who only has one of them.
+        guardians = list(models.Guardian.objects.all())
+        for i in range(2):
+            sibling = models.Student.objects.create(
+                person_id='20230001{0}'.format(i),
+                first_name='Sibling{0}'.format(i),
+                last_name='Student',
+                email='sibling{0}@school.test'.format(i),
+                cell_number='+17035555555',
+                notify_cell=True,
+                grade_level=models.Student.FRESHMAN
+            )
+            for guardian in guardians:
+                guardian.students.add(sibling)
+            self.trip.students.add(sibling)
+        models.Guardian.objects.create(
+            person_id='2003',
+            first_name='Step',
+            last_name='Parent',
+            email='step@email.test',
+            cell_number='+17035555555',
+            notify_cell=True,
+        ).students.add(sibling)
+        self.trip.generate_permission_slips()
+        self.slips = models.PermissionSlip.objects.filter(field_trip=self.trip)
+
+    def distinct_recipients(self):
+        """Every student and guardian with a link on the trip."""
+        links = models.PermissionSlipLink.objects.filter(
+            permission_slip__field_trip=self.trip)
+        return (set(links.filter(student__isnull=False).values_list('student', flat=True))
+                | set('g{0}'.format(pk) for pk in links.filter(
+                    guardian__isnull=False).values_list('guardian', flat=True)))
+
+    def test_message_count_equals_distinct_recipients(self):
+        """Each student and each guardian should receive exactly one message."""
+        queued = queue_slip_emails(self.slips, digest=True)
+        self.assertEqual(len(queued), len(self.distinct_recipients()))
+        self.assertEqual(len(queued), 6)
+        recipients = [message.recipient for message in queued]
+        self.assertEqual(len(recipients), len(set(recipients)))
+
+    def test_digest_lists_every_child(self):
+        """A guardian's digest should link to each of their students' slips."""
+        queue_slip_emails(self.slips, digest=True)
+        message = models.OutboundMessage.objects.get(recipient='guardian@email.test')
+        guardian = models.Guardian.objects.get(person_id='2001')
+        links = models.PermissionSlipLink.objects.filter(guardian=guardian)
+        self.assertEqual(links.count(), 3)
+        self.assertEqual(message.permission_slip_links.count(), 3)
+        for slip_link in links:
+            self.assertIn(slip_link.link_id, message.body)
+            self.assertIn(slip_link.permission_slip.student.get_full_name(),
+                          message.body)
+
+    def test_single_child_gets_regular_message(self):
+        """A guardian with one student on the trip gets the usual message."""
+        queue_slip_emails(self.slips, digest=True)
+        message = models.OutboundMessage.objects.get(recipient='step@email.test')
+        self.assertTrue(message.subject.startswith('New Permission Slip for '))
+        self.assertEqual(message.permission_slip_links.count(), 1)
+
+    def test_requeue_digest_is_noop(self):
+        """Queueing the same digest twice must not duplicate it."""
+        queue_slip_emails(self.slips, digest=True)
+        self.assertEqual(queue_slip_emails(self.slips, digest=True), [])
+
+    def test_digest_sets_last_sent_on_every_link(self):
+        """Delivering a digest should mark each of its links as sent."""
+        queue_slip_emails(self.slips, digest=True)
+        deliver_queued_messages()
+        self.assertFalse(models.PermissionSlipLink.objects.filter(
+            last_sent__isnull=True).exists())
+
+    @override_settings(EMAIL_GUARDIAN_DIGEST=True)
+    def test_trip_notifications_use_digest(self):
+        """Releasing the trip should send one email per distinct recipient."""
+        async_initial_trip_notifications(self.trip.id)
+        self.assertEqual(len(mail.outbox), len(self.distinct_recipients()))
+
+    @override_settings(EMAIL_GUARDIAN_DIGEST=False)
+    def test_trip_notifications_without_digest(self):
+        """Without digest mode every link gets its own email."""
+        async_initial_trip_notifications(self.trip.id)
+        self.assertEqual(
+            len(mail.outbox),
+            models.PermissionSlipLink.objects.filter(
+                permission_slip__field_trip=self.trip).count()
+        )
@@ -0,0 +1,157 @@
+"""Test module for profiling.py
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import marshal
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+
+import paperlesspermission.models as models
+from paperlesspermission import profiling
+from paperlesspermission.tasks import async_generate_permission_slips
+from paperlesspermission.test_outbox import EagerTasksMixin
+from paperlesspermission.test_views import ViewTest
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingMiddlewareTest(ViewTest):
+    """Tests for profiling requests."""
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled(self):
+        """the middleware removes itself unless enabled"""
+        with self.assertRaises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(lambda request: None)
+        self.client.force_login(self.admin_user)
+        self.client.get(reverse('trip list'), {'profile': 1})
+        self.assertFalse(models.Profile.objects.exists())
+
+    def test_not_requested(self):
+        """requests are only profiled when asked to"""
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('trip list'))
+        self.assertNotIn('X-Profile-URL', response)
+        self.assertFalse(models.Profile.objects.exists())
+
+    def test_staff_only(self):
+        """other users cannot profile their requests"""
+        self.client.force_login(self.teacher_user)
+        self.client.get(reverse('trip list'), {'profile': 1})
+        self.client.get(reverse('trip list'), HTTP_X_PROFILE='1')
+        self.assertFalse(models.Profile.objects.exists())
+
+    def test_query_param(self):
+        """staff profile a request with a query parameter"""
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('trip list'), {'profile': 1})
+        self.assertEqual(response.status_code, 200)
+        profile = models.Profile.objects.get()
+        self.assertEqual(profile.kind, models.Profile.REQUEST)
+        self.assertEqual(profile.name, 'trip list')
+        self.assertEqual(profile.description, 'GET /trip/?profile=1')
+        self.assertGreater(profile.sql_count, 0)
+        self.assertIn('SELECT', profile.report)
+        self.assertIn('trip_list', profile.report)
+        self.assertEqual(
+            response['X-Profile-URL'],
+            reverse('admin:paperlesspermission_profile_change',
+                    args=[profile.id]))
+
+    def test_header(self):
+        """staff profile a request with a header"""
+        self.client.force_login(self.admin_user)
+        self.client.get(reverse('trip list'), HTTP_X_PROFILE='1')
+        self.assertEqual(models.Profile.objects.count(), 1)
+
+    @override_settings(PROFILING_KEEP=2)
+    def test_keep(self):
+        """only the newest profiles are kept"""
+        self.client.force_login(self.admin_user)
+        for _ in range(3):
+            self.client.get(reverse('trip list'), {'profile': 1})
+        ids = list(models.Profile.objects.order_by('id').values_list(
+            'id', flat=True))
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(ids[1] - ids[0], 1)
+
+    def test_download(self):
+        """the stats are downloaded from the admin as a .prof file"""
+        self.client.force_login(self.super_user)
+        self.client.get(reverse('trip list'), {'profile': 1})
+        profile = models.Profile.objects.get()
+        response = self.client.get(reverse(
+            'admin:paperlesspermission_profile_download', args=[profile.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('profile-{0}.prof'.format(profile.id),
+                      response['Content-Disposition'])
+        self.assertIsInstance(marshal.loads(response.content), dict)
+        response = self.client.get(reverse(
+            'admin:paperlesspermission_profile_changelist'))
+        self.assertContains(response, 'Download .prof')
+
+
+class TaskProfilingTest(EagerTasksMixin, ViewTest):
+    """Tests for profiling Celery tasks."""
+    def setUp(self):
+        super(TaskProfilingTest, self).setUp()
+        self.trip = models.FieldTrip.objects.get(name='Test Trip')
+
+    def test_not_requested(self):
+        """tasks are only profiled when asked to"""
+        async_generate_permission_slips.delay(self.trip.id)
+        self.assertFalse(models.Profile.objects.exists())
+
+    def test_header(self):
+        """a task queued with the profile header is profiled"""
+        async_generate_permission_slips.apply_async(
+            (self.trip.id,), headers={profiling.PROFILE_HEADER: True})
+        profile = models.Profile.objects.get()
+        self.assertEqual(profile.kind, models.Profile.TASK)
+        self.assertEqual(profile.name, async_generate_permission_slips.name)
+        self.assertIn('generate_permission_slips', profile.report)
+
+    def test_setting(self):
+        """every run of the tasks in PROFILE_TASKS is profiled"""
+        with self.settings(
+                PROFILE_TASKS=[async_generate_permission_slips.name]):
+            async_generate_permission_slips.delay(self.trip.id)
+            async_generate_permission_slips.delay(self.trip.id)
+        self.assertEqual(models.Profile.objects.count(), 2)
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_task_options(self):
+        """a profiled request passes the profile header on to its tasks"""
+        request = RequestFactory().get('/trip/', {'profile': 1})
+        request.user = self.admin_user
+        self.assertEqual(profiling.task_options(request),
+                         {'headers': {profiling.PROFILE_HEADER: True}})
+        request.user = self.teacher_user
+        self.assertEqual(profiling.task_options(request), {})
+
+    @override_settings(
+        PROFILING_ENABLED=True,
+        CELERY_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_nested(self):
+        """tasks run eagerly inside a profiled request share its profile"""
+        self.trip.approve()
+        self.client.force_login(self.admin_user)
+        self.client.get(reverse('release trip emails',
+                                kwargs={'trip_id': self.trip.id}),
+                        {'profile': 1})
+        profile = models.Profile.objects.get()
+        self.assertEqual(profile.kind, models.Profile.REQUEST)
+        self.assertIn('async_initial_trip_notifications', profile.report)
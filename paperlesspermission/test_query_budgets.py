@@ -0,0 +1,351 @@
+"""Query-count budgets for every view and celery task.
+
+Each view and task is run against a roster of realistic size and must not
+run more database queries than its entry in `QUERY_BUDGETS`. The budgets are
+kept in that one table so that raising one shows up in review. Costs that
+grow with the size of a trip are written in terms of `STUDENTS`, which makes
+the growth explicit; a fixed budget catches N+1 queries.
+
+When a budget is exceeded, the failure lists the actual count and every
+query that was run.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+import paperlesspermission.models as models
+from paperlesspermission import roster
+from paperlesspermission.outbox import queue_slip_notifications
+from paperlesspermission.tasks import (async_deliver_outbound_messages,
+                                       async_generate_permission_slips,
+                                       async_initial_trip_notifications,
+                                       async_resend_permission_slip,
+                                       async_resend_permission_slips,
+                                       async_send_reminders)
+from paperlesspermission.test_outbox import EagerTasksMixin
+
+# Students invited to the trip the views and tasks are run against. Each
+# student has two guardians, so the trip has STUDENTS slips and
+# 3 * STUDENTS links.
+STUDENTS = 60
+
+# Other trips shown in the trip lists.
+OTHER_TRIPS = 10
+
+# Upper bound of database queries for each view and task.
+QUERY_BUDGETS = {
+    # Views. Requests of logged in users start with the session and the user.
+    # A moderator's first request also saves their trip ids to the session.
+    'index': 0,
+    'trip list': 7,
+    'trip list (staff)': 3,
+    'trip archive': 3,
+    'trip detail': 13,
+    'trip detail POST': 17,
+    'new trip': 2,
+    'trip status': 7,
+    'trip status data': 5,
+    # Counted once for the response and once for reading its rows.
+    'trip status export': 3,
+    'approve trip': 7,
+    'archive trip': 7,
+    'slip': 1,
+    'slip POST': 2,
+    'slip reset': 4,
+    'slip resend': 8,
+    'reset trip slips': 5,
+    'resend trip slips': 9,
+    'picker search': 5,
+    # Tasks. Slips are looked up one student at a time. Messages are queued
+    # with a few queries per OUTBOX_BATCH_SIZE of them, which the trip fits
+    # in. Delivery claims each batch and records its results in two separate
+    # transactions.
+    'async_generate_permission_slips': 4 + STUDENTS,
+    'async_initial_trip_notifications': 22,
+    'async_deliver_outbound_messages': 12,
+    'async_send_reminders': 21,
+    'async_resend_permission_slips': 21,
+    'async_resend_permission_slip': 21,
+}
+
+
+@override_settings(
+    CELERY_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    BASE_URL='https://permission.test',
+    EMAIL_GUARDIAN_DIGEST=False,
+)
+class QueryBudgetTest(TestCase):
+    """Defines the roster and trips all budget test cases run against."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher_user = User.objects.create_user(
+            'teacher', email='teacher0@school.test', password='test')
+        cls.admin_user = User.objects.create_user(
+            'admin', email='admin@school.test', password='test', is_staff=True)
+
+        faculty = [models.Faculty.objects.create(
+            person_id='10{0:04}'.format(i), first_name='Teacher',
+            last_name='Number{0}'.format(i),
+            email='teacher{0}@school.test'.format(i),
+            cell_number='+17035555555', notify_cell=False,
+            preferred_name='Mx. Number{0}'.format(i),
+        ) for i in range(5)]
+        students = [models.Student.objects.create(
+            person_id='2023{0:05}'.format(i), first_name='Student',
+            last_name='Number{0}'.format(i),
+            email='student{0}@school.test'.format(i),
+            cell_number='+17035555555', notify_cell=True,
+            grade_level=models.Student.FRESHMAN,
+        ) for i in range(STUDENTS)]
+        guardians = [models.Guardian.objects.create(
+            person_id='3{0:05}'.format(i), first_name='Guardian',
+            last_name='Number{0}'.format(i),
+            email='guardian{0}@email.test'.format(i),
+            cell_number='+17035555555', notify_cell=True,
+        ) for i in range(2 * STUDENTS)]
+        models.Guardian.students.through.objects.bulk_create(
+            models.Guardian.students.through(guardian_id=guardian.id,
+                                             student_id=students[i // 2].id)
+            for i, guardian in enumerate(guardians))
+        course = models.Course.objects.create(course_number='BUDGET101',
+                                              course_name='Budgeting')
+        for number in range(2):
+            section = models.Section.objects.create(
+                section_id='BUDGET101-{0}'.format(number), course=course,
+                section_number=str(number), teacher=faculty[number],
+                school_year='2020', room='100', period='1')
+            section.students.set(students[number::2])
+        roster.rebuild()
+
+        trips = []
+        for number in range(OTHER_TRIPS + 1):
+            trip = models.FieldTrip.objects.create(
+                name='Budget Trip {0}'.format(number),
+                group_name='Budget Club',
+                location='Treasury',
+                start_date='2020-03-01',
+                dropoff_time='13:30',
+                dropoff_location='Front Entrance',
+                end_date='2020-04-01',
+                pickup_time='13:30',
+                pickup_location='Front Entrance',
+                due_date=timezone.localdate(),
+            )
+            trip.faculty.add(faculty[number % len(faculty)])
+            trips.append(trip)
+        cls.trip = trips[0]
+        cls.trip.students.set(students)
+        cls.trip.generate_permission_slips()
+        cls.trip.status = models.FieldTrip.RELEASED
+        cls.trip.save()
+
+        # Half of the slips are signed by the student.
+        for slip in models.PermissionSlip.objects.filter(
+                field_trip=cls.trip, student__in=students[::2]):
+            slip.student_signature = slip.student.get_full_name()
+            slip.student_signature_date = timezone.now()
+            slip.save()
+
+    def setUp(self):
+        # pylint: disable=invalid-name
+        super(QueryBudgetTest, self).setUp()
+        logging.disable(logging.CRITICAL)
+        cache.clear()
+        self.slip = models.PermissionSlip.objects.filter(
+            field_trip=self.trip, student_signature__isnull=True).first()
+        self.slip_link = self.slip.permissionsliplink_set.get(
+            student__isnull=False)
+
+    def tearDown(self):
+        # pylint: disable=invalid-name
+        super(QueryBudgetTest, self).tearDown()
+        logging.disable(logging.NOTSET)
+
+    def assertWithinBudget(self, name, func, *args, **kwargs):
+        """Runs `func` and fails if it runs more queries than budgeted for
+        `name`. Returns what `func` returned."""
+        # pylint: disable=invalid-name
+        budget = QUERY_BUDGETS[name]
+        with CaptureQueriesContext(connection) as context:
+            result = func(*args, **kwargs)
+        if len(context) > budget:
+            self.fail('{0} ran {1} queries, its budget is {2}:\n{3}'.format(
+                name, len(context), budget,
+                '\n'.join('{0}. {1}'.format(number, query['sql'])
+                          for number, query in enumerate(context.captured_queries,
+                                                         start=1))))
+        return result
+
+    def assertViewWithinBudget(self, name, url, method='get', data=None,
+                               status_code=200):
+        """Requests `url` within the budget of `name` and checks the status
+        code of the response."""
+        # pylint: disable=invalid-name
+        response = self.assertWithinBudget(
+            name, getattr(self.client, method), url, data)
+        self.assertEqual(response.status_code, status_code)
+        if hasattr(response, 'streaming_content'):
+            # Streamed rows are only queried for as they are read.
+            self.assertWithinBudget(name, b''.join, response.streaming_content)
+        return response
+
+
+class ViewQueryBudgetTest(QueryBudgetTest):
+    """Query budgets of the views."""
+    def test_index(self):
+        """index"""
+        self.assertViewWithinBudget('index', reverse('index'), status_code=302)
+
+    def test_trip_list(self):
+        """trip list"""
+        self.client.force_login(self.teacher_user)
+        self.assertViewWithinBudget('trip list', reverse('trip list'))
+        self.client.force_login(self.admin_user)
+        self.assertViewWithinBudget('trip list (staff)', reverse('trip list'))
+        self.assertViewWithinBudget('trip archive', reverse('trip archive'))
+
+    def test_trip_detail(self):
+        """trip detail"""
+        self.client.force_login(self.teacher_user)
+        url = reverse('trip detail', kwargs={'trip_id': self.trip.id})
+        self.assertViewWithinBudget('trip detail', url)
+        self.assertViewWithinBudget('new trip', reverse('new field trip'))
+
+    def test_trip_detail_post(self):
+        """trip detail POST"""
+        self.client.force_login(self.admin_user)
+        self.trip.status = models.FieldTrip.NEW
+        self.trip.save()
+        url = reverse('trip detail', kwargs={'trip_id': self.trip.id})
+        self.assertViewWithinBudget('trip detail POST', url, 'post', {
+            'name': 'Renamed Budget Trip',
+            'due_date': '05/05/2020',
+            'group_name': 'Budget Club',
+            'location': 'Treasury',
+            'start_date': '06/06/2020',
+            'dropoff_time': '10:10',
+            'dropoff_location': 'Front Entrance',
+            'end_date': '06/07/2020',
+            'pickup_time': '11:11',
+            'pickup_location': 'Front Entrance',
+            'faculty': list(self.trip.faculty.values_list('id', flat=True)),
+            'students': list(self.trip.students.values_list('id', flat=True)),
+        }, status_code=302)
+
+    def test_trip_status(self):
+        """trip status, its data and its export"""
+        self.client.force_login(self.teacher_user)
+        kwargs = {'trip_id': self.trip.id}
+        self.assertViewWithinBudget('trip status',
+                                    reverse('trip status', kwargs=kwargs))
+        self.assertViewWithinBudget('trip status data',
+                                    reverse('trip status data', kwargs=kwargs),
+                                    data={'length': 25})
+        self.assertViewWithinBudget('trip status export',
+                                    reverse('trip status export', kwargs=kwargs))
+
+    def test_trip_actions(self):
+        """approve and archive trip"""
+        self.client.force_login(self.admin_user)
+        self.trip.status = models.FieldTrip.NEW
+        self.trip.save()
+        kwargs = {'trip_id': self.trip.id}
+        self.assertViewWithinBudget('approve trip',
+                                    reverse('approve trip', kwargs=kwargs))
+        self.assertViewWithinBudget('archive trip',
+                                    reverse('archive trip', kwargs=kwargs))
+
+    def test_slip(self):
+        """slip"""
+        url = reverse('permission slip', kwargs={'slip_id': self.slip_link.link_id})
+        self.assertViewWithinBudget('slip', url)
+        cache.clear()
+        self.assertViewWithinBudget('slip POST', url, 'post',
+                                    {'name': 'Student Number',
+                                     'electronic_consent': 'on'})
+
+    def test_slip_actions(self):
+        """slip reset and resend"""
+        self.client.force_login(self.admin_user)
+        kwargs = {'slip_id': self.slip.id}
+        self.assertViewWithinBudget('slip reset',
+                                    reverse('reset permission slip', kwargs=kwargs),
+                                    status_code=204)
+        self.assertViewWithinBudget('slip resend',
+                                    reverse('resend permission slip', kwargs=kwargs),
+                                    status_code=204)
+
+    def test_bulk_slip_actions(self):
+        """reset and resend trip slips"""
+        self.client.force_login(self.admin_user)
+        kwargs = {'trip_id': self.trip.id}
+        self.assertViewWithinBudget('reset trip slips',
+                                    reverse('reset trip slips', kwargs=kwargs),
+                                    'post', {'filter': 'incomplete'})
+        self.assertViewWithinBudget('resend trip slips',
+                                    reverse('resend trip slips', kwargs=kwargs),
+                                    'post', {'filter': 'all'})
+
+    def test_picker_search(self):
+        """picker search"""
+        self.client.force_login(self.teacher_user)
+        field_id = self.client.get(reverse('new field trip')).context[
+            'form'].fields['students'].widget.widget_id
+        self.assertViewWithinBudget('picker search', reverse('picker search'),
+                                    data={'field_id': field_id, 'term': 'number1'})
+
+
+class TaskQueryBudgetTest(EagerTasksMixin, QueryBudgetTest):
+    """Query budgets of the celery tasks."""
+    def test_generate_permission_slips(self):
+        """async_generate_permission_slips"""
+        models.PermissionSlip.objects.filter(field_trip=self.trip).update(
+            flagged_for_review=False)
+        self.assertWithinBudget('async_generate_permission_slips',
+                                async_generate_permission_slips, self.trip.id)
+
+    def test_initial_trip_notifications(self):
+        """async_initial_trip_notifications"""
+        self.assertWithinBudget('async_initial_trip_notifications',
+                                async_initial_trip_notifications, self.trip.id)
+
+    def test_deliver_outbound_messages(self):
+        """async_deliver_outbound_messages"""
+        queue_slip_notifications(
+            models.PermissionSlip.objects.filter(field_trip=self.trip))
+        self.assertWithinBudget('async_deliver_outbound_messages',
+                                async_deliver_outbound_messages)
+
+    def test_send_reminders(self):
+        """async_send_reminders"""
+        self.assertWithinBudget('async_send_reminders', async_send_reminders)
+
+    def test_resend_permission_slips(self):
+        """async_resend_permission_slips"""
+        slip_ids = list(models.PermissionSlip.objects.filter(
+            field_trip=self.trip).values_list('id', flat=True))
+        self.assertWithinBudget('async_resend_permission_slips',
+                                async_resend_permission_slips, slip_ids)
+        self.assertWithinBudget('async_resend_permission_slip',
+                                async_resend_permission_slip, self.slip.id)
@@ -0,0 +1,134 @@
+"""Test module for reminders.py
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from datetime import timedelta
+
+from django.core import mail
+from django.test import override_settings
+from django.utils import timezone
+
+import paperlesspermission.models as models
+from paperlesspermission.reminders import (links_needing_reminder,
+                                           queue_reminders, trips_due_soon)
+from paperlesspermission.tasks import async_send_reminders
+from paperlesspermission.test_outbox import EagerTasksMixin, OutboxTest
+
+
+@override_settings(REMINDER_DAYS_BEFORE_DUE=3, REMINDER_COOLDOWN_HOURS=48,
+                   EMAIL_GUARDIAN_DIGEST=False)
+class ReminderTest(EagerTasksMixin, OutboxTest):
+    """Tests for the reminder engine."""
+    def setUp(self):
+        super(ReminderTest, self).setUp()
+        self.trip.status = models.FieldTrip.RELEASED
+        self.trip.due_date = timezone.localdate() + timedelta(days=2)
+        self.trip.save()
+        self.slip = self.slips.get()
+        self.links = models.PermissionSlipLink.objects.filter(
+            permission_slip=self.slip)
+
+    def sign_student(self):
+        self.slip.student_signature = 'Test Student'
+        self.slip.student_signature_date = timezone.now()
+        self.slip.save()
+
+    def sign_guardian(self):
+        self.slip.guardian = models.Guardian.objects.get(person_id='2001')
+        self.slip.guardian_signature = 'Guardian Student'
+        self.slip.guardian_signature_date = timezone.now()
+        self.slip.save()
+
+    def test_incomplete_slip_reminds_everyone(self):
+        """Nobody has signed, so every link needs a reminder."""
+        self.assertEqual(links_needing_reminder(self.trip).count(), 3)
+
+    def test_only_missing_parties(self):
+        """Once the student signs, only the guardians are reminded."""
+        self.sign_student()
+        reminded = links_needing_reminder(self.trip)
+        self.assertEqual(reminded.count(), 2)
+        self.assertFalse(reminded.filter(student__isnull=False).exists())
+
+    def test_guardian_signature_covers_every_guardian(self):
+        """One guardian signing means no guardian needs a reminder."""
+        self.sign_guardian()
+        reminded = links_needing_reminder(self.trip)
+        self.assertEqual(list(reminded.values_list('student', flat=True)),
+                         [self.student.id])
+
+    def test_complete_slip_is_skipped(self):
+        """Complete slips must not be reminded about."""
+        self.sign_student()
+        self.sign_guardian()
+        self.assertEqual(queue_reminders(), [])
+
+    def test_cooldown(self):
+        """Links emailed within the cool-down are skipped."""
+        now = timezone.now()
+        self.links.filter(student__isnull=False).update(
+            last_sent=now - timedelta(hours=1))
+        self.links.filter(guardian__person_id='2001').update(
+            last_sent=now - timedelta(hours=49))
+        self.assertEqual(links_needing_reminder(self.trip, now).count(), 2)
+
+    def test_trip_must_be_released(self):
+        """Trips that are not released get no reminders."""
+        self.trip.status = models.FieldTrip.ARCHIVED
+        self.trip.save()
+        self.assertFalse(trips_due_soon().exists())
+        self.assertEqual(queue_reminders(), [])
+
+    def test_due_date_outside_window(self):
+        """Slips due after the reminder window get no reminders yet."""
+        self.trip.due_date = timezone.localdate() + timedelta(days=10)
+        self.trip.save()
+        self.assertFalse(trips_due_soon().exists())
+
+    def test_slip_due_date_overrides_trip(self):
+        """A slip's own due date decides whether it is due soon."""
+        self.trip.due_date = timezone.localdate() + timedelta(days=10)
+        self.trip.save()
+        self.slip.due_date = timezone.localdate() + timedelta(days=1)
+        self.slip.save()
+        self.assertEqual(list(trips_due_soon()), [self.trip])
+        self.assertEqual(links_needing_reminder(self.trip).count(), 3)
+
+    def test_one_query_per_trip(self):
+        """Selecting the links for a trip should be a single query."""
+        with self.assertNumQueries(1):
+            list(links_needing_reminder(self.trip).select_related(
+                'guardian', 'student'))
+
+    def test_send_reminders(self):
+        """The beat task should email the missing parties once per cool-down."""
+        self.sign_student()
+        async_send_reminders()
+        self.assertEqual(len(mail.outbox), 2)
+        for message in mail.outbox:
+            self.assertTrue(message.subject.startswith('Reminder: '))
+            self.assertIn('reminder', message.body)
+        self.assertFalse(self.links.filter(
+            guardian__isnull=False, last_sent__isnull=True).exists())
+
+        async_send_reminders()
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_reminder_after_cooldown(self):
+        """A second reminder with the same text is sent after the cool-down."""
+        async_send_reminders()
+        later = timezone.now() + timedelta(hours=49)
+        self.assertEqual(len(queue_reminders(later)), 3)
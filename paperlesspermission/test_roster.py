@@ -0,0 +1,201 @@
+"""Test module for roster.py
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+import paperlesspermission.models as models
+from paperlesspermission import roster
+
+
+class NormalizeTest(SimpleTestCase):
+    """Tests for the word and trigram helpers."""
+    def test_normalize(self):
+        """Words should be lower case and free of accents and punctuation."""
+        self.assertEqual(roster.normalize("José O'Brien-Núñez"),
+                         ['jose', 'o', 'brien', 'nunez'])
+        self.assertEqual(roster.normalize(None), [])
+
+    def test_trigrams(self):
+        """Trigrams are padded so that the start of a word weighs more."""
+        self.assertEqual(roster.trigrams('ann'), {'  a', ' an', 'ann', 'nn '})
+
+
+class RosterSearchTest(TestCase):
+    """Tests for the roster search index."""
+    def setUp(self):
+        # pylint: disable=invalid-name
+        super(RosterSearchTest, self).setUp()
+        logging.disable(logging.CRITICAL)
+
+        people = (
+            ('202300001', 'Jonathan', 'Smith', 'jsmith@school.test'),
+            ('202300002', 'John', 'Smithers', 'john.smithers@school.test'),
+            ('202300003', 'Zoë', 'Adams', 'zadams@school.test'),
+        )
+        self.students = {}
+        for person_id, first_name, last_name, email in people:
+            self.students[first_name] = models.Student.objects.create(
+                person_id=person_id,
+                first_name=first_name,
+                last_name=last_name,
+                email=email,
+                cell_number='+17035555555',
+                notify_cell=False,
+                grade_level=models.Student.FRESHMAN
+            )
+        self.teacher = models.Faculty.objects.create(
+            person_id='1000001',
+            first_name='Margaret',
+            last_name='Jones',
+            email='mjones@school.test',
+            cell_number='+17035555555',
+            notify_cell=False,
+            preferred_name='Mrs. Jones'
+        )
+        self.assertEqual(roster.rebuild(), 4)
+
+    def tearDown(self):
+        # pylint: disable=invalid-name
+        super(RosterSearchTest, self).tearDown()
+        logging.disable(logging.NOTSET)
+
+    def names(self, model, term):
+        return [person.first_name for person in roster.search(model, term)]
+
+    def test_prefix(self):
+        """A prefix of any name should find the person, exact words first."""
+        self.assertEqual(self.names(models.Student, 'smith'), ['Jonathan', 'John'])
+        self.assertEqual(self.names(models.Student, 'jo'), ['Jonathan', 'John'])
+
+    def test_every_word_must_match(self):
+        """Each word of the term narrows the results down."""
+        self.assertEqual(self.names(models.Student, 'jo smithers'), ['John'])
+
+    def test_misspelling(self):
+        """Trigrams should find names that are slightly misspelled."""
+        self.assertEqual(self.names(models.Student, 'smyth'), ['Jonathan'])
+        self.assertEqual(self.names(models.Student, 'john smithrs'), ['John'])
+        self.assertEqual(self.names(models.Student, 'xyzzy'), [])
+
+    def test_accents(self):
+        """Names should be found with or without accents."""
+        self.assertEqual(self.names(models.Student, 'ZOE'), ['Zoë'])
+
+    def test_email_local_part(self):
+        """People are found by their email address too."""
+        self.assertEqual(self.names(models.Student, 'johnsmithers'), ['John'])
+        self.assertEqual(self.names(models.Student, 'jsmith'), ['Jonathan'])
+
+    def test_faculty_preferred_name(self):
+        """Faculty are found by their preferred name, and only as faculty."""
+        self.assertEqual(self.names(models.Faculty, 'mrs jones'), ['Margaret'])
+        self.assertEqual(self.names(models.Student, 'jones'), [])
+
+    def test_empty_term(self):
+        """An empty term matches nobody but leaves querysets alone."""
+        self.assertEqual(roster.search(models.Student, ' - '), [])
+        queryset = models.Student.objects.all()
+        self.assertEqual(roster.filter_queryset(queryset, ''), queryset)
+
+    def test_rebuild_replaces_rows(self):
+        """Rebuilding must drop words of renamed people."""
+        self.students['Zoë'].first_name = 'Chloe'
+        self.students['Zoë'].save()
+        roster.rebuild([models.Student])
+        self.assertEqual(self.names(models.Student, 'zoe'), [])
+        self.assertEqual(self.names(models.Student, 'chloe'), ['Chloe'])
+        self.assertEqual(self.names(models.Faculty, 'jones'), ['Margaret'])
+
+    def test_filter_queryset_ranks(self):
+        """Filtered querysets are ordered best match first and capped."""
+        queryset = models.Student.objects.order_by('first_name')
+        self.assertEqual(
+            [student.first_name
+             for student in roster.filter_queryset(queryset, 'smith')],
+            ['Jonathan', 'John'])
+        self.assertEqual(
+            [student.first_name
+             for student in roster.filter_queryset(queryset, 'jo', limit=1)],
+            ['Jonathan'])
+        self.assertFalse(roster.filter_queryset(queryset, 'xyzzy').exists())
+
+    def add_students(self, first_name, count, hidden):
+        models.Student.objects.bulk_create(models.Student(
+            person_id='2024{0:05}{1}'.format(i, int(hidden)),
+            first_name=first_name,
+            last_name='Student{0}'.format(i),
+            email='',
+            cell_number='+17035555555',
+            notify_cell=False,
+            grade_level=models.Student.FRESHMAN,
+            hidden=hidden
+        ) for i in range(count))
+        roster.rebuild([models.Student])
+
+    def test_filter_queryset_before_cap(self):
+        """People outside the queryset must not take up the capped results."""
+        self.add_students('Alex', 150, hidden=True)
+        visible = models.Student.objects.create(
+            person_id='202500001',
+            first_name='Alex',
+            last_name='Visible',
+            email='avisible@school.test',
+            cell_number='+17035555555',
+            notify_cell=False,
+            grade_level=models.Student.FRESHMAN
+        )
+        roster.rebuild([models.Student])
+        queryset = models.Student.objects.filter(hidden=False)
+        self.assertEqual(list(roster.filter_queryset(queryset, 'alex')),
+                         [visible])
+
+    def test_search_queries(self):
+        """Each word costs one query, plus two if it is misspelled."""
+        with self.assertNumQueries(2):
+            roster.search_pks(models.Student, 'jon smith')
+        with self.assertNumQueries(4):
+            roster.search_pks(models.Student, 'jon smyth')
+
+    def test_admin_search(self):
+        """The admin change list searches through the index."""
+        User.objects.create_superuser('super', 'super@school.test', 'test')
+        self.client.login(username='super', password='test')
+        response = self.client.get(
+            reverse('admin:paperlesspermission_student_changelist'), {'q': 'smyth'})
+        self.assertEqual(
+            sorted(student.first_name for student in response.context['cl'].result_list),
+            ['Jonathan'])
+
+    def test_admin_search_uncapped(self):
+        """The admin change list finds every match, best first."""
+        self.add_students('Alex', 150, hidden=False)
+        User.objects.create_superuser('super', 'super@school.test', 'test')
+        self.client.login(username='super', password='test')
+        url = reverse('admin:paperlesspermission_student_changelist')
+        self.assertEqual(
+            self.client.get(url, {'q': 'alex'}).context['cl'].result_count, 150)
+        results = self.client.get(url, {'q': 'smith'}).context['cl'].result_list
+        self.assertEqual([student.first_name for student in results],
+                         ['Jonathan', 'John'])
+        # Sorting by first name replaces the rank.
+        results = self.client.get(url, {'q': 'smith', 'o': '2'}).context['cl'].result_list
+        self.assertEqual([student.first_name for student in results],
+                         ['John', 'Jonathan'])
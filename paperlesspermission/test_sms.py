@@ -0,0 +1,129 @@
+"""Test module for sms.py and the SMS channel of the outbox.
+
+Copyright 2020 Mark Stenglein, The Paperless Permission Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from io import StringIO
+import os
+import tempfile
+
+from django.core import mail
+from django.test import SimpleTestCase, override_settings
+
+import paperlesspermission.models as models
+from paperlesspermission import sms
+from paperlesspermission.outbox import (deliver_queued_messages,
+                                        queue_link_messages,
+                                        queue_slip_notifications)
+from paperlesspermission.tasks import async_initial_trip_notifications
+from paperlesspermission.test_outbox import EagerTasksMixin, OutboxTest
+
+
+class SMSBackendTest(SimpleTestCase):
+    """Tests for the SMS stand-in backends."""
+    def setUp(self):
+        # pylint: disable=invalid-name
+        super(SMSBackendTest, self).setUp()
+        sms.outbox.clear()
+
+    def test_console_backend(self):
+        """The console backend should write each message to its stream."""
+        stream = StringIO()
+        backend = sms.ConsoleSMSBackend(stream=stream)
+        sent = backend.send_messages([sms.SMSMessage('Hello', ['+17035555555']),
+                                      sms.SMSMessage('Nobody', [])])
+        self.assertEqual(sent, 1)
+        self.assertIn('To: +17035555555\nHello\n', stream.getvalue())
+        self.assertNotIn('Nobody', stream.getvalue())
+
+    def test_file_backend(self):
+        """The file backend should append messages to SMS_FILE_PATH."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sms.log')
+            with override_settings(SMS_FILE_PATH=path):
+                for body in ('First', 'Second'):
+                    sms.get_sms_connection(
+                        'paperlesspermission.sms.FileSMSBackend'
+                    ).send_messages([sms.SMSMessage(body, ['+17035555555'])])
+            with open(path) as sms_file:
+                contents = sms_file.read()
+        self.assertIn('First', contents)
+        self.assertIn('Second', contents)
+
+    @override_settings(SMS_BACKEND='paperlesspermission.sms.LocMemSMSBackend')
+    def test_get_sms_connection(self):
+        """SMS_BACKEND should choose the backend."""
+        backend = sms.get_sms_connection()
+        self.assertIsInstance(backend, sms.LocMemSMSBackend)
+        backend.send_messages([sms.SMSMessage('Hello', ['+17035555555'])])
+        self.assertEqual(len(sms.outbox), 1)
+
+
+@override_settings(SMS_ENABLED=True,
+                   SMS_BACKEND='paperlesspermission.sms.LocMemSMSBackend',
+                   SMS_SEND_RATE=0,
+                   EMAIL_GUARDIAN_DIGEST=False)
+class SMSChannelTest(EagerTasksMixin, OutboxTest):
+    """Tests for SMS notifications through the outbox."""
+    def setUp(self):
+        super(SMSChannelTest, self).setUp()
+        sms.outbox.clear()
+        models.Guardian.objects.filter(person_id='2002').update(notify_cell=False)
+        self.links = models.PermissionSlipLink.objects.filter(
+            permission_slip__field_trip=self.trip)
+
+    def test_respects_notify_cell(self):
+        """Only people with notify_cell set should be texted."""
+        queued = queue_link_messages(self.links, channel=models.OutboundMessage.SMS)
+        self.assertEqual(len(queued), 2)
+        self.assertFalse(self.links.filter(
+            guardian__person_id='2002',
+            outboundmessage__channel=models.OutboundMessage.SMS).exists())
+
+    def test_sms_body(self):
+        """Texts go to the E.164 number and link to the permission slip."""
+        queue_link_messages(self.links, channel=models.OutboundMessage.SMS)
+        self.assertEqual(deliver_queued_messages(channel=models.OutboundMessage.SMS),
+                         (2, 0))
+        self.assertEqual(len(sms.outbox), 2)
+        slip_link = self.links.get(student__isnull=False)
+        message = [message for message in sms.outbox
+                   if slip_link.link_id in message.body][0]
+        self.assertEqual(message.to, ['+17035555555'])
+        self.assertIn('Test Trip', message.body)
+
+    def test_channels_are_drained_separately(self):
+        """Draining email must not send the SMS and vice versa."""
+        queue_slip_notifications(self.slips)
+        self.assertEqual(deliver_queued_messages(), (3, 0))
+        self.assertEqual(sms.outbox, [])
+        self.assertEqual(deliver_queued_messages(channel=models.OutboundMessage.SMS),
+                         (2, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_release_sends_email_and_sms(self):
+        """Trip notifications should go out on both channels."""
+        async_initial_trip_notifications(self.trip.id)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(len(sms.outbox), 2)
+        self.assertFalse(models.OutboundMessage.objects.exclude(
+            status=models.OutboundMessage.SENT).exists())
+
+    @override_settings(SMS_ENABLED=False)
+    def test_disabled(self):
+        """Nothing is texted while SMS_ENABLED is off."""
+        async_initial_trip_notifications(self.trip.id)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(sms.outbox, [])
@@ -15,16 +15,21 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import csv
+import io
 import logging
 from time import sleep
-from datetime import date, time
+from datetime import date, time, timedelta
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 import paperlesspermission.views as views
 import paperlesspermission.models as models
+from paperlesspermission import roster, slipcache
 
 class ViewTest(TestCase):
     """Defines functions and data available to all view test cases."""
@@ -34,6 +39,7 @@ class ViewTest(TestCase):
         super(ViewTest, self).setUp()
 
         logging.disable(logging.CRITICAL)
+        cache.clear()
 
         self.teacher_user = User.objects.create_user(
             'teacher',
@@ -805,6 +811,111 @@ class SlipViewTests(ViewTest):
             html=False,
         )
 
+    def test_slip_view_get_one_query(self):
+        """Loading a slip page should take a single query."""
+        slip_link = models.PermissionSlipLink.objects.get(
+            permission_slip__field_trip_id=1,
+            guardian__person_id='2001'
+        )
+        slip_url = reverse('permission slip', kwargs={'slip_id': slip_link.link_id})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(slip_url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_slip_view_post_two_queries(self):
+        """Signing a slip should take one query to load it and one to save it."""
+        slip_link = models.PermissionSlipLink.objects.get(
+            permission_slip__field_trip_id=1,
+            guardian__person_id='2001'
+        )
+        slip_url = reverse('permission slip', kwargs={'slip_id': slip_link.link_id})
+
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                slip_url,
+                {
+                    'name': 'Guardian 1 Name',
+                    'electronic_consent': True,
+                },
+            )
+        self.assertContains(response, 'Guardian Student', status_code=200)
+
+class SlipPageCacheTest(ViewTest):
+    """Test the cache of slip page data."""
+    def setUp(self):
+        super(SlipPageCacheTest, self).setUp()
+        slipcache.reset_stats()
+        self.permission_slip = models.PermissionSlip.objects.get(
+            field_trip_id=1,
+            student__person_id='202300001'
+        )
+        self.guardian_url = reverse('permission slip', kwargs={
+            'slip_id': self.permission_slip.permissionsliplink_set.get(
+                guardian__person_id='2001').link_id})
+        self.student_url = reverse('permission slip', kwargs={
+            'slip_id': self.permission_slip.permissionsliplink_set.get(
+                student__isnull=False).link_id})
+
+    def test_hit_runs_no_queries(self):
+        """A cached slip page should be served without touching the database."""
+        # The first load only learns which slip and trip the link belongs to.
+        self.client.get(self.guardian_url)
+        self.client.get(self.guardian_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.guardian_url)
+        self.assertContains(response, 'Parent Submission', status_code=200)
+        self.assertIn('csrf_token', response.context)
+        self.assertEqual(slipcache.stats(),
+                         {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3})
+
+    def test_change_while_loading(self):
+        """A page loaded before a change must not be cached after it."""
+        link_id = self.permission_slip.permissionsliplink_set.get(
+            guardian__person_id='2001').link_id
+        slip_id, trip_id = self.permission_slip.id, self.permission_slip.field_trip_id
+        self.client.get(self.guardian_url)
+        tokens = slipcache.page_tokens(link_id)
+        self.assertIsNotNone(tokens)
+        slipcache.invalidate_slip(slip_id)
+        slipcache.set_page(link_id, slip_id, trip_id, {'stale': True}, tokens)
+        self.assertIsNone(slipcache.get_page(link_id))
+        slipcache.set_page(link_id, slip_id, trip_id, {'fresh': True},
+                           slipcache.page_tokens(link_id))
+        self.assertEqual(slipcache.get_page(link_id), {'fresh': True})
+
+    def test_signing_invalidates(self):
+        """Pages of a slip must show a signature made through another link."""
+        self.client.get(self.student_url)
+        self.client.post(self.guardian_url, {
+            'name': 'Guardian 1 Name',
+            'electronic_consent': True,
+        })
+        response = self.client.get(self.student_url)
+        self.assertContains(response, 'Guardian Student', status_code=200)
+        self.assertEqual(slipcache.stats()['hits'], 0)
+
+    def test_reset_invalidates(self):
+        """Resetting a slip must show it unsigned again."""
+        self.client.post(self.guardian_url, {
+            'name': 'Guardian 1 Name',
+            'electronic_consent': True,
+        })
+        self.assertContains(self.client.get(self.student_url), 'Guardian Student')
+        self.permission_slip.refresh_from_db()
+        self.permission_slip.reset()
+        self.permission_slip.save()
+        self.assertNotContains(self.client.get(self.student_url), 'Guardian Student')
+
+    def test_trip_change_invalidates(self):
+        """Changing the trip must show the new trip details."""
+        self.client.get(self.student_url)
+        trip = models.FieldTrip.objects.get(id=1)
+        trip.location = 'Somewhere Else'
+        trip.save()
+        self.assertContains(self.client.get(self.student_url), 'Somewhere Else')
+
+
 class TripListViewTest(ViewTest):
     """Test the trip_list view."""
     def test_trip_list_view_exists(self):
@@ -906,6 +1017,147 @@ class TripListViewTest(ViewTest):
         response = self.client.get(reverse('trip archive'))
         self.assertEqual(response.status_code, 403)
 
+class TripSlipStatsTest(ViewTest):
+    """tests for the permission slip statistics shown with trips"""
+    def setUp(self):
+        super(TripSlipStatsTest, self).setUp()
+        trip = models.FieldTrip.objects.get(id=2)
+        trip.generate_permission_slips()
+        complete, student_only = models.PermissionSlip.objects.filter(
+            field_trip=trip).order_by('student__person_id')
+        complete.student_signature = 'Signed'
+        complete.student_signature_date = timezone.now()
+        complete.guardian = models.Guardian.objects.get(person_id='2002')
+        complete.guardian_signature = 'Signed'
+        complete.guardian_signature_date = timezone.now()
+        complete.save()
+        student_only.student_signature = 'Signed'
+        student_only.student_signature_date = timezone.now()
+        student_only.due_date = date(2020, 3, 20)
+        student_only.save()
+
+    def test_one_query(self):
+        """statistics for every trip should come from a single query"""
+        with self.assertNumQueries(1):
+            trips = {trip.id: trip for trip in
+                     models.FieldTrip.objects.with_slip_stats(today=date(2020, 3, 1))}
+        self.assertEqual(trips[1].slips_total, 1)
+        self.assertEqual(trips[2].slips_total, 2)
+        self.assertEqual(trips[2].slips_student_signed, 2)
+        self.assertEqual(trips[2].slips_guardian_signed, 1)
+        self.assertEqual(trips[2].slips_complete, 1)
+        self.assertEqual(trips[2].slips_overdue, 0)
+
+    def test_overdue(self):
+        """incomplete slips past their own or the trip's due date are overdue"""
+        trips = models.FieldTrip.objects.filter(id=2)
+        self.assertEqual(trips.with_slip_stats(today=date(2020, 3, 18)).get().slips_overdue, 0)
+        self.assertEqual(trips.with_slip_stats(today=date(2020, 3, 21)).get().slips_overdue, 1)
+
+    def test_faculty_join_does_not_inflate_counts(self):
+        """filtering by faculty must not multiply the counts"""
+        trip = models.FieldTrip.objects.get(id=2)
+        trip.faculty.add(models.Faculty.objects.get(person_id='1000001'))
+        trip = models.FieldTrip.objects.filter(
+            faculty__email='jwest@school.test').with_slip_stats().get()
+        self.assertEqual(trip.slips_total, 2)
+
+    def test_trip_list_shows_stats(self):
+        """the trip list should show each trip's statistics"""
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('trip list'))
+        trip = [trip for trip in response.context['trips'] if trip.id == 2][0]
+        self.assertEqual(trip.slips_complete, 1)
+
+    def test_trip_status_shows_stats(self):
+        """the trip status page should show the trip's statistics"""
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('trip status', kwargs={'trip_id': 2}))
+        self.assertEqual(response.context['trip'].slips_total, 2)
+        self.assertContains(response, '<b>Complete: </b>1', html=False)
+
+class ConditionalGetTest(ViewTest):
+    """tests for ETag and Last-Modified on the slip and trip status pages"""
+    def setUp(self):
+        super(ConditionalGetTest, self).setUp()
+        self.permission_slip = models.PermissionSlip.objects.get(
+            field_trip_id=1, student__person_id='202300001')
+        self.slip_url = reverse('permission slip', kwargs={
+            'slip_id': self.permission_slip.permissionsliplink_set.get(
+                guardian__person_id='2001').link_id})
+        self.status_url = reverse('trip status', kwargs={'trip_id': 1})
+
+    def revalidate(self, url):
+        # The first visit sets the CSRF cookie, which the ETag depends on.
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('Last-Modified'))
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def sign_student(self):
+        self.permission_slip.student_signature = 'Signed'
+        self.permission_slip.student_signature_date = timezone.now()
+        self.permission_slip.save()
+
+    def test_slip_not_modified(self):
+        """an unchanged slip page should not be rendered again"""
+        self.client.get(self.slip_url)
+        etag = self.client.get(self.slip_url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.slip_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_slip_modified_by_signature(self):
+        """signing the slip should change its validators"""
+        etag = self.client.get(self.slip_url)['ETag']
+        self.sign_student()
+        response = self.client.get(self.slip_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_slip_modified_by_trip(self):
+        """editing the trip should change the validators of its slips"""
+        etag = self.client.get(self.slip_url)['ETag']
+        trip = models.FieldTrip.objects.get(id=1)
+        trip.location = 'Somewhere Else'
+        trip.save()
+        response = self.client.get(self.slip_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Somewhere Else', status_code=200)
+
+    def test_trip_status_not_modified(self):
+        """an unchanged trip status page should not be rendered again"""
+        self.client.force_login(self.admin_user)
+        response = self.revalidate(self.status_url)
+        self.assertEqual(response.status_code, 304)
+        self.assertTemplateNotUsed(response, 'paperlesspermission/trip_status.html')
+
+    def test_trip_status_modified_by_slip(self):
+        """a slip changing should change the trip status validators"""
+        self.client.force_login(self.admin_user)
+        etag = self.client.get(self.status_url)['ETag']
+        self.sign_student()
+        response = self.client.get(self.status_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_trip_status_per_user(self):
+        """validators from one user must not match another user's page"""
+        self.client.force_login(self.admin_user)
+        etag = self.client.get(self.status_url)['ETag']
+        self.client.force_login(self.super_user)
+        response = self.client.get(self.status_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_updated_at_with_update_fields(self):
+        """saving only some fields should still touch updated_at"""
+        updated_at = self.permission_slip.updated_at
+        self.permission_slip.flagged_for_review = True
+        self.permission_slip.save(update_fields=['flagged_for_review'])
+        self.permission_slip.refresh_from_db()
+        self.assertGreater(self.permission_slip.updated_at, updated_at)
+
 class TripDetailTest(ViewTest):
     """Tests the trip_detail view"""
     def test_trip_detail_exists(self):
@@ -1305,6 +1557,158 @@ class TripStatusViewTest(ViewTest):
         url = reverse('trip status', kwargs={'trip_id': 1})
         self.check_view_redirect(url, '/login?next={0}'.format(url))
 
+class TripStatusDataViewTest(ViewTest):
+    """tests for the trip_status_data view"""
+    def setUp(self):
+        super(TripStatusDataViewTest, self).setUp()
+        trip = models.FieldTrip.objects.get(id=1)
+        for i in range(30):
+            trip.students.add(models.Student.objects.create(
+                person_id='2024000{0:02}'.format(i),
+                first_name='Extra{0:02}'.format(i),
+                last_name='Student',
+                email='extra{0}@school.test'.format(i),
+                cell_number='+17035555555',
+                notify_cell=False,
+                grade_level=models.Student.SOPHOMORE
+            ))
+        trip.generate_permission_slips()
+
+    def get_data(self, trip_id=1, user=None, **params):
+        self.client.force_login(user or self.admin_user)
+        return self.client.get(
+            reverse('trip status data', kwargs={'trip_id': trip_id}), params)
+
+    def test_mapping(self):
+        """trip_status_data should map to /trip/<int:trip_id>/status/data/"""
+        self.assertEqual(reverse('trip status data', kwargs={'trip_id': 1}),
+                         '/trip/1/status/data/')
+
+    def test_redirect_anonymous(self):
+        """should redirect anonymous users to the login page"""
+        url = reverse('trip status data', kwargs={'trip_id': 1})
+        self.check_view_redirect(url, '/login?next={0}'.format(url))
+
+    def test_not_moderator(self):
+        """faculty who do not moderate the trip should get 403"""
+        response = self.get_data(trip_id=2, user=self.teacher_user)
+        self.assertEqual(response.status_code, 403)
+
+    def test_moderator(self):
+        """faculty moderating the trip should get the data"""
+        response = self.get_data(user=self.teacher_user)
+        self.assertEqual(response.status_code, 200)
+
+    def test_paging(self):
+        """only the requested page of rows should be returned"""
+        data = self.get_data(draw=3, start=10, length=10).json()
+        self.assertEqual(data['draw'], 3)
+        self.assertEqual(data['recordsTotal'], 31)
+        self.assertEqual(data['recordsFiltered'], 31)
+        self.assertEqual(len(data['data']), 10)
+
+    def test_length_capped(self):
+        """asking for every row should return at most one capped page"""
+        for length in (-1, 1000):
+            data = self.get_data(length=length).json()
+            self.assertEqual(len(data['data']),
+                             min(31, views.STATUS_TABLE_MAX_LENGTH))
+
+    def test_sorting(self):
+        """rows should be sorted in the database by the requested column"""
+        data = self.get_data(**{'order[0][column]': 0, 'order[0][dir]': 'desc',
+                                'length': 3}).json()
+        self.assertEqual([row['student'] for row in data['data']],
+                         ['Test Student', 'Extra29 Student', 'Extra28 Student'])
+
+    def test_search(self):
+        """search should filter rows and report the filtered count"""
+        data = self.get_data(**{'search[value]': 'extra0'}).json()
+        self.assertEqual(data['recordsTotal'], 31)
+        self.assertEqual(data['recordsFiltered'], 10)
+        data = self.get_data(**{'search[value]': 'test student'}).json()
+        self.assertEqual([row['student'] for row in data['data']], ['Test Student'])
+
+    def test_signature_escaped(self):
+        """signatures typed in by the public should come back HTML-escaped"""
+        student = models.Student.objects.get(person_id='202300001')
+        link = models.PermissionSlipLink.objects.get(
+            permission_slip__field_trip_id=1, student=student)
+        slip_url = reverse('permission slip', kwargs={'slip_id': link.link_id})
+        self.client.post(slip_url, {'name': '<script>alert(1)</script>',
+                                    'electronic_consent': True})
+        data = self.get_data(**{'search[value]': 'test student'}).json()
+        self.assertEqual(data['data'][0]['student_signature'],
+                         '&lt;script&gt;alert(1)&lt;/script&gt;')
+
+    def test_bad_parameters(self):
+        """malformed parameters should get 400"""
+        self.assertEqual(self.get_data(start='x').status_code, 400)
+        self.assertEqual(self.get_data(**{'order[0][column]': 20}).status_code, 400)
+
+    def test_query_count_independent_of_page_size(self):
+        """related rows should be joined rather than loaded per row"""
+        self.client.force_login(self.admin_user)
+        url = reverse('trip status data', kwargs={'trip_id': 1})
+        self.client.get(url, {'length': 1})
+        with self.assertNumQueries(5):
+            # session, user, trip, count and one page of slips
+            self.client.get(url, {'length': 1})
+        with self.assertNumQueries(5):
+            self.client.get(url, {'length': 30})
+
+class TripStatusExportViewTest(ViewTest):
+    """tests for the trip_status_export view"""
+    def get_export(self, trip_id=1, user=None, **params):
+        self.client.force_login(user or self.admin_user)
+        response = self.client.get(
+            reverse('trip status export', kwargs={'trip_id': trip_id}), params)
+        return response
+
+    def export_rows(self, response):
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_mapping(self):
+        """trip_status_export should map to /trip/<int:trip_id>/status/export/"""
+        self.assertEqual(reverse('trip status export', kwargs={'trip_id': 1}),
+                         '/trip/1/status/export/')
+
+    def test_redirect_anonymous(self):
+        """should redirect anonymous users to the login page"""
+        url = reverse('trip status export', kwargs={'trip_id': 1})
+        self.check_view_redirect(url, '/login?next={0}'.format(url))
+
+    def test_not_moderator(self):
+        """faculty who do not moderate the trip should get 403"""
+        self.assertEqual(self.get_export(trip_id=2, user=self.teacher_user).status_code, 403)
+
+    def test_streams_csv(self):
+        """the export should be a streamed CSV attachment"""
+        response = self.get_export()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = self.export_rows(response)
+        self.assertEqual(rows[0][0], 'Student Name')
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], 'Test Student')
+        self.assertEqual(rows[1][3], 'Guardian Student; OtherGuardian Student')
+
+    def test_incomplete_only(self):
+        """incomplete=1 should leave out slips with both signatures"""
+        slip = models.PermissionSlip.objects.get(field_trip__id=1)
+        slip.student_signature = 'Signed'
+        slip.student_signature_date = timezone.now()
+        slip.save()
+        self.assertEqual(len(self.export_rows(self.get_export(incomplete=1))), 2)
+        slip.guardian = models.Guardian.objects.get(person_id='2001')
+        slip.guardian_signature = 'Signed'
+        slip.guardian_signature_date = timezone.now()
+        slip.save()
+        self.assertEqual(len(self.export_rows(self.get_export())), 2)
+        self.assertEqual(len(self.export_rows(self.get_export(incomplete=1))), 1)
+
 class NewTripViewTest(ViewTest):
     """tests for the new_trip view"""
     def test_exists(self):
@@ -1320,6 +1724,72 @@ class NewTripViewTest(ViewTest):
         url = reverse('new field trip')
         self.check_view_redirect(url, '/login?next={0}'.format(url))
 
+class PickerSearchViewTest(ViewTest):
+    """Tests the server side search of the trip form pickers"""
+    def setUp(self):
+        super(PickerSearchViewTest, self).setUp()
+        course = models.Course.objects.create(
+            course_number='XEN101', course_name='Xenobiology')
+        for number in range(3):
+            models.Section.objects.create(
+                section_id='XEN101-{0}'.format(number),
+                course=course,
+                section_number=str(number),
+                school_year='2020',
+                room='101',
+                period='1',
+            )
+        roster.rebuild()
+        self.client.force_login(self.teacher_user)
+        self.form = self.client.get(reverse('new field trip')).context['form']
+
+    def search(self, field, term):
+        return self.client.get(reverse('picker search'), {
+            'field_id': self.form.fields[field].widget.widget_id,
+            'term': term,
+        })
+
+    def test_choices_not_rendered(self):
+        """the new trip page should not list every choice"""
+        response = self.client.get(reverse('new field trip'))
+        self.assertNotContains(response, 'ahanson')
+        self.assertNotContains(response, 'Xenobiology - Section')
+
+    def test_selected_choices_rendered(self):
+        """choices already on the trip should still be shown"""
+        response = self.client.get(reverse('trip detail', kwargs={'trip_id': 1}))
+        self.assertContains(response, 'Mrs. Teacher')
+
+    def test_search_students(self):
+        """students should be found through the roster search index"""
+        response = self.search('students', 'ali')
+        self.assertEqual([result['text'] for result in response.json()['results']],
+                         ['ahanson'])
+        self.assertEqual(self.search('students', 'zzz').json()['results'], [])
+
+    def test_search_sections_with_course(self):
+        """sections should be loaded with their course"""
+        # Session, user, count and one query for the page of sections.
+        with self.assertNumQueries(4):
+            response = self.search('sections', 'xeno')
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertEqual(response.json()['results'][0]['text'],
+                         'Xenobiology - Section 0')
+
+    def test_search_paginated(self):
+        """results should come a page at a time"""
+        widget = self.form.fields['sections'].widget
+        widget.max_results = 2
+        widget.set_to_cache()
+        data = self.search('sections', 'xeno').json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertTrue(data['more'])
+
+    def test_search_requires_login(self):
+        """anonymous users must not be able to search"""
+        self.client.logout()
+        self.assertEqual(self.search('students', 'ali').status_code, 302)
+
 class SlipResetViewTest(ViewTest):
     """tests for the slip_reset view"""
     def test_exists(self):
@@ -1335,6 +1805,99 @@ class SlipResetViewTest(ViewTest):
         url = reverse('reset permission slip', kwargs={'slip_id': 1})
         self.check_view_redirect(url, '/login?next={0}'.format(url))
 
+class TripSlipsBulkViewTest(ViewTest):
+    """tests for the bulk reset and resend views"""
+    def setUp(self):
+        super(TripSlipsBulkViewTest, self).setUp()
+        self.trip = models.FieldTrip.objects.get(id=2)
+        self.trip.generate_permission_slips()
+        self.slips = list(models.PermissionSlip.objects.filter(
+            field_trip=self.trip).order_by('id'))
+        for slip in self.slips:
+            slip.student_signature = 'Signed'
+            slip.student_signature_date = timezone.now()
+            slip.save()
+        self.reset_url = reverse('reset trip slips', kwargs={'trip_id': 2})
+        self.resend_url = reverse('resend trip slips', kwargs={'trip_id': 2})
+
+    def test_mapping(self):
+        """the bulk views should map to /trip/<int:trip_id>/slips/<action>/"""
+        self.assertEqual(self.reset_url, '/trip/2/slips/reset/')
+        self.assertEqual(self.resend_url, '/trip/2/slips/resend/')
+
+    def test_redirect_anonymous(self):
+        """should redirect anonymous users to the login page"""
+        response = self.client.post(self.reset_url, {'filter': 'all'})
+        self.assertRedirects(response, '/login?next={0}'.format(self.reset_url),
+                             fetch_redirect_response=False)
+
+    def test_not_staff(self):
+        """Non-staff users should get 403 and nothing should be reset"""
+        self.client.force_login(self.teacher_user)
+        response = self.client.post(self.reset_url, {'filter': 'all'})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(models.PermissionSlip.objects.filter(
+            field_trip=self.trip, status=models.PermissionSlip.NONE).exists())
+
+    def test_post_only(self):
+        """Bulk actions change data, so GET is not allowed"""
+        self.client.force_login(self.admin_user)
+        self.assertEqual(self.client.get(self.reset_url).status_code, 405)
+
+    def test_reset_selected(self):
+        """Only the listed slips should be reset"""
+        self.client.force_login(self.admin_user)
+        response = self.client.post(self.reset_url, {'slip': [self.slips[0].id]})
+        self.assertEqual(response.json(), {'reset': 1})
+        self.slips[0].refresh_from_db()
+        self.slips[1].refresh_from_db()
+        self.assertIsNone(self.slips[0].student_signature)
+        self.assertEqual(self.slips[0].status, models.PermissionSlip.NONE)
+        self.assertEqual(self.slips[1].student_signature, 'Signed')
+
+    def test_reset_other_trip_ignored(self):
+        """Slips of another trip must not be reset through this trip"""
+        other = models.PermissionSlip.objects.get(field_trip_id=1)
+        other.student_signature = 'Signed'
+        other.student_signature_date = timezone.now()
+        other.save()
+        self.client.force_login(self.admin_user)
+        response = self.client.post(self.reset_url, {'slip': [other.id]})
+        self.assertEqual(response.json(), {'reset': 0})
+        other.refresh_from_db()
+        self.assertEqual(other.student_signature, 'Signed')
+
+    def test_reset_incomplete(self):
+        """The incomplete filter should leave complete slips alone"""
+        complete = self.slips[0]
+        complete.guardian = models.Guardian.objects.filter(
+            students=complete.student).first()
+        complete.guardian_signature = 'Signed'
+        complete.guardian_signature_date = timezone.now()
+        complete.save()
+        self.client.force_login(self.admin_user)
+        response = self.client.post(self.reset_url, {'filter': 'incomplete'})
+        self.assertEqual(response.json(), {'reset': 1})
+        complete.refresh_from_db()
+        self.assertEqual(complete.status, models.PermissionSlip.COMPLETE)
+
+    def test_bad_selection(self):
+        """Missing or malformed selections should get 400"""
+        self.client.force_login(self.admin_user)
+        for data in ({}, {'filter': 'everything'}, {'slip': ['one']}):
+            self.assertEqual(self.client.post(self.reset_url, data).status_code, 400)
+
+    def test_resend(self):
+        """Slips should be claimed for a resend once per cool-down"""
+        self.client.force_login(self.admin_user)
+        response = self.client.post(self.resend_url, {'filter': 'all'})
+        self.assertEqual(response.json(), {'resent': 2, 'skipped': 0})
+        self.assertFalse(models.PermissionSlipLink.objects.filter(
+            permission_slip__field_trip=self.trip,
+            resend_requested_at__isnull=True).exists())
+        response = self.client.post(self.resend_url, {'slip': [self.slips[0].id]})
+        self.assertEqual(response.json(), {'resent': 0, 'skipped': 1})
+
 class SlipResendViewTest(ViewTest):
     """tests for the slip_resend view"""
     def test_exists(self):
@@ -1350,3 +1913,41 @@ class SlipResendViewTest(ViewTest):
         url = reverse('resend permission slip', kwargs={'slip_id': 1})
         self.check_view_redirect(url, '/login?next={0}'.format(url))
 
+    def test_not_staff(self):
+        """Non-staff users should get 403 and nothing should be resent"""
+        self.client.force_login(self.teacher_user)
+        response = self.client.get(reverse('resend permission slip', kwargs={'slip_id': 1}))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(models.PermissionSlipLink.objects.filter(
+            permission_slip__id=1, last_sent__isnull=False).exists())
+
+    def test_resend_records_request(self):
+        """A resend should be accepted and stamp every link of the slip, but
+        leave last_sent to the delivery"""
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('resend permission slip', kwargs={'slip_id': 1}))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(models.PermissionSlipLink.objects.filter(
+            permission_slip__id=1, resend_requested_at__isnull=True).exists())
+        self.assertFalse(models.PermissionSlipLink.objects.filter(
+            permission_slip__id=1, last_sent__isnull=False).exists())
+
+    def test_repeated_resend_refused(self):
+        """A second resend within the cool-down should get 429"""
+        self.client.force_login(self.admin_user)
+        url = reverse('resend permission slip', kwargs={'slip_id': 1})
+        self.assertEqual(self.client.get(url).status_code, 204)
+        with self.settings(RESEND_COOLDOWN_MINUTES=15):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '900')
+
+    def test_resend_allowed_after_cooldown(self):
+        """Once the cool-down has passed the slip may be resent again"""
+        self.client.force_login(self.admin_user)
+        url = reverse('resend permission slip', kwargs={'slip_id': 1})
+        self.assertEqual(self.client.get(url).status_code, 204)
+        models.PermissionSlipLink.objects.filter(permission_slip__id=1).update(
+            resend_requested_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.client.get(url).status_code, 204)
+
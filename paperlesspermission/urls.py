@@ -36,6 +36,7 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('import/', views.djo_import_all, name='import all'),
+    path('metrics/', views.metrics, name='metrics'),
     path('admin/doc/', include('django.contrib.admindocs.urls')),
     path('admin/', admin.site.urls),
     path('login/', auth_views.LoginView.as_view(
@@ -45,8 +46,13 @@ urlpatterns = [
     path('trip/', views.trip_list, name='trip list'),
     path('archive/', views.trip_list, {'show_hidden': True}, name='trip archive'),
     path('trip/new/', views.new_trip, name='new field trip'),
+    path('trip/search/', views.picker_search, name='picker search'),
     path('trip/<int:trip_id>/', views.trip_detail, name='trip detail'),
     path('trip/<int:trip_id>/status/', views.trip_status, name='trip status'),
+    path('trip/<int:trip_id>/status/data/', views.trip_status_data, name='trip status data'),
+    path('trip/<int:trip_id>/status/export/', views.trip_status_export, name='trip status export'),
+    path('trip/<int:trip_id>/slips/reset/', views.trip_slips_reset, name='reset trip slips'),
+    path('trip/<int:trip_id>/slips/resend/', views.trip_slips_resend, name='resend trip slips'),
     path('trip/<int:trip_id>/approve/', views.approve_trip, name='approve trip'),
     path('trip/<int:trip_id>/archive/', views.archive_trip, name='archive trip'),
     path('trip/<int:trip_id>/release/', views.release_trip, name='release trip emails'),
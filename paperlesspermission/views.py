@@ -15,23 +15,36 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import csv
+import itertools
 import logging
 import datetime
+from hashlib import sha256
 
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse, HttpResponseServerError, HttpResponseBadRequest
+from django.http import Http404, HttpResponse, HttpResponseServerError, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.template import loader
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.csrf import csrf_protect
+from django.views.decorators.http import require_POST
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.forms.models import model_to_dict
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.formats import date_format
+from django.utils.html import escape
 from django.db import transaction, DatabaseError
+from django.db.models import Max, Q
+from django_select2.views import AutoResponseView
 
+from . import authz, metrics as app_metrics, profiling, slipcache
+from .exports import slip_status_rows
 from .forms import PermissionSlipFormStudent, PermissionSlipFormParent, TripDetailForm
 from .models import PermissionSlipLink, PermissionSlip, FieldTrip
-from .tasks import async_djo_import_enrollment_data, async_generate_permission_slips, async_initial_trip_notifications, async_resend_permission_slip
+from .tasks import async_djo_import_enrollment_data, async_generate_permission_slips, async_initial_trip_notifications, async_resend_permission_slip, async_resend_permission_slips
 
 LOGGER = logging.getLogger(__name__)
 
@@ -48,16 +61,38 @@ def djo_import_all(request):
     if not request.user.is_staff:
         raise PermissionDenied
 
-    async_djo_import_enrollment_data.delay()
+    async_djo_import_enrollment_data.apply_async(
+        **profiling.task_options(request))
     return HttpResponse(status=204)
 
 
+def metrics(request):
+    """Prometheus metrics of the web workers, for staff or scrapers holding
+    the `METRICS_TOKEN`."""
+    if not app_metrics.enabled():
+        raise Http404
+    if not (request.user.is_staff or app_metrics.token_matches(request)):
+        raise PermissionDenied
+    return HttpResponse(app_metrics.render(), content_type=app_metrics.CONTENT_TYPE)
+
+
 @csrf_protect
 def slip(request, slip_id):
     """View or process permission slips."""
     # pylint: disable=too-many-branches
 
-    slip_link = get_object_or_404(PermissionSlipLink, link_id=slip_id)
+    if request.method == 'GET':
+        page = slipcache.get_page(slip_id)
+        if page is not None:
+            return _render_slip(request, page, None)
+        tokens = slipcache.page_tokens(slip_id)
+
+    # Everything the page shows is loaded with the link in a single query.
+    slip_link = get_object_or_404(
+        PermissionSlipLink.objects.select_related(
+            'guardian', 'student', 'permission_slip__field_trip',
+            'permission_slip__student', 'permission_slip__guardian'),
+        link_id=slip_id)
     permission_slip = slip_link.permission_slip
     field_trip = permission_slip.field_trip
 
@@ -93,10 +128,7 @@ def slip(request, slip_id):
             LOGGER.error('Invalid submission attempted for slip_id=%s', slip_id)
             return HttpResponseBadRequest()
     else:
-        if submission_type == 'Parent':
-            form = PermissionSlipFormParent()
-        elif submission_type == 'Student':
-            form = PermissionSlipFormStudent()
+        form = None
 
     if (permission_slip.guardian_signature and permission_slip.student_signature):
         complete = max(permission_slip.guardian_signature_date,
@@ -107,9 +139,8 @@ def slip(request, slip_id):
     guardian_name = permission_slip.guardian.get_full_name() \
         if permission_slip.guardian else None
 
-    context = {
-        'hide_login': True,
-        'form': form,
+    page = {
+        'updated_at': max(permission_slip.updated_at, field_trip.updated_at),
         'trip_title': field_trip.name,
         'due_date': field_trip.due_date,
         'student_name': permission_slip.student.get_full_name(),
@@ -127,7 +158,57 @@ def slip(request, slip_id):
         'guardian_name': guardian_name,
         'complete': complete,
     }
-    return render(request, 'paperlesspermission/slip.html', context)
+    if request.method == 'GET':
+        slipcache.set_page(slip_id, permission_slip.id, field_trip.id, page,
+                           tokens)
+    return _render_slip(request, page, form)
+
+
+def _render_slip(request, page, form):
+    """Renders a slip page from its (possibly cached) data. `form` is the
+    submitted form after a signature; otherwise a blank form is made."""
+    def render_page():
+        blank_form = form
+        if blank_form is None:
+            if page['submission_type'] == 'Parent':
+                blank_form = PermissionSlipFormParent()
+            else:
+                blank_form = PermissionSlipFormStudent()
+        context = dict(page, hide_login=True, form=blank_form)
+        return render(request, 'paperlesspermission/slip.html', context)
+
+    if request.method not in ('GET', 'HEAD'):
+        return render_page()
+    return _conditional_response(
+        request, page['updated_at'], render_page, request.path)
+
+
+def _conditional_response(request, last_modified, render_page, *etag_parts):
+    """Answers a GET for a page with `304 Not Modified` if the client's copy
+    is current, and calls `render_page` to build the page otherwise.
+
+    The ETag is derived from `last_modified`, `etag_parts` and the client's
+    CSRF cookie, since pages embed a token made from it.
+
+    Parameters:
+        request (HttpRequest): The GET or HEAD request
+        last_modified (datetime): When the data shown on the page last changed
+        render_page (callable): Returns the full response
+        etag_parts: Anything else the page depends on
+    """
+    etag = quote_etag(sha256(repr((
+        last_modified.isoformat(),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+    ) + etag_parts).encode()).hexdigest())
+    timestamp = int(last_modified.timestamp())
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = render_page()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(timestamp)
+    return response
 
 @login_required
 def trip_list(request, show_hidden=False, message=None):
@@ -140,10 +221,9 @@ def trip_list(request, show_hidden=False, message=None):
         if show_hidden:
             raise PermissionDenied
         # Only show users Field Trips they are a coordinator for
-        trips = FieldTrip.objects.filter(
-            hidden=False,
-            faculty__email=request.user.email
-        )
+        trips = authz.for_request(request).moderated_trips(
+            FieldTrip.objects.filter(hidden=False))
+    trips = trips.with_slip_stats()
     context = {
         'trips': trips,
         'message': message,
@@ -166,9 +246,8 @@ def trip_detail(request, trip_id, existing=True):
     # TODO: Write test for this abomination of an if statement
     # NOTE: The existing and not ... statement skips the check if this is called
     #       from /trip/new. We would have just created the trip so we cannot use
-    #       the faculty_is_moderator() method yet.
-    if (not request.user.is_staff
-            and (existing and not trip.faculty_is_moderator(request.user.email))):
+    #       the moderated trip ids yet.
+    if existing and not authz.for_request(request).can_moderate(trip.id):
         raise PermissionDenied
 
     # This point forward, we only have requests with valid or new trip_ids that
@@ -196,7 +275,8 @@ def trip_detail(request, trip_id, existing=True):
         #if not existing:
         #    trip = FieldTrip()
         form.update_trip(trip)
-        async_generate_permission_slips.delay(trip.id, notify=False)
+        async_generate_permission_slips.apply_async(
+            (trip.id,), {'notify': False}, **profiling.task_options(request))
         return redirect('/trip')
 
     context = {
@@ -236,7 +316,8 @@ def release_trip(request, trip_id):
         LOGGER.error('ERROR Releasing Trip id=%s: %s', trip.id, err)
         return trip_list(request, message="Cannot release this trip.")
     else:
-        async_initial_trip_notifications(trip.id)
+        async_initial_trip_notifications.apply_async(
+            (trip.id,), **profiling.task_options(request))
         return trip_list(request,
                          message="Trip notifications successfully released.")
 
@@ -257,25 +338,153 @@ def archive_trip(request, trip_id):
 @login_required
 def trip_status(request, trip_id):
     """Show list of invited students and the status of their permission slip."""
+    trip = get_object_or_404(
+        FieldTrip.objects.with_slip_stats().annotate(
+            slips_updated_at=Max('permissionslip__updated_at')),
+        id=trip_id)
+
+    if not authz.for_request(request).can_moderate(trip.id):
+        raise PermissionDenied
+
+    def render_page():
+        # The slips themselves are loaded page by page from trip_status_data.
+        context = {
+            'trip': trip,
+        }
+        return render(request, 'paperlesspermission/trip_status.html', context)
+
+    # The slip counts change with any slip, and the overdue count with the day.
+    last_modified = max(filter(None, (trip.updated_at, trip.slips_updated_at)))
+    return _conditional_response(
+        request, last_modified, render_page, trip.id, trip.slips_total,
+        str(timezone.localdate()), request.user.id)
+
+# Database fields to sort by for each column of the trip status table, in
+# column order. None marks columns that cannot be sorted.
+STATUS_TABLE_ORDERING = [
+    ('student__first_name', 'student__last_name'),
+    ('student_signature',),
+    ('student_signature_date',),
+    ('guardian__first_name', 'guardian__last_name'),
+    ('guardian_signature',),
+    ('guardian_signature_date',),
+    ('due_date',),
+    None,
+]
+STATUS_TABLE_SEARCH_FIELDS = [
+    'student__first_name', 'student__last_name', 'guardian__first_name',
+    'guardian__last_name', 'student_signature', 'guardian_signature',
+]
+STATUS_TABLE_MAX_LENGTH = 100
+
+@login_required
+def trip_status_data(request, trip_id):
+    """Return one page of the trip status table as DataTables JSON.
+
+    Implements DataTables server-side processing: paging, sorting and
+    searching are all done in the database, so the cost of a request does
+    not depend on the size of the trip. Return 400 for malformed parameters.
+    """
     trip = get_object_or_404(FieldTrip, id=trip_id)
 
-    if ((not request.user.is_staff)
-            and (not trip.faculty_is_moderator(request.user.email))):
+    if not authz.for_request(request).can_moderate(trip.id):
         raise PermissionDenied
 
-    slips = PermissionSlip.objects.filter(field_trip__id=trip.id)
+    try:
+        draw = int(request.GET.get('draw', 0))
+        start = max(int(request.GET.get('start', 0)), 0)
+        length = int(request.GET.get('length', 10))
+        order_column = int(request.GET.get('order[0][column]', 0))
+        order_dir = request.GET.get('order[0][dir]', 'asc')
+        ordering = STATUS_TABLE_ORDERING[order_column]
+    except (ValueError, IndexError):
+        return HttpResponseBadRequest()
+    if length < 0 or length > STATUS_TABLE_MAX_LENGTH:
+        length = STATUS_TABLE_MAX_LENGTH
+    if ordering is None or order_dir not in ('asc', 'desc'):
+        ordering = STATUS_TABLE_ORDERING[0]
+        order_dir = 'asc'
+
+    slips = PermissionSlip.objects.filter(field_trip=trip)
+    records_total = slips.count()
+
+    # Every word searched for must appear in at least one of the columns.
+    search = request.GET.get('search[value]', '').split()
+    for term in search:
+        term_filter = Q()
+        for field in STATUS_TABLE_SEARCH_FIELDS:
+            term_filter |= Q(**{field + '__icontains': term})
+        slips = slips.filter(term_filter)
+    records_filtered = slips.count() if search else records_total
+
+    prefix = '-' if order_dir == 'desc' else ''
+    slips = slips.select_related('student', 'guardian').order_by(
+        *[prefix + field for field in ordering], 'id')[start:start + length]
+
+    return JsonResponse({
+        'draw': draw,
+        'recordsTotal': records_total,
+        'recordsFiltered': records_filtered,
+        'data': [_status_table_row(slip) for slip in slips],
+    })
+
+class _Echo():
+    """File-like object that hands back what is written to it, so csv.writer
+    can format rows for a StreamingHttpResponse."""
+    def write(self, value):
+        return value
 
-    context = {
-        'trip': trip,
-        'slips': slips,
+@login_required
+def trip_status_export(request, trip_id):
+    """Stream the permission slip status of a trip as a CSV file.
+
+    Pass `incomplete=1` to only export slips that are still missing a
+    signature.
+    """
+    trip = get_object_or_404(FieldTrip, id=trip_id)
+
+    if not authz.for_request(request).can_moderate(trip.id):
+        raise PermissionDenied
+
+    incomplete_only = request.GET.get('incomplete') in ('1', 'true')
+    writer = csv.writer(_Echo())
+    rows = slip_status_rows(trip, incomplete_only=incomplete_only)
+    # The byte order mark makes Excel read the file as UTF-8.
+    content = itertools.chain(['\ufeff'], (writer.writerow(row) for row in rows))
+
+    response = StreamingHttpResponse(content, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="trip-{0}-{1}.csv"'.format(
+        trip.id, 'incomplete-slips' if incomplete_only else 'slips')
+    return response
+
+def _format_datetime(value):
+    if value is None:
+        return ''
+    return date_format(timezone.localtime(value), 'DATETIME_FORMAT')
+
+def _status_table_row(slip):
+    # DataTables inserts the cells as HTML, and the names and signatures are
+    # typed in by the public, so they are escaped like the template would.
+    return {
+        'id': slip.id,
+        'student': escape(slip.student.get_full_name()),
+        'student_signature': escape(slip.student_signature or ''),
+        'student_signature_date': _format_datetime(slip.student_signature_date),
+        'guardian': escape(slip.guardian.get_full_name() if slip.guardian else ''),
+        'guardian_signature': escape(slip.guardian_signature or ''),
+        'guardian_signature_date': _format_datetime(slip.guardian_signature_date),
+        'due_date': date_format(slip.due_date) if slip.due_date else '',
     }
-    return render(request, 'paperlesspermission/trip_status.html', context)
 
 @login_required
 @csrf_protect
 def new_trip(request):
     return trip_detail(request, None, existing=False)
 
+# Answers the searches of the TripDetailForm pickers. The django_select2 view
+# is not mapped directly, since it would let anyone look up students.
+picker_search = login_required(AutoResponseView.as_view())
+
 @login_required
 def slip_reset(request, slip_id):
     if not request.user.is_staff:
@@ -291,9 +500,83 @@ def slip_reset(request, slip_id):
 
 @login_required
 def slip_resend(request, slip_id):
-    """Resend slip emails and return 204. Return 403 if user is not admin staff."""
+    """Queue a resend of the slip emails and return 204. Return 403 if user is
+    not admin staff, or 429 if the slip was sent within RESEND_COOLDOWN_MINUTES."""
     if not request.user.is_staff:
         raise PermissionDenied
     permission_slip = get_object_or_404(PermissionSlip, id=slip_id)
-    async_resend_permission_slip(permission_slip.id)
+    cooldown = datetime.timedelta(
+        minutes=getattr(settings, 'RESEND_COOLDOWN_MINUTES', 15))
+    if not permission_slip.claim_resend(cooldown):
+        # Sent (or already being resent) too recently.
+        response = HttpResponse(status=429)
+        response['Retry-After'] = int(cooldown.total_seconds())
+        return response
+    async_resend_permission_slip.delay(permission_slip.id)
     return HttpResponse(status=204)
+
+# Filters the bulk slip actions accept instead of a list of slip ids.
+BULK_SLIP_FILTERS = {
+    'all': Q(),
+    'incomplete': ~Q(status=PermissionSlip.COMPLETE),
+}
+
+def _bulk_slips(request, trip_id):
+    """Returns the slips of a trip selected by a bulk action request, or None
+    if the request is malformed.
+
+    The POST data either lists slip ids as `slip` or names one of
+    BULK_SLIP_FILTERS as `filter`. Ids of other trips' slips are ignored."""
+    slips = PermissionSlip.objects.filter(field_trip_id=trip_id)
+    slip_filter = request.POST.get('filter')
+    if slip_filter is not None:
+        if slip_filter not in BULK_SLIP_FILTERS:
+            return None
+        return slips.filter(BULK_SLIP_FILTERS[slip_filter])
+    try:
+        slip_ids = [int(slip_id) for slip_id in request.POST.getlist('slip')]
+    except ValueError:
+        return None
+    if not slip_ids:
+        return None
+    return slips.filter(id__in=slip_ids)
+
+@login_required
+@require_POST
+def trip_slips_reset(request, trip_id):
+    """Reset many slips of a trip with a single UPDATE. Returns the number
+    reset as JSON, 403 if user is not admin staff or 400 on a bad selection."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+    trip = get_object_or_404(FieldTrip, id=trip_id)
+    slips = _bulk_slips(request, trip.id)
+    if slips is None:
+        return HttpResponseBadRequest()
+    try:
+        count = slips.reset()
+    except DatabaseError:
+        return HttpResponse(status=500)
+    LOGGER.info('%s reset %s slips of %s.', request.user, count, trip)
+    return JsonResponse({'reset': count})
+
+@login_required
+@require_POST
+def trip_slips_resend(request, trip_id):
+    """Queue one task resending many slips of a trip. Slips sent within
+    RESEND_COOLDOWN_MINUTES are skipped. Returns the numbers resent and skipped
+    as JSON, 403 if user is not admin staff or 400 on a bad selection."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+    trip = get_object_or_404(FieldTrip, id=trip_id)
+    slips = _bulk_slips(request, trip.id)
+    if slips is None:
+        return HttpResponseBadRequest()
+    cooldown = datetime.timedelta(
+        minutes=getattr(settings, 'RESEND_COOLDOWN_MINUTES', 15))
+    slip_ids = slips.claim_resend(cooldown)
+    if slip_ids:
+        async_resend_permission_slips.delay(slip_ids)
+    return JsonResponse({
+        'resent': len(slip_ids),
+        'skipped': slips.count() - len(slip_ids),
+    })
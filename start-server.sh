@@ -54,7 +54,12 @@ write_env_line DEBUG \
                DJANGO_HTTPS \
                DJANGO_DOMAIN \
                DJANGO_PORT \
-               DJANGO_ALLOWED_HOSTS
+               DJANGO_ALLOWED_HOSTS \
+               METRICS_ENABLED \
+               METRICS_TOKEN \
+               METRICS_WORKER_PORT \
+               PROFILING_ENABLED \
+               PROFILE_TASKS
 
 # If Django .env debug flag set, print the file we just wrote
 if [ -n "$DJANGO_DEBUG_ENV" ]
@@ -62,6 +67,15 @@ then
     cat paperlesspermission/.env
 fi
 
+# Every gunicorn or celery process writes its metrics here, so that they can
+# be added up (see paperlesspermission/metrics.py). Left over files of the
+# previous run would be counted again, so start empty.
+export prometheus_multiproc_dir=/tmp/paperlesspermission-metrics
+function reset_metrics_dir {
+    rm -rf "$prometheus_multiproc_dir"
+    mkdir -p "$prometheus_multiproc_dir"
+}
+
 # Start Server
 function start_server {
     # If asked, migrate database
@@ -71,16 +85,24 @@ function start_server {
     fi
     # Find static files
     python manage.py collectstatic --noinput
-    (gunicorn paperlesspermission.wsgi --bind 0.0.0.0:8010 --workers 3) &
+    reset_metrics_dir
+    (gunicorn paperlesspermission.wsgi -c gunicorn.conf.py --bind 0.0.0.0:8010 --workers 3) &
     nginx -g "daemon off;"
 }
 
 function start_celery_worker {
     # The -E tells the workers to send events. Call `celery worker --help` for
     # more information.
+    reset_metrics_dir
     celery -A paperlesspermission worker -E
 }
 
+function start_celery_beat {
+    # Schedules periodic tasks, such as the daily slip reminders. Only run one
+    # of these.
+    celery -A paperlesspermission beat
+}
+
 function generate_secret_key {
     python gen_secret_key.py
 }
@@ -95,6 +117,10 @@ case $MODE in
         start_celery_worker
         ;;
 
+    CELERY_BEAT)
+        start_celery_beat
+        ;;
+
     GENERATE_KEY)
         generate_secret_key
         ;;